@@ -0,0 +1,182 @@
+from util import *
+
+class BlockingAccumulator:
+    """
+    Accumulates the running mean and variance of a series of samples, along
+    with those of its block averages, for a blocking analysis (Flyvbjerg and
+    Petersen) of the standard error of the mean of correlated samples.
+    At each level, pairs of consecutive values of the previous level are
+    averaged into blocks of twice the size, so that once the blocks are longer
+    than the correlation time of the samples, they are independent and their
+    variance gives the true standard error.
+    Each sample is added in O(1) amortized time, with O(log n) storage.
+    """
+    # The minimal number of blocks at a level for its standard error to be
+    # used.
+    MIN_BLOCKS = 16
+
+    def __init__(self):
+        self.counts = []
+        self.means = []
+        self.squares = []
+        self.pending = []
+
+    def add(self, value):
+        """
+        Adds a sample to the series.
+        """
+        level = 0
+        while value is not None:
+            if level == len(self.counts):
+                self.counts.append(0)
+                self.means.append(0.0)
+                self.squares.append(0.0)
+                self.pending.append(None)
+
+            # Update the running mean and sum of squared deviations of the
+            # level (Welford's method).
+            self.counts[level] += 1
+            delta = value - self.means[level]
+            self.means[level] += delta / self.counts[level]
+            self.squares[level] += delta * (value - self.means[level])
+
+            # Pair the value with the pending one of the level into a block of
+            # the next level.
+            if self.pending[level] is None:
+                self.pending[level] = value
+                value = None
+            else:
+                value = (self.pending[level] + value) / 2.0
+                self.pending[level] = None
+            level += 1
+
+    def getCount(self):
+        """
+        Returns the number of samples.
+        """
+        if not self.counts:
+            return 0
+        return self.counts[0]
+
+    def getMean(self):
+        """
+        Returns the mean of the samples.
+        """
+        if not self.counts:
+            return 0.0
+        return self.means[0]
+
+    def getVariance(self):
+        """
+        Returns the variance of the samples.
+        """
+        if self.getCount() < 2:
+            return 0.0
+        return self.squares[0] / (self.counts[0] - 1)
+
+    def getStandardError(self):
+        """
+        Returns the standard error of the mean of the samples, as the largest
+        standard error of the blocking levels that have enough blocks (which is
+        where the standard errors reach their plateau when the blocks are long
+        enough, and a conservative estimate otherwise).
+        """
+        standard_error = 0.0
+        for level in xrange(len(self.counts)):
+            if self.counts[level] < self.MIN_BLOCKS:
+                break
+            standard_error = max(standard_error, sqrt(
+                    self.squares[level] /
+                    (self.counts[level] * (self.counts[level] - 1))))
+        return standard_error
+
+class EquilibrationDetector:
+    """
+    Detects when the system reached equilibrium at its temperature, from the
+    series of the potential energy and the spin orientation variance (the
+    order parameter) after each sweep.
+    The samples are accumulated in consecutive windows of WINDOW sweeps, and
+    the system is equilibrated once the means of both series in the last
+    window are the same as in the window before it, within TOLERANCE standard
+    errors (estimated by a blocking analysis of each window), that is once the
+    series are statistically stationary.
+    The detection is disabled if the window is 0. Otherwise the window must
+    have at least BlockingAccumulator.MIN_BLOCKS sweeps, or there would be no
+    standard error to compare the means with.
+    """
+
+    def __init__(self, parameters, parameter_prefix="MC_"):
+        """
+        Reads the window size and tolerance of the detection.
+        """
+        self.window = int(
+                parameters.get(parameter_prefix + "EQUILIBRATION_WINDOW", 0))
+        self.tolerance = float(
+                parameters.get(parameter_prefix + "EQUILIBRATION_TOLERANCE",
+                               2.0))
+        if 0 < self.window < BlockingAccumulator.MIN_BLOCKS:
+            raise Exception(("The equilibration window (%s) must be 0 or at " +
+                             "least %s sweeps") % (
+                    self.window, BlockingAccumulator.MIN_BLOCKS))
+        self.enabled = False
+        self.stationary = False
+        self.previous = None
+        self.current = None
+
+    def start(self):
+        """
+        Starts detecting the equilibration at a new temperature, discarding all
+        of the previous samples.
+        """
+        self.enabled = (self.window > 0)
+        self.stationary = False
+        self.previous = None
+        self.current = [BlockingAccumulator(), BlockingAccumulator()]
+
+    def isEnabled(self):
+        """
+        Returns true if the detection was started and the system did not reach
+        equilibrium yet.
+        """
+        return self.enabled and not self.stationary
+
+    def isStationary(self):
+        """
+        Returns true if the system reached equilibrium at the temperature.
+        """
+        return self.stationary
+
+    def getEstimates(self):
+        """
+        Returns the estimates of the last complete window, as a tuple of (mean
+        energy, its standard error, mean spin orientation variance, its
+        standard error), or None if there is no complete window yet.
+        """
+        if self.previous is None:
+            return None
+        return (self.previous[0].getMean(),
+                self.previous[0].getStandardError(),
+                self.previous[1].getMean(),
+                self.previous[1].getStandardError())
+
+    def addSample(self, energy, spin_orientation_variance):
+        """
+        Adds the potential energy and the spin orientation variance of the
+        system after a sweep, checking for stationarity at the end of each
+        window.
+        """
+        self.current[0].add(energy)
+        self.current[1].add(spin_orientation_variance)
+        if self.current[0].getCount() < self.window:
+            return
+
+        if self.previous is not None:
+            self.stationary = True
+            for (previous, current) in zip(self.previous, self.current):
+                difference = abs(current.getMean() - previous.getMean())
+                error = sqrt(previous.getStandardError() ** 2 +
+                             current.getStandardError() ** 2)
+                if difference > self.tolerance * error:
+                    self.stationary = False
+        self.previous = self.current
+        self.current = [BlockingAccumulator(), BlockingAccumulator()]
@@ -1,8 +1,15 @@
 import os
 import sys
 
+from instrumentation import instruments
 from lc import LiquidCrystalSystem
+from lc_output_writer import LiquidCrystalSystemOutputWriter
+from lc_run_manifest import LiquidCrystalRunManifest
+from equilibration_detector import EquilibrationDetector
+from lc_trajectory import LiquidCrystalSystemTrajectory
 from new_state_selector import MonteCarloNewStateSelector
+from observables_accumulator import ObservablesAccumulator
+from trial_move_generator import TrialMoveGenerator
 from util import *
 
 class MonteCarloAlgorithm:
@@ -14,6 +21,16 @@ class MonteCarloAlgorithm:
         self.new_state_selector = new_state_selector
         self.parameters = parameters
         self.parameter_prefix = parameter_prefix
+        self.trial_moves = TrialMoveGenerator(parameters, parameter_prefix)
+        self.equilibration = EquilibrationDetector(parameters,
+                                                   parameter_prefix)
+        self.observables = ObservablesAccumulator()
+
+        # The pairs of each sublattice of the sublattice sweep mode, for the
+        # neighbour pairs they were gathered from (see _getSublatticePairs).
+        self.sublattice_pairs_cells = None
+        self.sublattice_pairs_offsets = None
+        self.sublattice_pairs = {}
 
     def isNewStateBetter(self, current_lcs, new_lcs):
         """
@@ -26,7 +43,7 @@ class MonteCarloAlgorithm:
         """
         Returns the liquid crystal system used by the algorithm.
         NOTE: The system may be changed during the course of the algorithm
-              running since it duplicates states to determine which is better.
+              running, since a previous state may be loaded instead of it.
         """
         return self.lcs
     
@@ -47,42 +64,86 @@ class MonteCarloAlgorithm:
             self.parameters[self.parameter_prefix + "MAX_STEPS"])
         MC_MAX_NON_IMPROVING_STEPS = int(
             self.parameters[self.parameter_prefix + "MAX_NON_IMPROVING_STEPS"])
+        MC_ADAPTIVE_SWEEPS = int(
+            self.parameters.get(self.parameter_prefix + "ADAPTIVE_SWEEPS", 0))
+        MC_DEBUG_ENERGY_CHECKS = bool(
+            self.parameters.get("MC_DEBUG_ENERGY_CHECKS", False))
+
+        # The states are appended to a single trajectory file, from which Aviz
+        # XYZ files can be exported.
+        trajectory = LiquidCrystalSystemTrajectory(
+                "%strajectory.dat" % (AVIZ_OUTPUT_PATH))
+
+        # The states, frames and information lines are written in the
+        # background, from snapshots of the system.
+        writer = LiquidCrystalSystemOutputWriter(self.parameters)
+
+        # The completed rounds are recorded in the manifest of the run.
+        manifest = LiquidCrystalRunManifest(self.parameters)
+        round_temperatures = MC_TEMPERATURES + [MC_TEMPERATURES[-1]]
 
         print ("Running the Monte Carlo algorithm on the system (T*=%s):" %
                self.lcs.getTemperature())
+        instruments.setValue("phase", self.parameter_prefix)
         print
         round_number = 0
         aviz_file_number = 0
 
-        # Check if there is already a previous LCS state stored.
-        previous_lcs = self.lcs_manager.loadState(
-                "%s%08d" % (STATE_PREFIX, aviz_file_number))
-        if previous_lcs:
-            self.lcs = previous_lcs
+        # Older runs have no manifest, so when they are resumed the state of
+        # each round is looked for instead.
+        probe_previous_states = not manifest.hasPhase(self.parameter_prefix)
+        manifest.startPhase(self.parameter_prefix)
+
+        # Continue from the state of the last completed round, loading only
+        # that state, if there is one.
+        rounds = manifest.getRounds(self.parameter_prefix)
+        if rounds:
+            last_round = rounds[-1]
+            round_number = last_round["round"]
+            aviz_file_number = last_round["state_number"]
+            self.lcs = self.lcs_manager.loadState(str(last_round["state"]))
+            self._loadProposalWidths(str(last_round["state"]))
+            print "Loaded previous state of round %s (T*=%s): '%s'" % (
+                    round_number, last_round["temperature"],
+                    last_round["state"])
+            self.lcs.setTemperature(round_temperatures[round_number - 1])
         else:
-            self.lcs.outputToAvizFile(
-                    "%s%08d.xyz" % (AVIZ_OUTPUT_PATH,
-                                    aviz_file_number))
-            self.lcs.outputInformationToFile(
-                    "%sinfo.txt" % (AVIZ_OUTPUT_PATH))
-            self.lcs_manager.saveState(
-                    "%s%08d" % (STATE_PREFIX, aviz_file_number),
-                    self.lcs)
+            # Check if there is already a previous LCS state stored.
+            previous_lcs = self.lcs_manager.loadState(
+                    "%s%08d" % (STATE_PREFIX, aviz_file_number))
+            if previous_lcs:
+                self.lcs = previous_lcs
+            else:
+                snapshot = self.lcs.getSnapshot()
+                writer.write(trajectory.appendFrame, aviz_file_number,
+                             snapshot)
+                writer.write(snapshot.outputInformationToFile,
+                             "%sinfo.txt" % (AVIZ_OUTPUT_PATH))
+                writer.write(self.lcs_manager.saveState,
+                             "%s%08d" % (STATE_PREFIX, aviz_file_number),
+                             snapshot,
+                             spin_stdev=self.trial_moves.spin_stdev,
+                             spacing_stdev=self.trial_moves.spacing_stdev)
         self.lcs.print2DSystem()
         
-        # Go over all of the temperatures and run the algorithm for each one.
-        for temperature in MC_TEMPERATURES + [MC_TEMPERATURES[-1]]:
+        # Go over all of the temperatures (after the completed rounds) and run
+        # the algorithm for each one.
+        for temperature in round_temperatures[round_number:]:
             round_number += 1
             print ("--------------------(T* = %s)--------------------" %
                    self.lcs.getTemperature())
 
             # Check if there is already a previous LCS state stored.
-            previous_lcs = self.lcs_manager.loadState(
-                    "%s%08d" % (STATE_PREFIX, aviz_file_number+1))
+            previous_lcs = None
+            if probe_previous_states:
+                previous_lcs = self.lcs_manager.loadState(
+                        "%s%08d" % (STATE_PREFIX, aviz_file_number+1))
             if previous_lcs:
                 print "Loaded previous state for temperature %s: '%s%08d'" % (
                         temperature, STATE_PREFIX, aviz_file_number)
                 self.lcs = previous_lcs
+                self._loadProposalWidths(
+                        "%s%08d" % (STATE_PREFIX, aviz_file_number+1))
                 self.lcs.print2DSystem()
                 aviz_file_number += 1
 
@@ -93,43 +154,90 @@ class MonteCarloAlgorithm:
                 self.lcs.setTemperature(temperature)
                 continue
     
+            # Adapt the proposal widths to the temperature in its first
+            # ADAPTIVE_SWEEPS sweeps.
+            self.trial_moves.startAdapting(MC_ADAPTIVE_SWEEPS)
+            self.equilibration.start()
+            self.observables.start(self.lcs)
+            instruments.setValue("temperature", self.lcs.getTemperature())
+            instruments.markInterval("temperature")
+
             # Continue running Metropolis steps until we reach a point where in
-            # MAX_NON_IMPROVING_STEPS steps there was no energy improvement.
+            # MAX_NON_IMPROVING_STEPS steps there was no energy improvement, or
+            # the system reached equilibrium at the temperature.
             i = 0
             k = 0
             while k < MC_MAX_NON_IMPROVING_STEPS and i < MC_MAX_STEPS:
-                current_lcs = self.lcs.copy()
+                # Instead of copying the system, keep a summary of the current
+                # state for the state selector and a journal of the changed
+                # cells to roll back to it.
+                current_lcs = self.lcs.getSummary()
+                self.lcs.startJournal()
 
                 print "Performing Metropolis step... "
-                originalE = self.lcs.getPotentialEnergy()
-                originalEcurrent = current_lcs.getPotentialEnergy()
-                assert originalE == originalEcurrent
-                self._performMetropolisStep()
-                originalEafter = current_lcs.getPotentialEnergy()
-                assert originalE == originalEafter
+                E = self._performMetropolisStep()
 
                 if self.isNewStateBetter(current_lcs, self.lcs):
+                    self.lcs.stopJournal()
                     print "--> GOT BETTER STATE!"
                     print
                     self.lcs.print2DSystem()
 
+                    # Write the new state from a snapshot of the system, with
+                    # the potential energy the step recalculated at its end.
                     k = 0
                     aviz_file_number += 1
-                    self.lcs.outputToAvizFile(
-                            "%s%08d.xyz" % (AVIZ_OUTPUT_PATH,
-                                            aviz_file_number))
-                    self.lcs.outputInformationToFile(
-                            "%sinfo.txt" % (AVIZ_OUTPUT_PATH))
-                    self.lcs_manager.saveState(
-                            "%s%08d" % (STATE_PREFIX, aviz_file_number),
-                            self.lcs)
+                    instruments.startTimer("output")
+                    snapshot = self.lcs.getSnapshot(E)
+                    writer.write(trajectory.appendFrame, aviz_file_number,
+                                 snapshot)
+                    writer.write(snapshot.outputInformationToFile,
+                                 "%sinfo.txt" % (AVIZ_OUTPUT_PATH))
+                    writer.write(self.lcs_manager.saveState,
+                                 "%s%08d" % (STATE_PREFIX, aviz_file_number),
+                                 snapshot,
+                                 round_number=round_number,
+                                 step_number=i+1,
+                                 spin_stdev=self.trial_moves.spin_stdev,
+                                 spacing_stdev=self.trial_moves.spacing_stdev)
+                    instruments.stopTimer("output")
                 else:
                     print "--> Didn't get better state (k=%s)" % (k+1)
                     print
                     k += 1
-                    self.lcs = current_lcs
+                    self.lcs.rollbackJournal()
+
+                    # Make sure the rollback restored the original state (up to
+                    # the roundoff of summing over a rebuilt neighbour list).
+                    if MC_DEBUG_ENERGY_CHECKS:
+                        originalE = current_lcs.getPotentialEnergy()
+                        restoredE = self.lcs.getPotentialEnergy()
+                        assert abs(restoredE - originalE) <= \
+                               1e-9 * max(abs(originalE), abs(restoredE))
 
                 i += 1
+
+                if self.equilibration.isStationary():
+                    print ("--> Equilibrated: E = %s +- %s, " +
+                           "spin orientation variance = %s +- %s") % (
+                            self.equilibration.getEstimates())
+                    print
+                    break
+
+            # Add the observables of the temperature to its table, and record
+            # the throughput of the temperature.
+            self.observables.outputToTable(
+                    "%sobservables.txt" % (AVIZ_OUTPUT_PATH))
+            instruments.emitInterval(
+                    "temperature", steps=i,
+                    equilibrated=self.equilibration.isStationary())
+
+            # Record the completed round, with the state the system is in (once
+            # the state itself was written).
+            writer.write(manifest.addRound, self.parameter_prefix,
+                         round_number, self.lcs.getTemperature(),
+                         "%s%08d" % (STATE_PREFIX, aviz_file_number),
+                         aviz_file_number, self.lcs.getPotentialEnergy())
             
             # Next step with the next temperature.
             print ("Changing Temperature ... (T*=%s -> %s)" %
@@ -137,46 +245,21 @@ class MonteCarloAlgorithm:
             print
             self.lcs.setTemperature(temperature)
 
+        # Complete all of the writes of the phase.
+        writer.close()
         print "End of Simulation."
 
-    def _getNewRandomSpin(self, current_spin):
+    def _loadProposalWidths(self, state_name):
         """
-        Returns a new random spin based on the current one, from a gaussian
-        distribution.
+        Continues with the proposal widths that were saved in the state with
+        the given name, if there are any.
         """
-        MC_SPIN_STDEV = float(
-            self.parameters[self.parameter_prefix + "SPIN_STDEV"])
+        header = self.lcs_manager.loadStateHeader(state_name)
+        if header is None or header["spin_stdev"] is None:
+            return
 
-        new_spin = current_spin.copy()
-        for d in range(len(new_spin)):
-            new_spin[d] = random.gauss(new_spin[d], MC_SPIN_STDEV)
-        new_spin /= linalg.norm(new_spin)
-        return new_spin
-
-    def _getNewRandomLocation(self, current_location, original_location):
-        """
-        Returns a new random location based on the current one, from a gaussian
-        distribution.
-        """
-        MC_SPACING_STDEV = float(
-            self.parameters[self.parameter_prefix + "SPACING_STDEV"])
-        MC_SPACING_FROM_ORIGINAL_LOCATION_CUTOFF = float(
-            self.parameters[self.parameter_prefix +
-                            "SPACING_FROM_ORIGINAL_LOCATION_CUTOFF"])
-
-        # Generate a random new location.
-        new_location = current_location.copy()
-        distance2 = 0.0
-        for d in range(len(new_location)):
-            new_location[d] = random.gauss(new_location[d], MC_SPACING_STDEV)
-            distance2 += (new_location[d] - original_location[d]) ** 2
-
-        # If it is out of the cutoff sphere of the original location, keep the
-        # old location.
-        if distance2 > (MC_SPACING_FROM_ORIGINAL_LOCATION_CUTOFF ** 2):
-            return current_location
-
-        return new_location
+        self.trial_moves.spin_stdev = header["spin_stdev"]
+        self.trial_moves.spacing_stdev = header["spacing_stdev"]
 
     def _performMetropolisStep(self):
         """
@@ -189,14 +272,44 @@ class MonteCarloAlgorithm:
         4) If not, pick it with a probability of P(NewE)/P(OldE), where P is the
            canonical probability distribution function.
         5) Continue performing these improvements MC_NUM_METROPOLIS_STEPS times.
+        Returns the potential energy of the system after the step, which is
+        recalculated: the energy that is kept track of from the energy
+        differences of the accepted moves (where the energy difference of a
+        cell counts each of its pairs as half, so twice it is the change in the
+        potential energy of the system) loses its precision when the energy
+        drops by orders of magnitude, such as from the overlapping spins of a
+        random start. With MC_DEBUG_ENERGY_CHECKS, it is checked against the
+        recalculated energy, relative to the energy at the start of the step.
         """
         MC_METROPOLIS_NUM_STEPS = int(
             self.parameters[self.parameter_prefix + "METROPOLIS_NUM_STEPS"])
+        MC_SWEEP_MODE = str(
+            self.parameters.get(self.parameter_prefix + "SWEEP_MODE",
+                                "sequential"))
+        MC_COLLECTIVE_MOVES_PER_STEP = int(
+            self.parameters.get(self.parameter_prefix +
+                                "COLLECTIVE_MOVES_PER_STEP", 0))
+        MC_DEBUG_ENERGY_CHECKS = bool(
+            self.parameters.get("MC_DEBUG_ENERGY_CHECKS", False))
+
+        instruments.startTimer("metropolis_step")
 
         # Calculate the current system energy.
         E = self.lcs.getPotentialEnergy()
+        startE = E
         print "E = %s" % E
 
+        # In the sublattice sweep mode, split the system into sublattices of
+        # cells that are not neighbours of each other.
+        if MC_SWEEP_MODE == "sublattice":
+            NEAREST_NEIGHBOURS_MAX_INDEX_RANGE = int(
+                self.parameters["NEAREST_NEIGHBOURS_MAX_INDEX_RANGE"])
+            sublattices = self.lcs.getSublattices(
+                    [NEAREST_NEIGHBOURS_MAX_INDEX_RANGE
+                     for dim in self.lcs.dimensions])
+        elif MC_SWEEP_MODE != "sequential":
+            raise Exception("Unsupported sweep mode: %s" % MC_SWEEP_MODE)
+
         # Create the progress bar.
         num_steps = MC_METROPOLIS_NUM_STEPS
         widgets = ['Running Metropolis (%s steps): ' % (num_steps,),
@@ -211,30 +324,61 @@ class MonteCarloAlgorithm:
         num_calcs = 0
         num_energy_higher_calcs = 0
         num_energy_higher_selected_calcs = 0
+        num_collective_moves = 0
+        num_accepted_collective_moves = 0
         for step in xrange(MC_METROPOLIS_NUM_STEPS):
+            # Perform the collective moves of whole domains first.
+            for move in xrange(MC_COLLECTIVE_MOVES_PER_STEP):
+                energy_difference, accepted = self._performCollectiveMove()
+                if accepted:
+                    E += energy_difference
+                    num_accepted_collective_moves += 1
+                num_collective_moves += 1
+
             # Perform METROPOLIS_NUM_STEPS steps and each time select a new
             # spin orientation from a distribution that should become more and
             # more as the Boltzmann energy distribution.
+            if MC_SWEEP_MODE == "sublattice":
+                energy_differences, alphas, accepted = \
+                        self._performSublatticeSweep(sublattices)
+                E += 2.0 * energy_differences[accepted].sum()
+
+                higher = (energy_differences >= 0.0)
+                num_energy_higher_calcs += higher.sum()
+                average_alpha_higher_energy += alphas[higher].sum()
+                num_energy_higher_selected_calcs += (higher & accepted).sum()
+                average_alpha += alphas.sum()
+                num_calcs += len(alphas)
+
+                self.trial_moves.adapt(accepted.mean())
+                pbar.update(step+1)
+                if instruments.enabled:
+                    self._countSweep(len(accepted), int(accepted.sum()))
+                if self._sampleSweep():
+                    break
+                continue
+
+            # Draw the new spins and locations of all of the cells at once,
+            # where the index iterator goes over the cells in the order of
+            # their flat indices.
+            self.trial_moves.drawSweep(self.lcs)
+            new_spins = self.trial_moves.new_spins
+            new_locations = self.trial_moves.new_locations
+            uniforms = self.trial_moves.uniforms
+
+            num_accepted = 0
             index_iterator = self.lcs.getSystemIndexIterator()
             for (i, indices) in enumerate(index_iterator):
                 # Select a new spin and location based on the current.
-                current_spin = self.lcs.getSpin(indices)
-                current_location = self.lcs.getLocation(indices)
-                original_location = self.lcs.getOriginalLocation(indices)
-                new_spin = self._getNewRandomSpin(current_spin)
-                new_location = self._getNewRandomLocation(current_location,
-                                                          original_location)
+                new_spin = new_spins[i]
+                new_location = new_locations[i]
 
                 # Calculate the coefficient that is proportional to the density
-                # of the Boltzmann distibution.
-                current_spin_energy = self.lcs.getPotentialEnergyForSpin(indices)
-                oldE = E
-
-                self.lcs.setProperty(self.lcs.spins, indices, new_spin)
-                self.lcs.setProperty(self.lcs.locations, indices, new_location)
-                new_spin_energy = self.lcs.getPotentialEnergyForSpin(indices)
-                energy_difference = new_spin_energy - current_spin_energy
-                E += energy_difference
+                # of the Boltzmann distibution, from the change in the energy of
+                # the spin without changing the system.
+                energy_difference = \
+                        self.lcs.getPotentialEnergyDifferenceForSpin(
+                                indices, new_spin, new_location)
 
                 # Calculate the transition probability alpha.
                 alpha = 1.0
@@ -245,26 +389,233 @@ class MonteCarloAlgorithm:
                     num_energy_higher_calcs += 1
                     average_alpha_higher_energy += alpha
 
-                # Perform the transition with probability alpha, or go back to
-                # the original state with probability 1-alpha.
-                p = random.random()
-                if p > alpha:
-                    self.lcs.setSpin(indices, current_spin)
-                    self.lcs.setLocation(indices, current_location)
-                    E = oldE
-                else:
+                # Perform the transition with probability alpha, or keep the
+                # original state with probability 1-alpha.
+                if uniforms[i] <= alpha:
+                    self.lcs.setProperty(self.lcs.spins, indices, new_spin)
+                    self.lcs.setProperty(self.lcs.locations, indices,
+                                         new_location)
+                    E += 2.0 * energy_difference
                     num_energy_higher_selected_calcs += (energy_difference >= 0)
+                    num_accepted += 1
 
                 average_alpha += alpha
                 num_calcs += 1
-        
+
+            self.trial_moves.adapt(float(num_accepted) / self.lcs.num_cells)
             pbar.update(step+1)
+            if instruments.enabled:
+                self._countSweep(self.lcs.num_cells, num_accepted)
+            if self._sampleSweep():
+                break
 
         pbar.finish()
+
+        # Recalculate the energy, and make sure the energy that was kept track
+        # of is the same, up to the roundoff of adding up the differences (which
+        # is relative to the largest energy on the way, and at least a
+        # billionth of kB*T, far below what the acceptance can tell apart).
+        trackedE = E
+        E = self.lcs.getPotentialEnergy()
+        if MC_DEBUG_ENERGY_CHECKS:
+            assert abs(trackedE - E) <= \
+                   1e-9 * (max(abs(startE), abs(E)) +
+                           kB * self.lcs.getTemperature())
+
+        instruments.count("collective_moves_proposed", num_collective_moves)
+        instruments.count("collective_moves_accepted",
+                          num_accepted_collective_moves)
+        instruments.stopTimer("metropolis_step")
         print "New states with higher energy: %.2f%% (selected %.2f%%)" % (
                 float(num_energy_higher_calcs) * 100 / num_calcs,
                 float(num_energy_higher_selected_calcs) * 100 / num_calcs)
         print "Average ALPHA for states with higher energy: %s" % (
                 average_alpha_higher_energy / num_energy_higher_calcs)
         print "Average ALPHA for all states: %s" % (average_alpha / num_calcs)
+        print "Proposal widths: SPIN_STDEV=%s, SPACING_STDEV=%s" % (
+                self.trial_moves.spin_stdev, self.trial_moves.spacing_stdev)
+        if num_collective_moves > 0:
+            print "Accepted collective moves: %.2f%%" % (
+                    float(num_accepted_collective_moves) * 100 /
+                    num_collective_moves)
         print "Done."
+        return E
+
+    def _countSweep(self, num_proposed, num_accepted):
+        """
+        Counts a sweep with the given numbers of proposed and accepted moves,
+        and writes the periodic record of the instrumentation if it is due.
+        """
+        instruments.count("sweeps")
+        instruments.count("moves_proposed", num_proposed)
+        instruments.count("moves_accepted", num_accepted)
+        instruments.emitIfDue()
+
+    def _sampleSweep(self):
+        """
+        Adds the state of the system after a sweep, with its recalculated
+        potential energy, to the observables and to the equilibration
+        detection (once the proposal widths are no longer adapted), and
+        returns true if the system reached equilibrium, so the rest of the
+        sweeps of the step can be skipped.
+        """
+        if self.trial_moves.isAdapting():
+            return False
+        if not (self.observables.isStarted() or
+                self.equilibration.isEnabled()):
+            return False
+
+        E = self.lcs.getPotentialEnergy()
+        if self.observables.isStarted():
+            self.observables.addSample(E)
+        if not self.equilibration.isEnabled():
+            return False
+        self.equilibration.addSample(E, self.lcs.getSpinOrientationVariance())
+        return self.equilibration.isStationary()
+
+    def _performSublatticeSweep(self, sublattices):
+        """
+        Performs a single Metropolis sweep over the system, one sublattice at a
+        time, where the new spins and locations of all of the cells in a
+        sublattice are selected, and accepted or rejected, at once.
+        Since the cells in a sublattice are not neighbours of each other, the
+        energy difference of each one does not depend on the others, so this
+        is the same as going over them one by one in the sequential sweep.
+        Returns a tuple of arrays for all of the cells that were visited:
+        (energy differences, transition probabilities alpha, accepted flags).
+        """
+        potential = self.lcs.potential
+        kBT = kB * self.lcs.getTemperature()
+
+        # The cells of each sublattice are not changed before it is visited, so
+        # all of the trial moves can be drawn at the beginning of the sweep.
+        self.trial_moves.drawSweep(self.lcs)
+
+        all_energy_differences = []
+        all_alphas = []
+        all_accepted = []
+        for (sublattice_number, sublattice) in enumerate(sublattices):
+            # The neighbour pairs may change between sublattices, when the
+            # potential updates its neighbour lists.
+            cells, neighbours, translations = \
+                    potential.getNeighbourPairArrays(self.lcs)
+
+            # Select the new spins and locations of the sublattice.
+            current_spins = self.lcs.spins[sublattice]
+            current_locations = self.lcs.locations[sublattice]
+            new_spins = self.trial_moves.new_spins[sublattice]
+            new_locations = self.trial_moves.new_locations[sublattice]
+
+            # Find the pairs of each cell in the sublattice with its neighbours,
+            # and the position of the cell in the sublattice for each pair.
+            pair_indices, pair_positions = self._getSublatticePairs(
+                    sublattice_number, sublattice, cells)
+            pair_neighbours = neighbours[pair_indices]
+            n_spins = self.lcs.spins[pair_neighbours]
+            n_locations = (self.lcs.locations[pair_neighbours] +
+                           translations[pair_indices])
+
+            # Calculate the energy difference of each cell, as the sequential
+            # sweep does with getPotentialEnergyForSpin (half of each pair).
+            current_U = potential.calculatePairEnergies(
+                    current_spins[pair_positions], n_spins,
+                    current_locations[pair_positions] - n_locations)
+            new_U = potential.calculatePairEnergies(
+                    new_spins[pair_positions], n_spins,
+                    new_locations[pair_positions] - n_locations)
+            energy_differences = bincount(pair_positions,
+                                          weights=(new_U - current_U) / 2.0,
+                                          minlength=len(sublattice))
+
+            # Calculate the transition probabilities alpha, and perform the
+            # transitions with probability alpha.
+            alphas = exp(-(maximum(energy_differences, 0.0) / kBT))
+            accepted = (self.trial_moves.uniforms[sublattice] <= alphas)
+            self.lcs.setCellProperties(sublattice[accepted],
+                                       new_spins[accepted],
+                                       new_locations[accepted])
+
+            all_energy_differences.append(energy_differences)
+            all_alphas.append(alphas)
+            all_accepted.append(accepted)
+
+        return (concatenate(all_energy_differences), concatenate(all_alphas),
+                concatenate(all_accepted))
+
+    def _getSublatticePairs(self, sublattice_number, sublattice, cells):
+        """
+        Returns the pairs of the cells of the sublattice with the given number
+        and flat indices with their neighbours, among the given cells of the
+        neighbour pairs (which are sorted by cell), as a tuple of arrays of the
+        indices of the pairs, and the position of the cell of each pair in the
+        sublattice.
+        The pairs of each sublattice are gathered from the ranges of its cells
+        once, and kept until the neighbour pairs are rebuilt.
+        """
+        if self.sublattice_pairs_cells is not cells:
+            self.sublattice_pairs_cells = cells
+            self.sublattice_pairs = {}
+            counts = bincount(cells, minlength=self.lcs.num_cells)
+            self.sublattice_pairs_offsets = concatenate(([0], cumsum(counts)))
+
+        if sublattice_number not in self.sublattice_pairs:
+            starts = self.sublattice_pairs_offsets[sublattice]
+            counts = self.sublattice_pairs_offsets[sublattice + 1] - starts
+            pair_positions = arange(len(sublattice)).repeat(counts)
+            pair_indices = (arange(counts.sum()) +
+                            (starts - (cumsum(counts) - counts)).repeat(counts))
+            self.sublattice_pairs[sublattice_number] = (pair_indices,
+                                                        pair_positions)
+        return self.sublattice_pairs[sublattice_number]
+
+    def _performCollectiveMove(self):
+        """
+        Performs a single collective move, where the spins of a whole domain of
+        cells are rotated together, and the move is accepted or rejected as a
+        whole by the Metropolis criterion.
+        The move is accepted by half of the change in the potential energy of
+        the system, as the moves of single cells are accepted by the change in
+        their potential energy, in which each of their pairs is counted as
+        half, so both sample the same distribution.
+        Returns a tuple of (change in the potential energy, accepted flag).
+        """
+        domain, new_spins = self.trial_moves.drawDomainRotation(self.lcs)
+        energy_difference = self._getCollectiveEnergyDifference(domain,
+                                                                new_spins)
+
+        # Perform the transition with probability alpha.
+        alpha = 1.0
+        if energy_difference >= 0.0:
+            alpha = self.lcs.getCanonicalEnsembleProbability(
+                    energy=energy_difference / 2.0)
+        accepted = (self.trial_moves.random_state.random_sample() <= alpha)
+        if accepted:
+            self.lcs.setCellProperties(domain, new_spins,
+                                       self.lcs.locations[domain])
+        return (energy_difference, accepted)
+
+    def _getCollectiveEnergyDifference(self, domain, new_spins):
+        """
+        Calculates the change in the potential energy of the system if the
+        spins of the cells with the given flat indices were changed to the
+        given ones (the system itself is not changed).
+        """
+        # Calculate the energy difference from all of the pairs with a cell in
+        # the domain (each pair appears twice, so it is counted as half).
+        cells, neighbours, translations = \
+                self.lcs.potential.getNeighbourPairArrays(self.lcs)
+        in_domain = zeros(self.lcs.num_cells, dtype=bool)
+        in_domain[domain] = True
+        changed = in_domain[cells] | in_domain[neighbours]
+        cells = cells[changed]
+        neighbours = neighbours[changed]
+        r = (self.lcs.locations[cells] - self.lcs.locations[neighbours] -
+             translations[changed])
+        rotated_spins = self.lcs.spins.copy()
+        rotated_spins[domain] = new_spins
+
+        current_U = self.lcs.potential.calculatePairEnergies(
+                self.lcs.spins[cells], self.lcs.spins[neighbours], r)
+        new_U = self.lcs.potential.calculatePairEnergies(
+                rotated_spins[cells], rotated_spins[neighbours], r)
+        return (new_U - current_U).sum() / 2.0
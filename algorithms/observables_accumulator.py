@@ -0,0 +1,139 @@
+import os
+
+from equilibration_detector import BlockingAccumulator
+from util import *
+
+class ObservablesAccumulator:
+    """
+    Accumulates the thermodynamic observables of the system at a temperature
+    while the Metropolis algorithm runs, from a sample after each sweep:
+    - The mean potential energy per cell <U>.
+    - The heat capacity per cell Cv = N * Var(U) / (2 * kB * T^2), from the
+      fluctuations of the energy.
+    - The nematic order parameter S, the largest eigenvalue of the Q-tensor
+      of the system (see LiquidCrystalSystem.getOrderTensor).
+    - The susceptibility of the order parameter
+      chi = N * Var(S) / (2 * kB * T).
+    The fluctuations are divided by 2 * kB * T, since the moves are accepted
+    by the energy differences of the changed cells, which count each pair as
+    half, so the system is sampled from exp(-U / (2 * kB * T)).
+    The potential energy is given by the algorithm, which recalculates it
+    after each sweep (adding up the energy differences of the accepted moves
+    loses its precision as the energy drops by orders of magnitude from a
+    random start), and the order of the system is read from the sums of the
+    spins that it keeps up to date.
+    The error bars of the observables are estimated by a blocking analysis of
+    the samples (see BlockingAccumulator).
+    The observables of each temperature are appended as a row to a table.
+    """
+    TABLE_COLUMNS = ["T", "samples", "U", "U_err", "Cv", "Cv_err",
+                     "S", "S_err", "chi", "chi_err"]
+
+    def __init__(self):
+        self.start(None)
+
+    def start(self, lcs):
+        """
+        Starts accumulating the observables of the given system at its current
+        temperature, discarding all of the previous samples.
+        """
+        self.lcs = lcs
+        self.energy = BlockingAccumulator()
+        self.energy_fluctuation = BlockingAccumulator()
+        self.order = BlockingAccumulator()
+        self.order_fluctuation = BlockingAccumulator()
+        self.reference_energy = None
+        self.reference_order = None
+
+    def isStarted(self):
+        """
+        Returns true if the accumulation was started.
+        """
+        return self.lcs is not None
+
+    def getCount(self):
+        """
+        Returns the number of samples.
+        """
+        return self.energy.getCount()
+
+    def addSample(self, energy):
+        """
+        Adds a sample of the observables of the system after a sweep, given its
+        current potential energy.
+        """
+        num_cells = self.lcs.num_cells
+        energy = energy / num_cells
+        order = self.lcs.getNematicOrderParameter()
+
+        # The fluctuations are accumulated relative to the first sample, so
+        # the variances are not lost to the roundoff of large means.
+        if self.reference_energy is None:
+            self.reference_energy = energy
+            self.reference_order = order
+
+        self.energy.add(energy)
+        self.energy_fluctuation.add((energy - self.reference_energy) ** 2)
+        self.order.add(order)
+        self.order_fluctuation.add((order - self.reference_order) ** 2)
+
+    def getObservables(self):
+        """
+        Returns a dictionary of the observables (see TABLE_COLUMNS), each with
+        its error bar.
+        """
+        T = self.lcs.getTemperature()
+        num_cells = self.lcs.num_cells
+
+        energy_variance, energy_variance_error = self._getVariance(
+                self.energy, self.energy_fluctuation, self.reference_energy)
+        order_variance, order_variance_error = self._getVariance(
+                self.order, self.order_fluctuation, self.reference_order)
+
+        return {
+            "T": T,
+            "samples": self.getCount(),
+            "U": self.energy.getMean(),
+            "U_err": self.energy.getStandardError(),
+            "Cv": num_cells * energy_variance / (2.0 * kB * T * T),
+            "Cv_err": num_cells * energy_variance_error / (2.0 * kB * T * T),
+            "S": self.order.getMean(),
+            "S_err": self.order.getStandardError(),
+            "chi": num_cells * order_variance / (2.0 * kB * T),
+            "chi_err": num_cells * order_variance_error / (2.0 * kB * T),
+        }
+
+    def outputToTable(self, filepath):
+        """
+        Appends the observables of the temperature as a row to the table at
+        the given path (creating it with a header line first if needed).
+        Nothing is written if there are no samples.
+        """
+        if self.getCount() == 0:
+            return
+
+        dirpath = os.path.dirname(filepath)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+
+        observables = self.getObservables()
+        is_new = not os.path.exists(filepath)
+        f = file(filepath, "a")
+        if is_new:
+            f.write("#%s\n" % "\t".join(self.TABLE_COLUMNS))
+        f.write("%s\n" % "\t".join([repr(observables[column])
+                                    for column in self.TABLE_COLUMNS]))
+        f.flush()
+        f.close()
+
+    def _getVariance(self, values, fluctuations, reference):
+        """
+        Returns the variance of the samples of the given accumulator, from the
+        accumulator of their squared differences from the given reference, as
+        a tuple of (variance, error bar).
+        """
+        mean_difference = values.getMean() - reference
+        variance = fluctuations.getMean() - mean_difference ** 2
+        error = sqrt(fluctuations.getStandardError() ** 2 +
+                     (2.0 * mean_difference * values.getStandardError()) ** 2)
+        return (max(variance, 0.0), error)
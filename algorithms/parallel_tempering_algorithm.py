@@ -0,0 +1,317 @@
+import os
+import sys
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from instrumentation import instruments
+from lc import LiquidCrystalSystem
+from lc_output_writer import LiquidCrystalSystemOutputWriter
+from lc_run_manifest import LiquidCrystalRunManifest
+from lc_trajectory import LiquidCrystalSystemTrajectory
+from monte_carlo_algorithm import MonteCarloAlgorithm
+from util import *
+
+class ParallelTemperingAlgorithm(MonteCarloAlgorithm):
+    """
+    This is a parallel tempering (replica exchange) Monte Carlo algorithm.
+    Instead of annealing a single system through the temperatures one at a
+    time, a replica of the system is kept at each of the temperatures, and in
+    each round all of the replicas perform their Metropolis steps in parallel
+    in a pool of processes. After each round, exchanges of the configurations
+    of replicas at neighbouring temperatures are proposed, and accepted with
+    the probability min(1, exp((1/kBT1 - 1/kBT2) * (E1 - E2) / 2)), where the
+    energies are halved since the Metropolis steps accept the moves by the
+    potential energy of the changed cells, in which each pair is counted as
+    half (so this is the distribution the replicas are sampled from).
+    Since the replicas sample the equilibrium at their temperatures, every
+    round is accepted (the new state selector is not used).
+    The state of each temperature is saved after every round, alternating
+    between two states, so a run is resumed from the last round that all of
+    them completed even if it was stopped while the states were saved.
+    The states are written in the background, and each completed round is
+    recorded in the manifest of the run once all of its states were written.
+    """
+
+    def __init__(self, lcs, lcs_manager, new_state_selector,
+                 parameters, parameter_prefix="MC_"):
+        MonteCarloAlgorithm.__init__(self, lcs, lcs_manager,
+                                     new_state_selector, parameters,
+                                     parameter_prefix)
+        self.random_state = numpy.random.RandomState(
+                parameters.get(parameter_prefix + "RANDOM_SEED", None))
+        self.replicas = []
+
+    def getLCS(self):
+        """
+        Returns the replica of the system at the last temperature (after the
+        algorithm ran), or the original system.
+        """
+        if not self.replicas:
+            return self.lcs
+        return self.replicas[-1]
+
+    def run(self):
+        """
+        Run the parallel tempering algorithm with a replica of the system at
+        each of the given temperatures, for the given number of rounds.
+        """
+        AVIZ_OUTPUT_PATH = os.path.join(
+            str(self.parameters["RUN_DIR"]),
+            str(self.parameters[self.parameter_prefix + "AVIZ_OUTPUT_PATH"]))
+        STATE_PREFIX = str(
+            self.parameters[self.parameter_prefix + "STATE_PREFIX"])
+        MC_TEMPERATURES = list(
+            self.parameters[self.parameter_prefix + "TEMPERATURES"])
+        MC_MAX_STEPS = int(
+            self.parameters[self.parameter_prefix + "MAX_STEPS"])
+        MC_NUM_PROCESSES = self.parameters.get(
+            self.parameter_prefix + "NUM_PROCESSES", None)
+
+        print ("Running the parallel tempering algorithm on the system " +
+               "(%s replicas):") % len(MC_TEMPERATURES)
+        print
+        instruments.setValue("phase", self.parameter_prefix)
+
+        # The states, frames and information lines are written in the
+        # background, from snapshots of the replicas.
+        writer = LiquidCrystalSystemOutputWriter(self.parameters)
+
+        # The completed rounds are recorded in the manifest of the run.
+        manifest = LiquidCrystalRunManifest(self.parameters)
+
+        # Continue from the last completed round, if there is one. Older runs
+        # have no manifest, so when they are resumed the states of all of the
+        # temperatures are looked for instead, continuing from the last round
+        # they all completed.
+        probe_previous_states = not manifest.hasPhase(self.parameter_prefix)
+        manifest.startPhase(self.parameter_prefix)
+        rounds = manifest.getRounds(self.parameter_prefix)
+        if rounds:
+            first_round = rounds[-1]["round"]
+        elif probe_previous_states:
+            first_round = self._getLastCompletedRound(STATE_PREFIX,
+                                                      len(MC_TEMPERATURES))
+        else:
+            first_round = None
+        if first_round is not None:
+            self.replicas = [self.lcs_manager.loadState(
+                                     self._getStateName(STATE_PREFIX, k,
+                                                        first_round))
+                             for k in range(len(MC_TEMPERATURES))]
+            print "Loaded previous states of round %s" % first_round
+        else:
+            first_round = 0
+            self.replicas = []
+            for temperature in MC_TEMPERATURES:
+                replica = self.lcs.copy()
+                replica.setTemperature(temperature)
+                self.replicas.append(replica)
+
+        trajectories = [LiquidCrystalSystemTrajectory(
+                                "%s%03dtrajectory.dat" % (AVIZ_OUTPUT_PATH, k))
+                        for k in range(len(MC_TEMPERATURES))]
+
+        # Run the replicas in a pool of processes (or in this process if
+        # there is no multiprocessing support or only a single process).
+        pool = None
+        if multiprocessing and MC_NUM_PROCESSES != 1:
+            pool = multiprocessing.Pool(MC_NUM_PROCESSES, _initReplicaWorker,
+                                        (self.parameters,
+                                         self.parameter_prefix,
+                                         True))
+            map_function = pool.map
+        else:
+            _initReplicaWorker(self.parameters, self.parameter_prefix, False)
+            map_function = map
+
+        num_exchanges = zeros(len(MC_TEMPERATURES) - 1)
+        num_accepted_exchanges = zeros(len(MC_TEMPERATURES) - 1)
+        try:
+            for round_number in range(first_round + 1, MC_MAX_STEPS + 1):
+                print "--------------------(Round %s)--------------------" % (
+                        round_number,)
+                instruments.setValue("round", round_number)
+                instruments.markInterval("round")
+
+                # Perform the Metropolis steps of all of the replicas, each
+                # with a random generator of its own.
+                seeds = self.random_state.randint(0, 2 ** 31 - 1,
+                                                  len(self.replicas))
+                results = map_function(
+                        _runReplica,
+                        [(replica.getTemperature(), replica.spins,
+                          replica.locations, replica.original_locations,
+                          seeds[k])
+                         for (k, replica) in enumerate(self.replicas)])
+                energies = []
+                for (replica, (spins, locations, E, counts)) in \
+                        zip(self.replicas, results):
+                    instruments.mergeCounts(counts)
+                    replica.spins = spins
+                    replica.locations = locations
+                    replica.updateSpinSums()
+                    replica.potential.update()
+                    energies.append(E)
+
+                # Propose exchanges between the neighbouring temperatures, of
+                # the even pairs in even rounds and the odd pairs in odd ones.
+                for k in range(round_number % 2, len(self.replicas) - 1, 2):
+                    num_exchanges[k] += 1
+                    instruments.count("exchanges_proposed")
+                    if self._isExchangeAccepted(self.replicas[k],
+                                                energies[k],
+                                                self.replicas[k+1],
+                                                energies[k+1]):
+                        self._exchangeReplicas(self.replicas[k],
+                                               self.replicas[k+1])
+                        energies[k], energies[k+1] = energies[k+1], energies[k]
+                        num_accepted_exchanges[k] += 1
+                        instruments.count("exchanges_accepted")
+
+                # Write the state of each of the temperatures from a snapshot
+                # of its replica, with the potential energy of its step.
+                instruments.startTimer("output")
+                for (k, replica) in enumerate(self.replicas):
+                    print "T* = %s: E = %s" % (replica.getTemperature(),
+                                               energies[k])
+                    snapshot = replica.getSnapshot(energies[k])
+                    writer.write(trajectories[k].appendFrame, round_number,
+                                 snapshot)
+                    writer.write(snapshot.outputInformationToFile,
+                                 "%s%03dinfo.txt" % (AVIZ_OUTPUT_PATH, k))
+                    writer.write(self.lcs_manager.saveState,
+                                 self._getStateName(STATE_PREFIX, k,
+                                                    round_number),
+                                 snapshot, round_number=round_number)
+
+                # Record the completed round (once all of its states were
+                # written), with the state of the last temperature.
+                writer.write(manifest.addRound, self.parameter_prefix,
+                             round_number, self.replicas[-1].getTemperature(),
+                             self._getStateName(STATE_PREFIX,
+                                                len(self.replicas) - 1,
+                                                round_number),
+                             round_number, energies[-1])
+                instruments.stopTimer("output")
+                print
+                instruments.emitInterval("round")
+                instruments.emitIfDue()
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        # Complete all of the writes of the phase.
+        writer.close()
+
+        print "Exchange acceptance rates:"
+        for k in range(len(self.replicas) - 1):
+            if num_exchanges[k] > 0:
+                print "  T* = %s <-> %s: %.2f%%" % (
+                        self.replicas[k].getTemperature(),
+                        self.replicas[k+1].getTemperature(),
+                        num_accepted_exchanges[k] * 100 / num_exchanges[k])
+        print "End of Simulation."
+
+    def _getStateName(self, state_prefix, replica_number, round_number):
+        """
+        Returns the name of the state of the replica with the given number in
+        the given round, which alternates between two states in the even and
+        odd rounds.
+        """
+        return "%s%03d_%d" % (state_prefix, replica_number, round_number % 2)
+
+    def _getLastCompletedRound(self, state_prefix, num_replicas):
+        """
+        Returns the last round whose states were saved for all of the given
+        number of replicas, or None if there is no such round.
+        """
+        rounds = None
+        for k in range(num_replicas):
+            replica_rounds = []
+            for parity in range(2):
+                header = self.lcs_manager.loadStateHeader(
+                        self._getStateName(state_prefix, k, parity))
+                if header is not None:
+                    replica_rounds.append(header["round_number"])
+            if rounds is None:
+                rounds = replica_rounds
+            else:
+                rounds = [round_number for round_number in rounds
+                          if round_number in replica_rounds]
+        if not rounds:
+            return None
+        return max(rounds)
+
+    def _isExchangeAccepted(self, lcs1, E1, lcs2, E2):
+        """
+        Returns true if the exchange of the configurations of the given
+        replicas, with the given potential energies, is accepted.
+        """
+        delta = ((1.0 / (kB * lcs1.getTemperature()) -
+                  1.0 / (kB * lcs2.getTemperature())) * (E1 - E2) / 2.0)
+        if delta >= 0.0:
+            return True
+        return self.random_state.random_sample() < exp(delta)
+
+    def _exchangeReplicas(self, lcs1, lcs2):
+        """
+        Exchanges the configurations of the given replicas, keeping their
+        temperatures.
+        """
+        lcs1.spins, lcs2.spins = lcs2.spins, lcs1.spins
+        lcs1.locations, lcs2.locations = lcs2.locations, lcs1.locations
+        lcs1.original_locations, lcs2.original_locations = \
+                lcs2.original_locations, lcs1.original_locations
+        lcs1.updateSpinSums()
+        lcs2.updateSpinSums()
+        lcs1.potential.update()
+        lcs2.potential.update()
+
+# The parameters of the replicas run in this process (see _initReplicaWorker).
+_replica_parameters = None
+_replica_parameter_prefix = None
+
+def _initReplicaWorker(parameters, parameter_prefix, quiet):
+    """
+    Initializes a process to run replicas with the given parameters.
+    The output of the Metropolis steps (and their progress bars) is discarded
+    if quiet is true.
+    NOTE: The parameters can't be pickled (they hold the modules the model
+          file imported), so this relies on the worker processes being forked.
+    """
+    global _replica_parameters, _replica_parameter_prefix
+    _replica_parameters = parameters
+    _replica_parameter_prefix = parameter_prefix
+    if quiet:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.dup2(devnull, sys.stderr.fileno())
+
+        # The counters and timers of the worker are returned with each replica
+        # and merged into the ones of the main process.
+        instruments.detach()
+
+def _runReplica(replica):
+    """
+    Performs the Metropolis steps of a replica, given as a tuple of its
+    (temperature, spins, locations, original locations, random seed).
+    Returns a tuple of its new (spins, locations, potential energy), and the
+    counters and timers of the instrumentation if this is a worker process
+    (or None).
+    """
+    temperature, spins, locations, original_locations, seed = replica
+    lcs = LiquidCrystalSystem(_replica_parameters, temperature,
+                              spins.copy(), locations.copy(),
+                              original_locations)
+    algorithm = MonteCarloAlgorithm(lcs, None, None, _replica_parameters,
+                                    _replica_parameter_prefix)
+    algorithm.trial_moves.random_state = numpy.random.RandomState(seed)
+    E = algorithm._performMetropolisStep()
+    counts = None
+    if instruments.isDetached():
+        counts = instruments.takeCounts()
+    return (lcs.spins, lcs.locations, E, counts)
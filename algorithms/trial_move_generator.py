@@ -0,0 +1,140 @@
+from util import *
+
+class TrialMoveGenerator:
+    """
+    Generates the trial moves of the Metropolis algorithm a whole sweep at a
+    time: the new spins, new locations and acceptance variates of all of the
+    cells are drawn at once into arrays, from a seedable random generator of
+    its own so that runs can be reproduced.
+    Since each cell is visited only once in a sweep, and its spin and location
+    do not change before it is visited, the trial moves of all of the cells can
+    be drawn from their spins and locations at the beginning of the sweep.
+    It also draws collective moves, which rotate the spins of a whole domain of
+    cells (all of the cells within an index range of a random cell, or the
+    entire system) together by a random rotation.
+    The widths of the spin and location proposals can be adapted during an
+    equilibration window of sweeps toward a target acceptance rate, after which
+    they stay fixed.
+    """
+    # The maximal width of the spin proposals, beyond which the new spins are
+    # practically uniformly distributed anyway.
+    MAX_SPIN_STDEV = 10.0
+
+    def __init__(self, parameters, parameter_prefix="MC_"):
+        """
+        Reads the standard deviations of the trial moves and the random seed
+        (if no seed is given, the generator is seeded randomly).
+        """
+        self.spin_stdev = float(parameters[parameter_prefix + "SPIN_STDEV"])
+        self.spacing_stdev = float(
+                parameters[parameter_prefix + "SPACING_STDEV"])
+        self.spacing_cutoff = float(
+                parameters[parameter_prefix +
+                           "SPACING_FROM_ORIGINAL_LOCATION_CUTOFF"])
+        self.random_state = numpy.random.RandomState(
+                parameters.get(parameter_prefix + "RANDOM_SEED", None))
+        self.collective_move_range = parameters.get(
+                parameter_prefix + "COLLECTIVE_MOVE_RANGE", None)
+        self.collective_rotation_stdev = float(
+                parameters.get(parameter_prefix + "COLLECTIVE_ROTATION_STDEV",
+                               0.0))
+        self.target_acceptance_rate = float(
+                parameters.get(parameter_prefix + "TARGET_ACCEPTANCE_RATE",
+                               0.5))
+        self.num_adaptive_sweeps = 0
+
+        self.new_spins = None
+        self.new_locations = None
+        self.uniforms = None
+
+    def drawSweep(self, lcs):
+        """
+        Draws the trial moves of all of the cells of the given system for a
+        single sweep, based on their current spins and locations.
+        A cell that moves out of the cutoff sphere around its original location
+        keeps its current location.
+        """
+        shape = lcs.spins.shape
+
+        # Select the new spins from a gaussian distribution around the current
+        # ones, and normalize them.
+        self.new_spins = lcs.spins + self.random_state.normal(
+                0.0, self.spin_stdev, shape)
+        self.new_spins /= sqrt(
+                (self.new_spins * self.new_spins).sum(axis=1))[:, newaxis]
+
+        # Select the new locations from a gaussian distribution around the
+        # current ones.
+        self.new_locations = lcs.locations + self.random_state.normal(
+                0.0, self.spacing_stdev, shape)
+        distances = self.new_locations - lcs.original_locations
+        out_of_cutoff = ((distances * distances).sum(axis=1) >
+                         self.spacing_cutoff ** 2)
+        self.new_locations[out_of_cutoff] = lcs.locations[out_of_cutoff]
+
+        # Select the uniform variates for accepting the moves.
+        self.uniforms = self.random_state.random_sample(shape[0])
+
+    def startAdapting(self, num_sweeps):
+        """
+        Starts an equilibration window of the given number of sweeps, in which
+        the proposal widths are adapted.
+        """
+        self.num_adaptive_sweeps = num_sweeps
+
+    def isAdapting(self):
+        """
+        Returns true if the proposal widths are still being adapted.
+        """
+        return self.num_adaptive_sweeps > 0
+
+    def adapt(self, acceptance_rate):
+        """
+        Adapts the proposal widths after a sweep of the equilibration window
+        with the given acceptance rate, scaling both of them by the same factor
+        (so their ratio is kept) toward the target acceptance rate.
+        The location proposals are never wider than the cutoff around the
+        original locations.
+        """
+        if not self.isAdapting():
+            return
+
+        factor = exp(acceptance_rate - self.target_acceptance_rate)
+        self.spin_stdev = min(self.spin_stdev * factor, self.MAX_SPIN_STDEV)
+        self.spacing_stdev = min(self.spacing_stdev * factor,
+                                 self.spacing_cutoff)
+        self.num_adaptive_sweeps -= 1
+
+    def drawDomainRotation(self, lcs):
+        """
+        Draws a collective move of the given system, returning a tuple of the
+        flat indices of the cells in the rotated domain, and their new spins.
+        The domain does not depend on the spins, and the rotation is by an
+        angle from a gaussian distribution around zero in a random plane, so
+        the move is as likely as the one that reverses it.
+        """
+        d = len(lcs.dimensions)
+
+        # Select the domain of cells around a random cell.
+        if self.collective_move_range is None:
+            domain = arange(lcs.num_cells)
+        else:
+            flat_index = self.random_state.randint(lcs.num_cells)
+            topology = lcs.getNeighbourTopology(
+                    [int(self.collective_move_range) for i in range(d)])
+            neighbours, translations = topology.getNeighbours(flat_index)
+            domain = unique(concatenate(([flat_index], neighbours)))
+
+        # Select a random plane by two orthonormal vectors, and rotate the spins
+        # in it.
+        u = self.random_state.normal(0.0, 1.0, d)
+        u /= sqrt(dot(u, u))
+        v = self.random_state.normal(0.0, 1.0, d)
+        v -= dot(v, u) * u
+        v /= sqrt(dot(v, v))
+        angle = self.random_state.normal(0.0, self.collective_rotation_stdev)
+        rotation = (identity(d) +
+                    (cos(angle) - 1.0) * (outer(u, u) + outer(v, v)) +
+                    sin(angle) * (outer(v, u) - outer(u, v)))
+
+        return (domain, dot(lcs.spins[domain], rotation.T))
@@ -1,5 +1,17 @@
 #!/bin/bash
 
+export PYTHONPATH=`pwd`:$PYTHONPATH
+export LD_LIBRARY_PATH=`pwd`/cpp/potentials:$LD_LIBRARY_PATH
+
 LAST_RUN=`ls -t runs/ | grep -e "$1" | head -1`
+
+# Export the Aviz XYZ files from the trajectories of the run, the first time
+# it is viewed.
+if [ ! -f runs/$LAST_RUN/output/lqs.list ]; then
+  echo "Exporting Aviz files for run: $LAST_RUN"
+  python statistics/export_aviz.py runs/$LAST_RUN > /dev/null &&
+  (cd runs/$LAST_RUN/output && ls -1 *.xyz | sort > lqs.list)
+fi
+
 echo "Running AVIZ for run: $LAST_RUN"
 aviz -vpm 3d.vpm -fl runs/$LAST_RUN/output/lqs.list
@@ -0,0 +1,278 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import numpy
+
+import main
+from lc import LiquidCrystalSystem
+from lc_state_manager import LiquidCrystalSystemStateManager
+from algorithms.monte_carlo_algorithm import MonteCarloAlgorithm
+from potentials.gb_potential import GayBernesPotential
+from potentials.gb_potential_fast import GayBernesPotentialFast
+
+# The models and two spin potentials that are benchmarked by default.
+BENCHMARK_MODELS = ["2d_small", "2d_large", "3d_small", "3d"]
+BENCHMARK_POTENTIALS = [GayBernesPotential, GayBernesPotentialFast]
+
+# The seed of all of the random generators, so every benchmark run measures
+# the same systems and trial moves.
+BENCHMARK_SEED = 1
+
+# The number of times each benchmark is repeated (the fastest time is taken,
+# as the one least disturbed by other processes).
+BENCHMARK_REPEATS = 3
+
+# The number of cells whose potential energy is calculated, and the number of
+# sweeps that are performed, in each repeat.
+BENCHMARK_NUM_CELLS = 100
+BENCHMARK_NUM_SWEEPS = 2
+
+# The slowdown (relative to the baseline) from which a benchmark is flagged as
+# a regression in the compare mode.
+BENCHMARK_THRESHOLD = 0.1
+
+def printUsage():
+    print "Usage: ./benchmark.sh run <results file> [model ...]"
+    print "       ./benchmark.sh compare <baseline file> <results file> [threshold]"
+    print
+    print "Commands:"
+    print "  run      - Times the hot paths of the simulation (energies, Metropolis sweeps,"
+    print "             copies, states, Aviz files and neighbour list rebuilds) for each of the"
+    print "             given models (by default: %s)" % ", ".join(BENCHMARK_MODELS)
+    print "             with each of the Gay-Bernes potential implementations, and writes the"
+    print "             results to the given JSON file."
+    print "  compare  - Compares the results file to the baseline file, and flags every"
+    print "             benchmark that is slower by more than the threshold (by default"
+    print "             %s, that is %d%%). Exits with 1 if there are any regressions." % (
+            BENCHMARK_THRESHOLD, BENCHMARK_THRESHOLD * 100)
+    print
+    print "-h or --help will display this usage."
+
+def parseCommandLineArgs(args):
+    """
+    Parses the command line arguments, returning the command and its
+    arguments.
+    """
+    args = args[1:]
+
+    # If we have '-h' or '--help', display usage and exit.
+    if "-h" in args or "--help" in args or len(args) < 2:
+        raise RuntimeError()
+    if args[0] not in ["run", "compare"]:
+        raise RuntimeError("Unknown command: '%s'" % args[0])
+    if args[0] == "compare" and len(args) < 3:
+        raise RuntimeError("The compare command needs two results files.")
+
+    return (args[0], args[1:])
+
+def timeCall(function, repeats=BENCHMARK_REPEATS):
+    """
+    Calls the given function the given number of times, and returns the
+    fastest time it took in seconds.
+    """
+    times = []
+    for repeat in xrange(repeats):
+        start_time = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start_time)
+    return min(times)
+
+def quiet(function):
+    """
+    Returns a function that calls the given function with its output (and its
+    progress bars) discarded.
+    """
+    def quiet_function():
+        sys.stdout.flush()
+        sys.stderr.flush()
+        stdout_fd = os.dup(sys.stdout.fileno())
+        stderr_fd = os.dup(sys.stderr.fileno())
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.dup2(devnull, sys.stderr.fileno())
+        os.close(devnull)
+        try:
+            function()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(stdout_fd, sys.stdout.fileno())
+            os.dup2(stderr_fd, sys.stderr.fileno())
+            os.close(stdout_fd)
+            os.close(stderr_fd)
+    return quiet_function
+
+def readBenchmarkParameters(model, two_spin_potential, run_dir):
+    """
+    Reads the parameters of the given model for a benchmark with the given two
+    spin potential, with its files written under the given run directory.
+    """
+    parameters = main.readParametersFromFile(model)
+    parameters["MODEL"] = model
+    parameters["RUN_DIR"] = run_dir
+    parameters["TWO_SPIN_POTENTIAL"] = two_spin_potential
+    parameters["MC_COOLER_RANDOM_SEED"] = BENCHMARK_SEED
+    parameters["MC_COOLER_METROPOLIS_NUM_STEPS"] = BENCHMARK_NUM_SWEEPS
+    return parameters
+
+def rebuildNeighbourLists(lcs):
+    """
+    Rebuilds the neighbour lists of the potential of the given system from
+    scratch, including the neighbour topologies they are built from.
+    """
+    LiquidCrystalSystem.neighbour_topologies.clear()
+    potential = lcs.potential
+    if hasattr(potential, "neighbour_list"):
+        potential.neighbour_list = None
+    if hasattr(potential, "topology"):
+        potential.topology = None
+    potential.getNeighbourPairArrays(lcs)
+
+def benchmarkModel(model, two_spin_potential):
+    """
+    Runs all of the benchmarks of the given model with the given two spin
+    potential, returning a dictionary of the name of each benchmark to its
+    results.
+    """
+    run_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        parameters = readBenchmarkParameters(model, two_spin_potential,
+                                             run_dir)
+        random.seed(BENCHMARK_SEED)
+        numpy.random.seed(BENCHMARK_SEED)
+        lcs = LiquidCrystalSystem(parameters,
+                                  float(parameters["INITIAL_TEMPERATURE"]))
+        lcs_manager = LiquidCrystalSystemStateManager(parameters)
+        all_indices = list(lcs.getSystemIndexIterator())
+        cell_indices = [all_indices[random.randrange(lcs.num_cells)]
+                        for i in xrange(BENCHMARK_NUM_CELLS)]
+        lcs.getPotentialEnergy()
+
+        def calculate_cell_energies():
+            for indices in cell_indices:
+                lcs.getPotentialEnergyForSpin(indices)
+
+        def perform_sweeps():
+            algorithm = MonteCarloAlgorithm(lcs.copy(), lcs_manager, None,
+                                            parameters, "MC_COOLER_")
+            algorithm._performMetropolisStep()
+
+        results = {}
+        def add_result(name, seconds, num_operations=1):
+            results[name] = {
+                "seconds": seconds / num_operations,
+                "per_second": num_operations / seconds,
+            }
+            print "  %-28s %12.6f seconds (%.1f per second)" % (
+                    name, seconds / num_operations, num_operations / seconds)
+
+        add_result("potential_energy", timeCall(lcs.getPotentialEnergy))
+        add_result("potential_energy_for_spin",
+                   timeCall(calculate_cell_energies), BENCHMARK_NUM_CELLS)
+        add_result("metropolis_sweep", timeCall(quiet(perform_sweeps)),
+                   BENCHMARK_NUM_SWEEPS)
+        add_result("copy", timeCall(lcs.copy))
+        add_result("save_state",
+                   timeCall(lambda: lcs_manager.saveState("benchmark", lcs)))
+        add_result("load_state",
+                   timeCall(lambda: lcs_manager.loadState("benchmark")))
+        add_result("output_to_aviz_file",
+                   timeCall(lambda: lcs.outputToAvizFile(
+                           os.path.join(run_dir, "output", "benchmark.xyz"))))
+        add_result("neighbour_list_rebuild",
+                   timeCall(lambda: rebuildNeighbourLists(lcs)))
+        return results
+    finally:
+        shutil.rmtree(run_dir, True)
+
+def runBenchmarks(results_path, models):
+    """
+    Runs the benchmarks of the given models with each of the two spin
+    potentials, and writes their results to the given JSON file.
+    """
+    benchmarks = {}
+    for model in models:
+        for two_spin_potential in BENCHMARK_POTENTIALS:
+            print "%s with %s:" % (model, two_spin_potential.__name__)
+            model_results = benchmarkModel(model, two_spin_potential)
+            for (name, result) in model_results.iteritems():
+                benchmarks["%s/%s/%s" % (model, two_spin_potential.__name__,
+                                         name)] = result
+            print
+
+    results = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "python": sys.version.split()[0],
+        "numpy": numpy.__version__,
+        "seed": BENCHMARK_SEED,
+        "repeats": BENCHMARK_REPEATS,
+        "benchmarks": benchmarks,
+    }
+    results_file = file(results_path, "w")
+    try:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+    finally:
+        results_file.close()
+    print "Results saved in: %s" % results_path
+
+def compareBenchmarks(baseline_path, results_path,
+                      threshold=BENCHMARK_THRESHOLD):
+    """
+    Compares the benchmarks in the given results file to the ones in the
+    baseline file, printing the ratio of the time of each one to its baseline,
+    and returns the names of the benchmarks that are slower than the baseline
+    by more than the threshold.
+    """
+    baseline = json.load(file(baseline_path, "r"))["benchmarks"]
+    results = json.load(file(results_path, "r"))["benchmarks"]
+
+    regressions = []
+    names = [name for name in results.keys() if name in baseline]
+    names.sort()
+    print "%-60s %12s %12s %8s" % ("Benchmark", "Baseline", "Result", "Ratio")
+    for name in names:
+        ratio = results[name]["seconds"] / baseline[name]["seconds"]
+        flag = ""
+        if ratio > 1.0 + threshold:
+            flag = "  <-- REGRESSION"
+            regressions.append(name)
+        print "%-60s %12.6f %12.6f %8.2f%s" % (
+                name, baseline[name]["seconds"], results[name]["seconds"],
+                ratio, flag)
+
+    missing = [name for name in baseline.keys() if name not in results]
+    missing.sort()
+    if missing:
+        print
+        print "Not in the results: %s" % ", ".join(missing)
+    print
+    print "%s regressions (threshold %s)." % (len(regressions), threshold)
+    return regressions
+
+if __name__ == "__main__":
+    try:
+        command, args = parseCommandLineArgs(sys.argv)
+    except RuntimeError, e:
+        print e
+        print
+        printUsage()
+        sys.exit(1)
+
+    if command == "run":
+        runBenchmarks(args[0], args[1:] or BENCHMARK_MODELS)
+    else:
+        threshold = BENCHMARK_THRESHOLD
+        if len(args) > 2:
+            threshold = float(args[2])
+        if compareBenchmarks(args[0], args[1], threshold):
+            sys.exit(1)
@@ -2,6 +2,7 @@
 
 #include <math.h>
 #include <iostream>
+#include <stdexcept>
 #include <string>
 #include <sstream>
 
@@ -85,38 +86,106 @@ double GayBernesPotentialImpl::calculateTwoSpins(
         const vector<double>& location1,
         const vector<double>& spin2,
         const vector<double>& location2) const {
-    // Calculate the distance r.
-    vector<double> r(location1.size());
-    sub(location1, location2, &r);
-
-    // Calculate its magnitude and normalize it.
-    double n = norm(r);
-    vector<double> nr(r.size());
-    normalize(r, &nr);
-
-    // Calculate all of the scalar values we need for the calculation before.
-    double dot_spin1_nr = dot(spin1, nr);
-    double dot_spin2_nr = dot(spin2, nr);
-    double dot_spin1_spin2 = dot(spin1, spin2);
+    // Calculate the distance r (on the stack, for up to 3 dimensions).
+    int num_dimensions = location1.size();
+    double r_buffer[3];
+    vector<double> r_vector;
+    double* r = r_buffer;
+    if (num_dimensions > 3) {
+        r_vector.resize(num_dimensions);
+        r = &r_vector[0];
+    }
+    for (int i = 0; i < num_dimensions; ++i) {
+        r[i] = location1[i] - location2[i];
+    }
 
-    // Calculate the potential itself.
-    double U = calculateGBPotential(
-            dot_spin1_nr, dot_spin2_nr, dot_spin1_spin2, n);
+    double U = calculatePair(&spin1[0], &spin2[0], r, num_dimensions);
     //cout << "// GayBernesPotentialImpl::calculateTwoSpins:" << endl;
     //cout << "// spin1 = " << toString(spin1) << ", location1 = " << toString(location1) << endl;
     //cout << "// spin2 = " << toString(spin2) << ", location2 = " << toString(location2) << endl;
-    //cout << "// r = " << toString(r) << ", nr = " << toString(nr) << endl;
     //cout << "// U = " << U << endl;
     return U;
 }
 
+void GayBernesPotentialImpl::calculateTwoSpinsBuffers(
+        const double* spins1, int spins1_size,
+        const double* spins2, int spins2_size,
+        const double* r, int r_size,
+        int num_dimensions,
+        double* pair_potentials, int pair_potentials_size) const {
+    int num_pairs = getNumPairs(spins1_size, spins2_size, r_size,
+                                num_dimensions);
+    if (pair_potentials_size != num_pairs) {
+        throw std::invalid_argument(
+                "The pair potentials buffer doesn't match the pairs");
+    }
+
+    for (int m = 0; m < num_pairs; ++m) {
+        int offset = m * num_dimensions;
+        pair_potentials[m] = calculatePair(spins1 + offset, spins2 + offset,
+                                           r + offset, num_dimensions);
+    }
+}
+
+double GayBernesPotentialImpl::calculateTwoSpinsBuffersSum(
+        const double* spins1, int spins1_size,
+        const double* spins2, int spins2_size,
+        const double* r, int r_size,
+        int num_dimensions) const {
+    int num_pairs = getNumPairs(spins1_size, spins2_size, r_size,
+                                num_dimensions);
+
+    double U = 0.0;
+    for (int m = 0; m < num_pairs; ++m) {
+        int offset = m * num_dimensions;
+        U += calculatePair(spins1 + offset, spins2 + offset, r + offset,
+                           num_dimensions);
+    }
+    return U;
+}
+
+double GayBernesPotentialImpl::calculatePair(
+        const double* spin1, const double* spin2, const double* r,
+        int num_dimensions) const {
+    // Calculate the magnitude of the distance, and all of the scalar values
+    // we need for the calculation with the normalized distance.
+    double n = 0.0;
+    double dot_spin1_r = 0.0;
+    double dot_spin2_r = 0.0;
+    double dot_spin1_spin2 = 0.0;
+    for (int i = 0; i < num_dimensions; ++i) {
+        n += r[i] * r[i];
+        dot_spin1_r += spin1[i] * r[i];
+        dot_spin2_r += spin2[i] * r[i];
+        dot_spin1_spin2 += spin1[i] * spin2[i];
+    }
+    n = sqrt(n);
+
+    // Calculate the potential itself.
+    return calculateGBPotential(
+            dot_spin1_r / n, dot_spin2_r / n, dot_spin1_spin2, n);
+}
+
+int GayBernesPotentialImpl::getNumPairs(
+        int spins1_size, int spins2_size, int r_size,
+        int num_dimensions) const {
+    if (num_dimensions <= 0 || r_size % num_dimensions != 0 ||
+        spins1_size != r_size || spins2_size != r_size) {
+        throw std::invalid_argument(
+                "The spins and distances buffers don't match");
+    }
+    return r_size / num_dimensions;
+}
+
 double GayBernesPotentialImpl::calculateGBPotential(
         double dot_spin1_nr, double dot_spin2_nr,
         double dot_spin1_spin2, double n) const {
     double R = calculateR(dot_spin1_nr, dot_spin2_nr, dot_spin1_spin2, n);
     double epsilon = calculateEpsilon(dot_spin1_nr, dot_spin2_nr,
                                       dot_spin1_spin2);
-    return (4 * epsilon * (pow(R, 12) - pow(R, 6)));
+    double R6 = R * R * R;
+    R6 *= R6;
+    return (4 * epsilon * (R6 * R6 - R6));
 }
 
 double GayBernesPotentialImpl::calculateR(
@@ -130,10 +199,10 @@ double GayBernesPotentialImpl::calculateR(
 double GayBernesPotentialImpl::calculateSigma(
         double dot_spin1_nr, double dot_spin2_nr,
         double dot_spin1_spin2) const {
-    double first  = pow(dot_spin1_nr + dot_spin2_nr, 2) /
-                    (1.0 + chi_ * dot_spin1_spin2);
-    double second = pow(dot_spin1_nr - dot_spin2_nr, 2) /
-                    (1.0 - chi_ * dot_spin1_spin2);
+    double sum = dot_spin1_nr + dot_spin2_nr;
+    double difference = dot_spin1_nr - dot_spin2_nr;
+    double first  = sum * sum / (1.0 + chi_ * dot_spin1_spin2);
+    double second = difference * difference / (1.0 - chi_ * dot_spin1_spin2);
     return sigma_s_ / sqrt(1.0 - chi_ / 2.0 * (first + second));
 }
 
@@ -149,15 +218,16 @@ double GayBernesPotentialImpl::calculateEpsilon(
 
 double GayBernesPotentialImpl::calculateEpsilonNi(
         double dot_spin1_spin2) const {
-    return 1.0 / sqrt(1.0 - (chi_ * chi_) * pow(dot_spin1_spin2, 2));
+    return 1.0 / sqrt(1.0 - (chi_ * chi_) * dot_spin1_spin2 * dot_spin1_spin2);
 }
 
 double GayBernesPotentialImpl::calculateEpsilonTagMiu(
         double dot_spin1_nr, double dot_spin2_nr,
         double dot_spin1_spin2) const {
-    double first  = pow(dot_spin1_nr + dot_spin2_nr, 2) /
-                    (1.0 + chi_tag_ * dot_spin1_spin2);
-    double second = pow(dot_spin1_nr - dot_spin2_nr, 2) /
+    double sum = dot_spin1_nr + dot_spin2_nr;
+    double difference = dot_spin1_nr - dot_spin2_nr;
+    double first  = sum * sum / (1.0 + chi_tag_ * dot_spin1_spin2);
+    double second = difference * difference /
                     (1.0 - chi_tag_ * dot_spin1_spin2);
     return 1.0 - chi_tag_ / 2.0 * (first + second);
 }
@@ -13,7 +13,34 @@ class GayBernesPotentialImpl {
                             const std::vector<double>& spin2,
                             const std::vector<double>& location2) const;
 
+    // Calculates the potentials of a whole batch of pairs of spins at once,
+    // from contiguous buffers of num_pairs * num_dimensions doubles each
+    // (row major), of the spins of each pair and of their distance vectors
+    // (location1 - location2).
+    // The potentials of the pairs are written to the pair_potentials buffer
+    // (of num_pairs doubles).
+    // Throws std::invalid_argument if the sizes of the buffers don't match.
+    void calculateTwoSpinsBuffers(const double* spins1, int spins1_size,
+                                  const double* spins2, int spins2_size,
+                                  const double* r, int r_size,
+                                  int num_dimensions,
+                                  double* pair_potentials,
+                                  int pair_potentials_size) const;
+
+    // Same as calculateTwoSpinsBuffers, but returns the sum of the potentials
+    // of the pairs instead of writing them.
+    double calculateTwoSpinsBuffersSum(const double* spins1, int spins1_size,
+                                       const double* spins2, int spins2_size,
+                                       const double* r, int r_size,
+                                       int num_dimensions) const;
+
   private:
+    double calculatePair(const double* spin1, const double* spin2,
+                         const double* r, int num_dimensions) const;
+
+    int getNumPairs(int spins1_size, int spins2_size, int r_size,
+                    int num_dimensions) const;
+
     double calculateGBPotential(double dot_spin1_nr,
                                 double dot_spin2_nr,
                                 double dot_spin1_spin2,
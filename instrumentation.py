@@ -0,0 +1,248 @@
+import os
+import time
+import timeit
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+class Instrumentation:
+    """
+    This class keeps named counters and timers of a run (such as the number of
+    proposed and accepted moves, of pair energy evaluations and of neighbour
+    list rebuilds, or the time spent saving states), and writes them as JSON
+    lines to a file in the run directory:
+    - A "periodic" record every INSTRUMENTATION_INTERVAL seconds, with the
+      totals so far and the rates of the counters since the previous one, so a
+      long run can be followed while it is still running.
+    - A record of each interval that was marked (such as a temperature of the
+      Monte Carlo algorithm), with the counts, times and rates within it.
+    - An "end" record with the totals of the run.
+    When the instrumentation is disabled (the default), nothing is counted,
+    and the hot paths only check the enabled flag before calling it, so it
+    costs no more than an attribute lookup.
+    A single instance (instruments) is shared by the whole process (and the
+    threads in it, so the dictionaries are copied before they are iterated).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.interval = None
+        self._reset()
+
+    def start(self, parameters):
+        """
+        Starts the instrumentation of the run in the RUN_DIR of the given
+        parameters, if INSTRUMENTATION is set.
+        """
+        self.enabled = bool(parameters.get("INSTRUMENTATION", False))
+        if not self.enabled:
+            return
+        self.path = os.path.join(
+                str(parameters["RUN_DIR"]),
+                str(parameters.get("INSTRUMENTATION_PATH",
+                                   "instrumentation.jsonl")))
+        self.interval = float(parameters.get("INSTRUMENTATION_INTERVAL", 60.0))
+        self._reset()
+
+    def stop(self):
+        """
+        Writes the end record, and stops the instrumentation.
+        """
+        if not self.enabled:
+            return
+        self.emit("end")
+        self.enabled = False
+        self.path = None
+
+    def detach(self):
+        """
+        Stops writing records from this process, which is a worker process
+        that was forked from the instrumented one, starting its counters and
+        timers over. The main process takes them from the worker instead (see
+        takeCounts and mergeCounts).
+        """
+        self.path = None
+        self._reset()
+
+    def isDetached(self):
+        """
+        Returns true if the instrumentation is enabled in a detached worker
+        process.
+        """
+        return self.enabled and self.path is None
+
+    def count(self, name, amount=1):
+        """
+        Adds the given amount to the counter with the given name.
+        """
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def setValue(self, name, value):
+        """
+        Sets the current value with the given name (such as the temperature),
+        which is written with each of the records.
+        """
+        if not self.enabled:
+            return
+        self.values[name] = value
+
+    def startTimer(self, name):
+        """
+        Starts the timer with the given name.
+        """
+        if not self.enabled:
+            return
+        self.timer_starts[name] = timeit.default_timer()
+
+    def stopTimer(self, name):
+        """
+        Stops the timer with the given name, adding the time since it was
+        started to its total.
+        """
+        if not self.enabled or name not in self.timer_starts:
+            return
+        seconds = timeit.default_timer() - self.timer_starts.pop(name)
+        count, total = self.timers.get(name, (0, 0.0))
+        self.timers[name] = (count + 1, total + seconds)
+
+    def takeCounts(self):
+        """
+        Returns the counters and timers of this process as a tuple of
+        dictionaries, and starts them over.
+        """
+        counts = (self.counters, self.timers)
+        self.counters = {}
+        self.timers = {}
+        return counts
+
+    def mergeCounts(self, counts):
+        """
+        Adds the given counters and timers (as returned by takeCounts in a
+        worker process) to the ones of this process.
+        """
+        if not self.enabled or counts is None:
+            return
+        counters, timers = counts
+        for (name, amount) in counters.iteritems():
+            self.count(name, amount)
+        for (name, (count, seconds)) in timers.iteritems():
+            total_count, total_seconds = self.timers.get(name, (0, 0.0))
+            self.timers[name] = (total_count + count, total_seconds + seconds)
+
+    def markInterval(self, name):
+        """
+        Marks the beginning of the interval with the given name.
+        """
+        if not self.enabled:
+            return
+        self.intervals[name] = (timeit.default_timer(), self.counters.copy(),
+                                self.timers.copy())
+
+    def emitInterval(self, name, **fields):
+        """
+        Writes a record of the interval with the given name (with the given
+        extra fields), with the counts and times of each counter and timer
+        within it, and the rates of the counters per second.
+        """
+        if not self.enabled or name not in self.intervals:
+            return
+        start_time, start_counters, start_timers = self.intervals.pop(name)
+        seconds = timeit.default_timer() - start_time
+        counters = self._getDifferences(start_counters)
+        timers = {}
+        for (timer_name, (count, total)) in self.timers.copy().iteritems():
+            start_count, start_total = start_timers.get(timer_name, (0, 0.0))
+            timers[timer_name] = (count - start_count, total - start_total)
+        fields["seconds"] = seconds
+        fields["rates"] = self._getRates(counters, seconds)
+        self.emit(name, counters, timers, **fields)
+
+    def emitIfDue(self):
+        """
+        Writes a periodic record if INSTRUMENTATION_INTERVAL seconds passed
+        since the previous one.
+        """
+        if not self.enabled or self.path is None:
+            return
+        now = timeit.default_timer()
+        if now - self.last_emit_time < self.interval:
+            return
+        seconds = now - self.last_emit_time
+        rates = self._getRates(self._getDifferences(self.last_emit_counters),
+                               seconds)
+        self.emit("periodic", rates=rates)
+
+    def emit(self, event, counters=None, timers=None, **fields):
+        """
+        Appends a record of the given event to the file, with the given extra
+        fields, the current values, and the given counters and timers (by
+        default their totals).
+        """
+        if not self.enabled or self.path is None:
+            return
+        if counters is None:
+            counters = self.counters.copy()
+        if timers is None:
+            timers = self.timers.copy()
+        now = timeit.default_timer()
+        record = {
+            "event": event,
+            "time": time.time(),
+            "elapsed": now - self.start_time,
+            "values": self.values.copy(),
+            "counters": counters,
+            "timers": dict([(name, {"count": count, "seconds": seconds})
+                            for (name, (count, seconds))
+                            in timers.iteritems()]),
+        }
+        record.update(fields)
+
+        dirpath = os.path.dirname(self.path)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        f = file(self.path, "a")
+        try:
+            f.write("%s\n" % json.dumps(record, sort_keys=True))
+        finally:
+            f.close()
+
+        self.last_emit_time = now
+        self.last_emit_counters = self.counters.copy()
+
+    def _reset(self):
+        """
+        Starts all of the counters, timers and values over.
+        """
+        self.counters = {}
+        self.timers = {}
+        self.timer_starts = {}
+        self.values = {}
+        self.intervals = {}
+        self.start_time = timeit.default_timer()
+        self.last_emit_time = self.start_time
+        self.last_emit_counters = {}
+
+    def _getDifferences(self, start_counters):
+        """
+        Returns the amount each counter was increased by since it had the
+        given values.
+        """
+        return dict([(name, amount - start_counters.get(name, 0))
+                     for (name, amount) in self.counters.copy().iteritems()])
+
+    def _getRates(self, counters, seconds):
+        """
+        Returns the rates per second of the given counts over the given time.
+        """
+        if seconds <= 0.0:
+            return {}
+        return dict([(name, amount / seconds)
+                     for (name, amount) in counters.iteritems()])
+
+# The instrumentation of this process.
+instruments = Instrumentation()
@@ -8,6 +8,10 @@ class LiquidCrystalSystem:
     It holds the positions and angles of molecules in a liquid crystal, and can
     perform a Monte Carlo Metropolis cooling of the liquid crystal.
     """
+    # The neighbour topologies calculated so far, shared by all systems (see
+    # getNeighbourTopology).
+    neighbour_topologies = {}
+
     def __init__(self, parameters, initial_temperature, 
                  initial_spins=None, initial_locations=None,
                  original_locations=None):
@@ -15,6 +19,8 @@ class LiquidCrystalSystem:
         Initializes the system from the given dimensions (or the default) and
         an initial nested list of initial angles, as well as the temperature.
         If no initial system properties are given it is randomly set up.
+        The initial properties may be given either as (N, d) arrays indexed by
+        the flat cell index, or as nested lists (as in older state files).
         """
         DIMENSIONS = parameters["DIMENSIONS"]
         BOUNDARY_CONDITIONS = parameters["BOUNDARY_CONDITIONS"]
@@ -32,6 +38,16 @@ class LiquidCrystalSystem:
         self.boundary_conditions = BOUNDARY_CONDITIONS[:]
         self.spacing = INITIAL_SPACING[:]
 
+        # Each property is held in one contiguous (N, d) array, where the row
+        # of a cell is its flat index (the first dimension changes fastest, in
+        # the same order as getSystemIndexIterator).
+        self.num_cells = reduce(lambda a,b: a*b, self.dimensions, 1)
+        self.strides = []
+        stride = 1
+        for dimension in self.dimensions:
+            self.strides.append(stride)
+            stride *= dimension
+
         if initial_spins is None:
             initial_spins = self.createPropertyList(
                     lambda indices: CreateNormalizedVector(
@@ -40,7 +56,7 @@ class LiquidCrystalSystem:
                                             INITIAL_SPIN_ORIENTATION[i] +
                                             INITIAL_SPIN_ORIENTATION_STDEV[i])
                              for i in range(len(indices))]))
-        self.spins = initial_spins
+        self.spins = self.toPropertyArray(initial_spins)
 
         if initial_locations is None:
             initial_locations = self.createPropertyList(
@@ -50,14 +66,22 @@ class LiquidCrystalSystem:
                                             index * INITIAL_SPACING[i] +
                                             INITIAL_SPACING_STDEV[i])
                              for i, index in enumerate(indices)]))
-        self.locations = initial_locations
+        self.locations = self.toPropertyArray(initial_locations)
 
         if original_locations is None:
             original_locations = self.createPropertyList(
                     lambda indices: array(
                             [index * INITIAL_SPACING[i]
                              for i, index in enumerate(indices)]))
-        self.original_locations = original_locations
+        self.original_locations = self.toPropertyArray(original_locations)
+
+        # The sums of the spins and of their outer products (from which the
+        # order of the system is measured), kept up to date as spins are set.
+        self.updateSpinSums()
+
+        # The journal of changed cells, if one is being recorded (see
+        # startJournal).
+        self.journal = None
 
     def copy(self):
         """
@@ -71,6 +95,50 @@ class LiquidCrystalSystem:
                                   spins, locations, original_locations)
         return lcs
 
+    def startJournal(self):
+        """
+        Starts recording a journal of the cells that are changed from now on,
+        so that the system can be rolled back to its current state with
+        rollbackJournal without copying the whole system.
+        """
+        self.journal = {}
+
+    def stopJournal(self):
+        """
+        Stops recording the journal, keeping all of the changes made since it
+        was started.
+        """
+        self.journal = None
+
+    def rollbackJournal(self):
+        """
+        Rolls back all of the cells changed since the journal was started to
+        their original spins and locations, and stops recording the journal.
+        """
+        for (flat_index, (spin, location)) in self.journal.iteritems():
+            self._updateSpinSums(self.spins[flat_index], spin)
+            self.spins[flat_index] = spin
+            self.locations[flat_index] = location
+        self.journal = None
+
+        # Any data the potential cached from the changed locations is stale.
+        self.potential.update()
+
+    def getSummary(self):
+        """
+        Returns a summary of the current measurable values of the system (see
+        LiquidCrystalSystemSummary).
+        """
+        return LiquidCrystalSystemSummary(self)
+
+    def getSnapshot(self, potential_energy=None):
+        """
+        Returns a snapshot of the current state of the system (see
+        LiquidCrystalSystemSnapshot), with the given potential energy if it is
+        already known.
+        """
+        return LiquidCrystalSystemSnapshot(self, potential_energy)
+
     def getTemperature(self):
         """
         Returns the current system temperature.
@@ -88,7 +156,7 @@ class LiquidCrystalSystem:
         Calculates and returns the thermal energy of the system.
         """
         d = len(self.dimensions)
-        N = reduce(lambda a,b: a*b, self.dimensions, 1)
+        N = self.num_cells
         T = self.temperature
         return d * 0.5 * N * kB * T
 
@@ -97,13 +165,7 @@ class LiquidCrystalSystem:
         Calculates and returns the potential energy of the system.
         """
         self.potential.update()
-
-        h = 0
-        index_iterator = self.getSystemIndexIterator()
-        for indices in index_iterator:
-            h += self.getPotentialEnergyForSpin(indices)
-
-        return h
+        return self.potential.calculateTotal(self)
 
     def getPotentialEnergyForSpin(self, indices):
         """
@@ -111,6 +173,15 @@ class LiquidCrystalSystem:
         """
         return self.potential.calculate(self, indices)
 
+    def getPotentialEnergyDifferenceForSpin(self, indices, new_spin,
+                                            new_location):
+        """
+        Calculate the change in the potential energy for the spin at the given
+        indices if its spin and location were changed to the given ones (the
+        system itself is not changed).
+        """
+        return self.potential.deltaEnergy(self, indices, new_spin, new_location)
+
     def getCanonicalEnsembleProbability(self, energy=None):
         """
         Calculates the non-normalized canonical ensemble probability of the
@@ -127,35 +198,67 @@ class LiquidCrystalSystem:
         Calculates the average spin orientation of the system, indicating how
         ordered the system is.
         """
-        sum_spin = array([0.0 for i in range(len(self.dimensions))])
-        spin_iterator = self.getSystemPropertyIterator(self.spins)
-        num_spins = 0
-        for spin in spin_iterator:
-            sum_spin += spin
-            num_spins += 1
-        return sum_spin / num_spins
+        return self.spin_sum / self.num_cells
 
     def getSpinOrientationVariance(self):
         """
         Calculates the variance of the spin orientation compared to the average
         (a value close to 0 is ordered).
         """
-        spin_variance = 0.0
-        average_spin = self.getAverageSpinOrientation()
-        spin_iterator = self.getSystemPropertyIterator(self.spins)
-        num_spins = 0
-        for spin in spin_iterator:
-            average_diff_spin = spin - average_spin
-            spin_variance += dot(average_diff_spin, average_diff_spin)
-            num_spins += 1
-        spin_variance /= len(self.spins)
+        # The sum of the squared differences from the average spin is
+        # sum(|s|^2) - |sum(s)|^2 / N.
+        spin_variance = (trace(self.spin_tensor_sum) -
+                         dot(self.spin_sum, self.spin_sum) / self.num_cells)
+        spin_variance = max(spin_variance, 0.0)
+
+        # This is normalized by the size of the first dimension, as it always
+        # was with the nested list storage, so results stay comparable with
+        # previous runs.
+        spin_variance /= self.dimensions[0]
         return spin_variance
 
+    def getOrderTensor(self):
+        """
+        Returns the nematic order tensor (Q-tensor) of the system, which is
+        d/(d-1) * (<s s> - I/d) for the spins s in d dimensions.
+        """
+        d = len(self.dimensions)
+        return (d / (d - 1.0)) * (self.spin_tensor_sum / self.num_cells -
+                                  identity(d) / float(d))
+
+    def getNematicOrderParameter(self):
+        """
+        Returns the nematic order parameter S of the system, the largest
+        eigenvalue of its order tensor (1 is completely ordered, and close to 0
+        is isotropic).
+        """
+        return linalg.eigvalsh(self.getOrderTensor()).max()
+
+    def updateSpinSums(self):
+        """
+        Recalculates the sums of the spins and of their outer products from all
+        of the spins.
+        This must be called if the spins array is replaced or changed directly,
+        instead of through setSpin, setProperty or setCellProperties, which
+        update the sums as each spin is changed.
+        """
+        self.spin_sum = self.spins.sum(axis=0)
+        self.spin_tensor_sum = dot(self.spins.T, self.spins)
+
+    def _updateSpinSums(self, old_spin, new_spin):
+        """
+        Updates the sums of the spins and of their outer products when a spin
+        is changed from the given old spin to the given new one.
+        """
+        self.spin_sum += new_spin - old_spin
+        self.spin_tensor_sum += (outer(new_spin, new_spin) -
+                                 outer(old_spin, old_spin))
+
     def getSpin(self, indices):
         """
         Returns the spin of the given set of indices.
         """
-        return self.getProperty(self.spins, indices)
+        return self.getProperty(self.spins, indices).copy()
 
     def setSpin(self, indices, spin):
         """
@@ -171,20 +274,47 @@ class LiquidCrystalSystem:
         translated accordingly.
         """
         # If no locations list was given, default to self.locations.
-        if not locations:
+        if locations is None:
             locations = self.locations
 
-        # Get the location property.
+        # Get the location property, and translate it if necessary.
         location = self.getProperty(locations, indices).copy()
-        
-        # Translate it if necessary.
+        location += self.getLocationTranslation(indices)
+        return location
+
+    def getLocationTranslation(self, indices):
+        """
+        Returns the translation that getLocation adds to the location of the
+        cell with the given indices (zero unless any of the indices are outside
+        of the system in a dimension with periodic boundary conditions).
+        """
+        translation = zeros(len(self.dimensions))
         for (dim, index) in enumerate(indices):
             if self.boundary_conditions[dim] == "P" and \
                (index < 0 or index >= self.dimensions[dim]):
-                location[dim] += ((index / self.dimensions[dim]) *
-                                  self.spacing[dim])
-
-        return location
+                translation[dim] = ((index / self.dimensions[dim]) *
+                                    self.spacing[dim])
+        return translation
+
+    def setCellProperties(self, flat_indices, spins, locations):
+        """
+        Sets the spins and locations of all of the cells with the given flat
+        indices at once (the locations must not be translated).
+        If a journal is being recorded, the original spin and location of each
+        cell are recorded the first time it is changed.
+        """
+        if self.journal is not None:
+            for flat_index in flat_indices:
+                if flat_index not in self.journal:
+                    self.journal[flat_index] = (
+                            self.spins[flat_index].copy(),
+                            self.locations[flat_index].copy())
+        old_spins = self.spins[flat_indices]
+        self.spin_sum += spins.sum(axis=0) - old_spins.sum(axis=0)
+        self.spin_tensor_sum += (dot(spins.T, spins) -
+                                 dot(old_spins.T, old_spins))
+        self.spins[flat_indices] = spins
+        self.locations[flat_indices] = locations
 
     def setLocation(self, indices, location):
         """
@@ -342,6 +472,93 @@ class LiquidCrystalSystem:
 
         return neighbour_list
 
+    def getNeighbourTopology(self, index_ranges):
+        """
+        Returns the NeighbourTopology of all of the cells in the system with
+        the neighbours within the given index ranges of each (as returned by
+        getCellNeighboursList).
+        The topology only depends on the dimensions, boundary conditions and
+        spacing of the system, so it is calculated once and shared by all of
+        the systems (and their copies) with the same ones.
+        """
+        key = (tuple(self.dimensions), tuple(self.boundary_conditions),
+               tuple(self.spacing), tuple(index_ranges))
+        if key not in LiquidCrystalSystem.neighbour_topologies:
+            cell_neighbour_lists = [
+                    (indices[:], self.getCellNeighboursList(indices,
+                                                            index_ranges))
+                    for indices in self.getSystemIndexIterator()]
+            LiquidCrystalSystem.neighbour_topologies[key] = NeighbourTopology(
+                    self.getNeighbourPairArrays(cell_neighbour_lists),
+                    self.num_cells)
+        return LiquidCrystalSystem.neighbour_topologies[key]
+
+    def getNeighbourPairArrays(self, cell_neighbour_lists):
+        """
+        Returns the given neighbours of cells as flat arrays of pairs, where
+        each pair is a cell and one of its neighbours, for calculating the
+        potential of all of the pairs at once.
+        The cell neighbour lists should be an iterable of tuples of the form:
+        (indices, neighbour indices list).
+        Returns a tuple of: (cell flat indices, neighbour flat indices,
+        neighbour location translations), so the distance vector between the
+        two cells of pair m is:
+        locations[cells[m]] - locations[neighbours[m]] - translations[m]
+        """
+        cells = []
+        neighbours = []
+        translations = []
+        for (indices, neighbour_list) in cell_neighbour_lists:
+            flat_index = self.getFlatIndex(indices)
+            for n_indices in neighbour_list:
+                cells.append(flat_index)
+                neighbours.append(self.getFlatIndex(n_indices))
+                translations.append(self.getLocationTranslation(n_indices))
+
+        translations = array(translations, dtype=float64).reshape(
+                (len(cells), len(self.dimensions)))
+        return (array(cells, dtype=int), array(neighbours, dtype=int),
+                translations)
+
+    def getSublattices(self, index_ranges):
+        """
+        Splits the system into sublattices, such that no two cells in the same
+        sublattice are within the given index ranges of each other (so they are
+        not neighbours), and returns a list of arrays of the flat indices of the
+        cells in each sublattice.
+        For an index range of 1 in all dimensions this is a checkerboard-like
+        colouring of the system into 2^d sublattices (more if a dimension with
+        periodic boundary conditions has an odd size).
+        """
+        # Find the number of colours to use in each dimension, so that cells
+        # with the same colour are always more than the index range apart.
+        # With periodic boundary conditions the number of colours must also
+        # divide the dimension, so that this holds across the boundary.
+        num_colours = []
+        for (dim, dimension) in enumerate(self.dimensions):
+            colours = min(index_ranges[dim] + 1, dimension)
+            if self.boundary_conditions[dim] == "P":
+                while dimension % colours != 0:
+                    colours += 1
+            num_colours.append(colours)
+
+        # Give each cell the flat index of its colour among all of the colours.
+        colour_strides = []
+        stride = 1
+        for colours in num_colours:
+            colour_strides.append(stride)
+            stride *= colours
+        cell_colours = []
+        index_iterator = self.getSystemIndexIterator()
+        for indices in index_iterator:
+            cell_colours.append(sum([(index % num_colours[dim]) *
+                                     colour_strides[dim]
+                                     for (dim, index) in enumerate(indices)]))
+        cell_colours = array(cell_colours)
+
+        return [nonzero(cell_colours == colour)[0]
+                for colour in range(stride)]
+
     def _calculateNeighbourIndexRangeBoundaries(self,
                                                 cell_indices,
                                                 index_ranges,
@@ -416,79 +633,78 @@ class LiquidCrystalSystem:
     def getSystemPropertyIterator(self, property_values):
         """
         Returns an iterator that returns on each call to next a value from the
-        given system property list, such as angles.
-        The system property values must be of the system dimensions.
+        given system property array, such as spins.
+        The values are returned in the order of getSystemIndexIterator.
         """
-        class SystemPropertyIterator:
-            def __init__(self, propety_values, index_iterator):
-                self._property_values = property_values
-                self._index_iterator = index_iterator
+        return iter(property_values)
 
-            def __iter__(self):
-                return self
-
-            def next(self):
-                index_list = self._index_iterator.next()
-                value_list = self._property_values
-                for i in index_list:
-                    value_list = value_list[i]
-                return value_list
+    def getFlatIndex(self, indices):
+        """
+        Returns the flat index (the row in the property arrays) of the cell
+        pointed to by the given indices, wrapping them into the system.
+        """
+        flat_index = 0
+        for (dim, index) in enumerate(indices):
+            flat_index += (index % self.dimensions[dim]) * self.strides[dim]
+        return flat_index
 
-        index_iterator = self.getSystemIndexIterator()
-        return SystemPropertyIterator(property_values, index_iterator)
-    
     def createPropertyList(self, value_generator):
         """
-        Creates and returns a multi-dimensional list populated with values
+        Creates and returns an (N, d) property array populated with values
         returned from the given value generator function that is given the
         list of indices of the current value to generate.
         """
         index_iterator = self.getSystemIndexIterator()
-        value_list = []
-        for indices in index_iterator:
-            current_values = value_list
-            for (i, index) in enumerate(indices):
-                if index >= len(current_values):
-                    current_values.extend(
-                            [[] for j in range(self.dimensions[i])])
-                if i == len(self.dimensions) - 1:
-                    current_values[index] = value_generator(indices)
-                else:
-                    current_values = current_values[index]
-
-        return value_list
+        value_list = [value_generator(indices) for indices in index_iterator]
+        return array(value_list, dtype=float64)
+
+    def toPropertyArray(self, property_values):
+        """
+        Returns the given property values as an (N, d) property array (float
+        arrays, such as memory mapped state files, are used without copying).
+        Nested lists of per cell values (as used by older state files) are
+        flattened in the order of getSystemIndexIterator.
+        """
+        if isinstance(property_values, ndarray):
+            return asarray(property_values, dtype=float64)
+
+        def get_nested_value(indices):
+            current_values = property_values
+            for index in indices:
+                current_values = current_values[index]
+            return current_values
+
+        return self.createPropertyList(get_nested_value)
 
     def copyPropertyList(self, property_values):
         """
-        Returns a complete deep copy of the given property values
-        multi-dimensional list.
+        Returns a complete copy of the given property values array.
         """
-        return self.createPropertyList(
-            lambda indices: self.getProperty(property_values, indices).copy())
+        return property_values.copy()
 
     def getProperty(self, property_values, indices):
         """
         Returns the property value pointed to by the given indices into the
-        given property values multi-dimensional list.
+        given property values array.
+        NOTE: The returned value is a view into the array, so it changes if the
+              property of the cell is set later on.
         """
-        current_values = property_values
-        for (dim, index) in enumerate(indices):
-            real_index = index % self.dimensions[dim]
-            current_values = current_values[real_index]
-        return current_values
+        return property_values[self.getFlatIndex(indices)]
 
     def setProperty(self, property_values, indices, new_value):
         """
         Sets the property value pointed to by the given indices into the given
-        property values multi-dimensional list to the given new value.
-        """
-        current_values = property_values
-        for (dim, index) in enumerate(indices):
-          real_index = index % self.dimensions[dim]
-          if dim == len(self.dimensions) - 1:
-              current_values[real_index] = new_value
-          else:
-              current_values = current_values[real_index]
+        property values array to the given new value.
+        If a journal is being recorded, the original spin and location of the
+        cell are recorded the first time it is changed.
+        """
+        flat_index = self.getFlatIndex(indices)
+        if self.journal is not None and flat_index not in self.journal:
+            self.journal[flat_index] = (self.spins[flat_index].copy(),
+                                        self.locations[flat_index].copy())
+        if property_values is self.spins:
+            self._updateSpinSums(property_values[flat_index], new_value)
+        property_values[flat_index] = new_value
 
     def outputToAvizFile(self, filepath):
         """
@@ -549,26 +765,7 @@ class LiquidCrystalSystem:
         """
         Outputs the current information such as <U>, Cv etc to a text file.
         """
-        dirpath = os.path.dirname(filepath)
-        if not os.path.isdir(dirpath):
-            os.makedirs(dirpath)
-
-        T = self.getTemperature()
-        avg_energy = self.getPotentialEnergy()
-
-        avg_director = self.getAverageSpinOrientation()
-        INITIAL_SPIN_ORIENTATION = self.parameters["INITIAL_SPIN_ORIENTATION"]
-        dot_with_original_director = dot(avg_director,
-                                         array(INITIAL_SPIN_ORIENTATION))
-        director_variance = self.getSpinOrientationVariance()
-
-        f = file(filepath, "a")
-        f.write("[%s]\t%s\t%s\t%s\t%s\t%s\n" %
-                (time.clock(), T, avg_energy, avg_director,
-                 dot_with_original_director,
-                 director_variance))
-        f.flush()
-        f.close()
+        self.getSummary().outputInformationToFile(filepath)
 
     def print2DSystem(self):
         """
@@ -596,3 +793,125 @@ class LiquidCrystalSystem:
                                               angle / math.pi),
         print
         print
+
+class NeighbourTopology:
+    """
+    This class holds pairs of cells and their neighbours in flat arrays sorted
+    by cell (in the format returned by getNeighbourPairArrays), along with
+    offsets into them for each cell (a CSR layout), so that the pairs of the
+    cell with flat index i are at offsets[i]:offsets[i+1].
+    The arrays are read only, since they may be shared by many systems.
+    """
+    def __init__(self, pair_arrays, num_cells):
+        """
+        Initializes the topology from the given (cells, neighbours,
+        translations) pair arrays, where the pairs are sorted by cell.
+        """
+        self.cells, self.neighbours, self.translations = pair_arrays
+        counts = bincount(self.cells, minlength=num_cells)
+        self.offsets = concatenate(([0], cumsum(counts)))
+
+        for values in (self.cells, self.neighbours, self.translations,
+                       self.offsets):
+            values.flags.writeable = False
+
+    def getNeighbours(self, flat_index):
+        """
+        Returns the neighbours of the cell with the given flat index as a tuple
+        of (neighbour flat indices, neighbour location translations).
+        """
+        start = self.offsets[flat_index]
+        end = self.offsets[flat_index + 1]
+        return (self.neighbours[start:end], self.translations[start:end])
+
+    def getPairArrays(self):
+        """
+        Returns all of the pairs, in the format returned by
+        getNeighbourPairArrays.
+        """
+        return (self.cells, self.neighbours, self.translations)
+
+class LiquidCrystalSystemSummary:
+    """
+    This class holds the measurable values of a LiquidCrystalSystem (such as
+    its potential energy) at the time it was created.
+    It can stand in for the system when comparing it to a newer state with a
+    new state selector, after the system itself has been changed.
+    """
+    def __init__(self, lcs, potential_energy=None):
+        """
+        Measures and keeps the values of the given system (with the given
+        potential energy if it is already known).
+        """
+        if potential_energy is None:
+            potential_energy = lcs.getPotentialEnergy()
+        self.parameters = lcs.parameters
+        self.clock = time.clock()
+        self.temperature = lcs.getTemperature()
+        self.potential_energy = potential_energy
+        self.average_spin_orientation = lcs.getAverageSpinOrientation()
+        self.spin_orientation_variance = lcs.getSpinOrientationVariance()
+
+    def getTemperature(self):
+        """
+        Returns the system temperature.
+        """
+        return self.temperature
+
+    def getPotentialEnergy(self):
+        """
+        Returns the potential energy of the system.
+        """
+        return self.potential_energy
+
+    def getAverageSpinOrientation(self):
+        """
+        Returns the average spin orientation of the system.
+        """
+        return self.average_spin_orientation
+
+    def getSpinOrientationVariance(self):
+        """
+        Returns the variance of the spin orientation of the system.
+        """
+        return self.spin_orientation_variance
+
+    def outputInformationToFile(self, filepath):
+        """
+        Outputs the information such as <U>, Cv etc to a text file.
+        """
+        dirpath = os.path.dirname(filepath)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+
+        INITIAL_SPIN_ORIENTATION = self.parameters["INITIAL_SPIN_ORIENTATION"]
+        dot_with_original_director = dot(self.average_spin_orientation,
+                                         array(INITIAL_SPIN_ORIENTATION))
+
+        f = file(filepath, "a")
+        f.write("[%s]\t%s\t%s\t%s\t%s\t%s\n" %
+                (self.clock, self.temperature, self.potential_energy,
+                 self.average_spin_orientation, dot_with_original_director,
+                 self.spin_orientation_variance))
+        f.flush()
+        f.close()
+
+class LiquidCrystalSystemSnapshot(LiquidCrystalSystemSummary):
+    """
+    This class holds a copy of the arrays of a LiquidCrystalSystem along with
+    its measurable values, at the time it was created.
+    It can stand in for the system when writing it to a state, a trajectory
+    frame or an information file, so the writing can be done in the
+    background while the system itself is changed.
+    """
+    def __init__(self, lcs, potential_energy=None):
+        """
+        Copies the arrays of the given system, and measures and keeps its
+        values (with the given potential energy if it is already known).
+        """
+        LiquidCrystalSystemSummary.__init__(self, lcs, potential_energy)
+        self.dimensions = lcs.dimensions[:]
+        self.num_cells = lcs.num_cells
+        self.spins = lcs.spins.copy()
+        self.locations = lcs.locations.copy()
+        self.original_locations = lcs.original_locations.copy()
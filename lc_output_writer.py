@@ -0,0 +1,93 @@
+import atexit
+import sys
+import threading
+import Queue
+
+class LiquidCrystalSystemOutputWriter:
+    """
+    This class writes the output of a run (states, trajectory frames,
+    information lines and so on) in a background thread, so the algorithm
+    doesn't wait for the disk while it keeps changing the system.
+    Each write is a call that is queued and performed by the thread in the
+    order it was queued, and should only be given snapshots of the system
+    (see LiquidCrystalSystemSnapshot), never the system itself.
+    The queue holds at most OUTPUT_QUEUE_SIZE writes, after which queuing
+    waits for the thread to catch up, so the snapshots never take more than a
+    bounded amount of memory. A queue size of 0 performs the writes right away
+    instead.
+    Errors in the thread are raised by the next write or flush.
+    The writes that are still queued when the process exits are completed.
+    """
+
+    def __init__(self, parameters):
+        self.queue_size = int(parameters.get("OUTPUT_QUEUE_SIZE", 8))
+        self.queue = None
+        self.thread = None
+        self.error = None
+        atexit.register(self.close)
+
+    def write(self, function, *args, **kwargs):
+        """
+        Queues a call of the given function with the given arguments.
+        """
+        self._raiseError()
+        if self.queue_size == 0:
+            function(*args, **kwargs)
+            return
+
+        if self.thread is None:
+            self.queue = Queue.Queue(self.queue_size)
+            self.thread = threading.Thread(target=self._run)
+            self.thread.setDaemon(True)
+            self.thread.start()
+        self.queue.put((function, args, kwargs))
+
+    def flush(self):
+        """
+        Waits until all of the queued writes are completed.
+        """
+        if self.thread is not None:
+            self.queue.join()
+        self._raiseError()
+
+    def close(self):
+        """
+        Completes all of the queued writes, and stops the thread (it is
+        started again by the next write).
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.queue = None
+        self._raiseError()
+
+    def _run(self):
+        """
+        Performs the queued writes until it gets None. Once a write failed,
+        the following ones are skipped.
+        """
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    function, args, kwargs = item
+                    try:
+                        function(*args, **kwargs)
+                    except:
+                        self.error = sys.exc_info()
+            finally:
+                self.queue.task_done()
+
+    def _raiseError(self):
+        """
+        Raises the error of a write that failed in the thread, if there was
+        one.
+        """
+        if self.error is not None:
+            error_type, error, traceback = self.error
+            self.error = None
+            raise error_type, error, traceback
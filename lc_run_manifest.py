@@ -0,0 +1,116 @@
+import os
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+class LiquidCrystalRunManifest:
+    """
+    This class manages the manifest of a run, a small JSON file in the run
+    directory that records the rounds (temperatures) that each phase of the
+    run completed, and whether the whole run is complete.
+    Each completed round is recorded with its temperature, the name and number
+    of the state the system was in at its end, its potential energy and the
+    time it completed, so a run is resumed by loading only the state of the
+    last completed round, and a complete run is recognized without looking at
+    its states at all.
+    The manifest is rewritten to a temporary file and moved into place on each
+    update, so it is always complete even if the run is killed.
+    """
+    MANIFEST_FILENAME = "manifest.json"
+
+    def __init__(self, parameters):
+        self.path = os.path.join(str(parameters["RUN_DIR"]),
+                                 self.MANIFEST_FILENAME)
+
+    def exists(self):
+        """
+        Returns true if the run has a manifest (older runs don't).
+        """
+        return os.path.exists(self.path)
+
+    def hasPhase(self, phase):
+        """
+        Returns true if the phase with the given name (the parameter prefix of
+        its algorithm) was started.
+        """
+        return phase in self._read()["phases"]
+
+    def getRounds(self, phase):
+        """
+        Returns the list of the rounds the phase with the given name completed,
+        each as a dictionary of: round, temperature, state, state_number,
+        energy and time.
+        """
+        return self._read()["phases"].get(phase, [])
+
+    def isComplete(self):
+        """
+        Returns true if the whole run is complete.
+        """
+        return self._read()["complete"]
+
+    def startPhase(self, phase):
+        """
+        Records that the phase with the given name was started, without any
+        completed rounds yet.
+        """
+        manifest = self._read()
+        if phase not in manifest["phases"]:
+            manifest["phases"][phase] = []
+            self._write(manifest)
+
+    def addRound(self, phase, round_number, temperature, state_name,
+                 state_number, energy):
+        """
+        Records that the phase with the given name completed the round with
+        the given number and temperature, at the end of which the system was
+        in the state with the given name and number, with the given potential
+        energy.
+        """
+        manifest = self._read()
+        manifest["phases"].setdefault(phase, []).append({
+            "round": round_number,
+            "temperature": temperature,
+            "state": state_name,
+            "state_number": state_number,
+            "energy": energy,
+            "time": time.time(),
+        })
+        self._write(manifest)
+
+    def setComplete(self):
+        """
+        Records that the whole run is complete.
+        """
+        manifest = self._read()
+        manifest["complete"] = True
+        self._write(manifest)
+
+    def _read(self):
+        """
+        Reads the manifest, or returns an empty one if there is none.
+        """
+        if not os.path.exists(self.path):
+            return {"phases": {}, "complete": False}
+        manifest_file = file(self.path, "r")
+        try:
+            return json.load(manifest_file)
+        finally:
+            manifest_file.close()
+
+    def _write(self, manifest):
+        """
+        Writes the given manifest to a temporary file and moves it into place.
+        """
+        temp_path = "%s.tmp" % self.path
+        manifest_file = file(temp_path, "w")
+        try:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        finally:
+            manifest_file.close()
+        if os.name == "nt" and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
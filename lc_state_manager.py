@@ -4,6 +4,14 @@ import pickle
 import re
 import shutil
 
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+import numpy
+
+from instrumentation import instruments
 from lc import LiquidCrystalSystem
 
 class LiquidCrystalSystemStateManager:
@@ -13,7 +21,39 @@ class LiquidCrystalSystemStateManager:
     it.
     The states stored in the manager are persistent and can be loaded and saved
     in different runs.
+    Each state is stored in a binary file of a small header (see
+    STATE_HEADERS) followed by the dimensions and then the raw spins, locations
+    and original locations arrays, so that states can be loaded with
+    numpy.memmap without reading or copying any more than the fields that are
+    used.
+    Older pickled state files are still loaded.
     """
+    STATE_MAGIC = "LCSSTATE"
+    STATE_VERSION = 2
+    STATE_PREFIX_HEADER = numpy.dtype([("magic", "S8"),
+                                       ("version", "<u4")])
+    STATE_HEADERS = {
+        1: numpy.dtype([("magic", "S8"),
+                        ("version", "<u4"),
+                        ("num_dimensions", "<u4"),
+                        ("temperature", "<f8"),
+                        ("round_number", "<i8"),
+                        ("step_number", "<i8"),
+                        ("model_hash", "S32")]),
+        # Version 2 added the proposal widths of the algorithm (NaN if they
+        # were not given).
+        2: numpy.dtype([("magic", "S8"),
+                        ("version", "<u4"),
+                        ("num_dimensions", "<u4"),
+                        ("temperature", "<f8"),
+                        ("round_number", "<i8"),
+                        ("step_number", "<i8"),
+                        ("model_hash", "S32"),
+                        ("spin_stdev", "<f8"),
+                        ("spacing_stdev", "<f8")]),
+    }
+    STATE_ARRAYS = ["spins", "locations", "original_locations"]
+
     def __init__(self, parameters):
         LCS_REPOSITORY_LOCATION = os.path.join(
             str(parameters["RUN_DIR"]),
@@ -35,6 +75,8 @@ class LiquidCrystalSystemStateManager:
                 state_name = s.groups()[0]
                 self.state_repository[state_name] = state_path
 
+        self.model_hash = self._getModelHash()
+
     def getStateNames(self):
         """
         Returns all of the state names currently held in the repository.
@@ -45,41 +87,152 @@ class LiquidCrystalSystemStateManager:
         """
         Loads the state with the given name and returns a LiquidCrystalSystem
         object loaded with it.
+        The arrays of the system are memory mapped copy-on-write, so changing
+        the system never changes the state file.
         If the given state name is not in the repository, None is returned.
         """
         if state_name not in self.state_repository:
             return None
 
-        state_path = self.state_repository[state_name]
-        state_data = pickle.load(file(state_path, "r"))
+        instruments.startTimer("state_load")
+        instruments.count("state_loads")
+        header = self.loadStateHeader(state_name)
+        if header is None:
+            lcs = self._loadPickledState(state_name)
+            instruments.stopTimer("state_load")
+            return lcs
 
-        temperature = state_data["temperature"]
-        spins = state_data["spins"]
-        locations = state_data["locations"]
+        lcs = LiquidCrystalSystem(
+                parameters=self.parameters,
+                initial_temperature=header["temperature"],
+                initial_spins=self.loadStateArray(state_name, "spins", "c"),
+                initial_locations=self.loadStateArray(state_name, "locations",
+                                                      "c"),
+                original_locations=self.loadStateArray(state_name,
+                                                       "original_locations",
+                                                       "c"))
+        instruments.stopTimer("state_load")
+        return lcs
 
-        return LiquidCrystalSystem(parameters=self.parameters,
-                                   initial_temperature=temperature,
-                                   initial_spins=spins,
-                                   initial_locations=locations)
+    def loadStateHeader(self, state_name):
+        """
+        Reads only the header of the state with the given name, and returns it
+        as a dictionary of: version, temperature, dimensions, model_hash,
+        round_number, step_number, spin_stdev and spacing_stdev (the widths are
+        None if they were not saved).
+        If the given state name is not in the repository, or the state is an
+        older pickled state, None is returned.
+        """
+        if state_name not in self.state_repository:
+            return None
+
+        state_file = file(self.state_repository[state_name], "rb")
+        try:
+            header = numpy.fromfile(state_file, dtype=self.STATE_PREFIX_HEADER,
+                                    count=1)
+            if len(header) == 0 or header["magic"][0] != self.STATE_MAGIC:
+                return None
+            version = int(header["version"][0])
+            if version not in self.STATE_HEADERS:
+                raise Exception("Unsupported state version %s in '%s'" % (
+                        version, self.state_repository[state_name]))
+            state_file.seek(0)
+            header = numpy.fromfile(state_file,
+                                    dtype=self.STATE_HEADERS[version],
+                                    count=1)[0]
+            dimensions = numpy.fromfile(state_file, dtype="<i8",
+                                        count=int(header["num_dimensions"]))
+        finally:
+            state_file.close()
+
+        state_header = {
+            "version": version,
+            "temperature": float(header["temperature"]),
+            "dimensions": [int(dimension) for dimension in dimensions],
+            "model_hash": str(header["model_hash"]),
+            "round_number": int(header["round_number"]),
+            "step_number": int(header["step_number"]),
+            "spin_stdev": None,
+            "spacing_stdev": None,
+        }
+        if version >= 2:
+            for width_name in ["spin_stdev", "spacing_stdev"]:
+                if not numpy.isnan(header[width_name]):
+                    state_header[width_name] = float(header[width_name])
+        return state_header
+
+    def loadStateArray(self, state_name, array_name, mode="r"):
+        """
+        Returns a memory map of the array with the given name (one of
+        STATE_ARRAYS) in the state with the given name, opened with the given
+        numpy.memmap mode, without reading any of the other arrays.
+        If the given state name is not in the repository, None is returned.
+        """
+        header = self.loadStateHeader(state_name)
+        if header is None:
+            return None
+
+        num_dimensions = len(header["dimensions"])
+        num_cells = reduce(lambda a,b: a*b, header["dimensions"], 1)
+        array_size = num_cells * num_dimensions * 8
+        offset = (self.STATE_HEADERS[header["version"]].itemsize +
+                  num_dimensions * 8 +
+                  self.STATE_ARRAYS.index(array_name) * array_size)
+        return numpy.memmap(self.state_repository[state_name], dtype="<f8",
+                            mode=mode, offset=offset,
+                            shape=(num_cells, num_dimensions))
 
-    def saveState(self, state_name, lcs):
+    def saveState(self, state_name, lcs, round_number=0, step_number=0,
+                  spin_stdev=None, spacing_stdev=None):
         """
-        Saves the state of the given liquid crystal system under the state name.
+        Saves the state of the given liquid crystal system under the state name,
+        along with the given round and step counters of the algorithm, and the
+        widths of its proposals.
         This state can be loaded later with loadState under the saved name.
         If the given state name already exists, it will be overriden.
         """
-        state_data = {
-            "temperature": lcs.temperature,
-            "spins": lcs.spins,
-            "locations": lcs.locations,
-        }
+        instruments.startTimer("state_save")
+        header = numpy.zeros(1, dtype=self.STATE_HEADERS[self.STATE_VERSION])
+        header["magic"] = self.STATE_MAGIC
+        header["version"] = self.STATE_VERSION
+        header["num_dimensions"] = len(lcs.dimensions)
+        header["temperature"] = lcs.temperature
+        header["round_number"] = round_number
+        header["step_number"] = step_number
+        header["model_hash"] = self.model_hash
+        header["spin_stdev"] = numpy.nan
+        if spin_stdev is not None:
+            header["spin_stdev"] = spin_stdev
+        header["spacing_stdev"] = numpy.nan
+        if spacing_stdev is not None:
+            header["spacing_stdev"] = spacing_stdev
 
         state_path = os.path.join(self.repository_path,
                                   "%s.%s" % (state_name,
                                              self.repository_suffix))
-        self.state_repository[state_name] = state_path
 
-        pickle.dump(state_data, file(state_path, "w"))
+        # Write the state to a temporary file and move it into place, so that
+        # systems that were loaded from the previous file (and map it) are not
+        # affected. The state is only added to the repository once its file is
+        # in place, so it is never listed before it can be loaded.
+        temp_path = "%s.tmp" % state_path
+        state_file = file(temp_path, "wb")
+        try:
+            header.tofile(state_file)
+            numpy.asarray(lcs.dimensions, dtype="<i8").tofile(state_file)
+            for array_name in self.STATE_ARRAYS:
+                numpy.asarray(getattr(lcs, array_name),
+                              dtype="<f8").tofile(state_file)
+            state_size = state_file.tell()
+        finally:
+            state_file.close()
+        if os.name == "nt" and os.path.exists(state_path):
+            os.remove(state_path)
+        os.rename(temp_path, state_path)
+        self.state_repository[state_name] = state_path
+        instruments.count("state_saves")
+        instruments.count("state_save_bytes", state_size)
+        instruments.stopTimer("state_save")
 
     def importState(self, state_name, state_path):
         """
@@ -96,3 +249,31 @@ class LiquidCrystalSystemStateManager:
         self.state_repository[state_name] = dest_path
 
         return self.loadState(state_name)
+
+    def _loadPickledState(self, state_name):
+        """
+        Loads a state with the given name that was saved by pickling it, as
+        older versions did.
+        """
+        state_path = self.state_repository[state_name]
+        state_data = pickle.load(file(state_path, "r"))
+
+        temperature = state_data["temperature"]
+        spins = state_data["spins"]
+        locations = state_data["locations"]
+
+        return LiquidCrystalSystem(parameters=self.parameters,
+                                   initial_temperature=temperature,
+                                   initial_spins=spins,
+                                   initial_locations=locations)
+
+    def _getModelHash(self):
+        """
+        Returns the MD5 hash of the model file of the run, which identifies the
+        parameters the states were created with.
+        """
+        model_files = glob.glob(os.path.join(str(self.parameters["RUN_DIR"]),
+                                             "*.py"))
+        if not model_files:
+            return ""
+        return md5(file(model_files[0], "rb").read()).hexdigest()
@@ -0,0 +1,229 @@
+import os
+import time
+
+import numpy
+
+from lc import LiquidCrystalSystem
+
+class LiquidCrystalSystemTrajectory:
+    """
+    This class manages an append-only binary trajectory file of the states of
+    a LiquidCrystalSystem during a run phase (instead of a separate Aviz XYZ
+    file for each state).
+    Each frame is appended to the trajectory file as a small header (see
+    FRAME_HEADER) followed by the raw spins, locations and original locations
+    arrays, and then a record of its offset, time and temperature is appended
+    to an index file next to it (see FRAME_INDEX), so frames can be listed and
+    read without scanning the trajectory.
+    Since the index record is only written after the frame itself, a frame in
+    the index is always complete.
+    Aviz XYZ files of the frames can be exported on demand.
+    """
+    FRAME_MAGIC = "LCSF"
+    FRAME_HEADER = numpy.dtype([("magic", "S4"),
+                                ("num_dimensions", "<u4"),
+                                ("frame_number", "<i8"),
+                                ("num_cells", "<i8"),
+                                ("time", "<f8"),
+                                ("temperature", "<f8")])
+    FRAME_INDEX = numpy.dtype([("frame_number", "<i8"),
+                               ("offset", "<i8"),
+                               ("time", "<f8"),
+                               ("temperature", "<f8")])
+    FRAME_ARRAYS = ["spins", "locations", "original_locations"]
+
+    def __init__(self, filepath):
+        """
+        Uses the trajectory file at the given path, whose index file is at the
+        same path with an .idx extension.
+        """
+        self.filepath = filepath
+        self.index_filepath = "%s.idx" % os.path.splitext(filepath)[0]
+        self.end_offset = None
+
+    def appendFrame(self, frame_number, lcs):
+        """
+        Appends the current state of the given system to the trajectory as the
+        frame with the given number.
+        If the frame number is already in the trajectory (such as when a run is
+        resumed), the new frame replaces it.
+        """
+        dirpath = os.path.dirname(self.filepath)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+
+        header = numpy.zeros(1, dtype=self.FRAME_HEADER)
+        header["magic"] = self.FRAME_MAGIC
+        header["num_dimensions"] = len(lcs.dimensions)
+        header["frame_number"] = frame_number
+        header["num_cells"] = lcs.num_cells
+        header["time"] = time.time()
+        header["temperature"] = lcs.getTemperature()
+
+        # Anything after the end of the last indexed frame is left over from a
+        # frame that was not completely written, and is overwritten. The end
+        # is only looked up in the index once, and then kept track of.
+        if self.end_offset is None:
+            self.end_offset = self._getEndOffset()
+        offset = self.end_offset
+
+        f = file(self.filepath, "ab")
+        try:
+            f.truncate(offset)
+            f.seek(offset)
+            header.tofile(f)
+            for array_name in self.FRAME_ARRAYS:
+                numpy.asarray(getattr(lcs, array_name),
+                              dtype="<f8").tofile(f)
+            f.flush()
+        finally:
+            f.close()
+
+        index_record = numpy.zeros(1, dtype=self.FRAME_INDEX)
+        index_record["frame_number"] = frame_number
+        index_record["offset"] = offset
+        index_record["time"] = header["time"]
+        index_record["temperature"] = header["temperature"]
+        f = file(self.index_filepath, "ab")
+        try:
+            index_record.tofile(f)
+            f.flush()
+        finally:
+            f.close()
+        self.end_offset = offset + self._getFrameSize(header[0])
+
+    def exists(self):
+        """
+        Returns true if the trajectory has been created.
+        """
+        return os.path.exists(self.index_filepath)
+
+    def getIndex(self):
+        """
+        Returns the index of the trajectory, as an array of FRAME_INDEX records
+        in the order they were appended.
+        """
+        if not self.exists():
+            return numpy.zeros(0, dtype=self.FRAME_INDEX)
+        return numpy.fromfile(self.index_filepath, dtype=self.FRAME_INDEX)
+
+    def getFrames(self):
+        """
+        Returns the FRAME_INDEX records of the frames of the trajectory, sorted
+        by frame number, where only the last one appended is taken for frame
+        numbers that were appended more than once.
+        """
+        index = self.getIndex()
+        frames = {}
+        for position in xrange(len(index)):
+            frames[int(index[position]["frame_number"])] = position
+        frame_numbers = frames.keys()
+        frame_numbers.sort()
+        return index[[frames[frame_number] for frame_number in frame_numbers]]
+
+    def loadFrameArrays(self, frame_number):
+        """
+        Returns a dictionary of read-only memory maps of the arrays of the frame
+        with the given number (see FRAME_ARRAYS), along with its temperature
+        and time.
+        If the frame is not in the trajectory, None is returned.
+        """
+        frames = self.getFrames()
+        positions = numpy.nonzero(frames["frame_number"] == frame_number)[0]
+        if len(positions) == 0:
+            return None
+
+        offset = int(frames[positions[0]]["offset"])
+        header = self._readFrameHeader(offset)
+        shape = (int(header["num_cells"]), int(header["num_dimensions"]))
+        array_size = shape[0] * shape[1] * 8
+
+        frame_arrays = {
+            "temperature": float(header["temperature"]),
+            "time": float(header["time"]),
+        }
+        offset += self.FRAME_HEADER.itemsize
+        for array_name in self.FRAME_ARRAYS:
+            frame_arrays[array_name] = numpy.memmap(
+                    self.filepath, dtype="<f8", mode="r", offset=offset,
+                    shape=shape)
+            offset += array_size
+        return frame_arrays
+
+    def loadFrame(self, frame_number, parameters):
+        """
+        Returns a LiquidCrystalSystem loaded with the frame with the given
+        number, using the given parameters.
+        If the frame is not in the trajectory, None is returned.
+        """
+        frame_arrays = self.loadFrameArrays(frame_number)
+        if frame_arrays is None:
+            return None
+
+        return LiquidCrystalSystem(
+                parameters=parameters,
+                initial_temperature=frame_arrays["temperature"],
+                initial_spins=numpy.array(frame_arrays["spins"]),
+                initial_locations=numpy.array(frame_arrays["locations"]),
+                original_locations=numpy.array(
+                        frame_arrays["original_locations"]))
+
+    def exportAvizFiles(self, filepath_prefix, parameters):
+        """
+        Exports all of the frames of the trajectory to Aviz XYZ files named by
+        the given prefix and the frame number (as they were named when they
+        were written directly by the algorithm), using the given parameters.
+        Returns the list of the exported file paths.
+        """
+        filepaths = []
+        for frame in self.getFrames():
+            frame_number = int(frame["frame_number"])
+            filepath = "%s%08d.xyz" % (filepath_prefix, frame_number)
+            self.loadFrame(frame_number, parameters).outputToAvizFile(filepath)
+            filepaths.append(filepath)
+        return filepaths
+
+    def _getEndOffset(self):
+        """
+        Returns the offset of the end of the last frame in the index, reading
+        only its last record. A record that was not completely written is
+        removed from the index.
+        """
+        if not self.exists():
+            return 0
+        num_records = (os.path.getsize(self.index_filepath) /
+                       self.FRAME_INDEX.itemsize)
+        f = file(self.index_filepath, "r+b")
+        try:
+            f.truncate(num_records * self.FRAME_INDEX.itemsize)
+            if num_records == 0:
+                return 0
+            f.seek((num_records - 1) * self.FRAME_INDEX.itemsize)
+            last_record = numpy.fromfile(f, dtype=self.FRAME_INDEX, count=1)
+        finally:
+            f.close()
+        offset = int(last_record["offset"][0])
+        return offset + self._getFrameSize(self._readFrameHeader(offset))
+
+    def _readFrameHeader(self, offset):
+        """
+        Reads the header of the frame at the given offset in the trajectory.
+        """
+        f = file(self.filepath, "rb")
+        try:
+            f.seek(offset)
+            header = numpy.fromfile(f, dtype=self.FRAME_HEADER, count=1)
+        finally:
+            f.close()
+        if len(header) == 0 or header["magic"][0] != self.FRAME_MAGIC:
+            raise Exception("Invalid frame at offset %s of '%s'" % (
+                    offset, self.filepath))
+        return header[0]
+
+    def _getFrameSize(self, header):
+        """
+        Returns the size of the frame with the given header in bytes.
+        """
+        return (self.FRAME_HEADER.itemsize +
+                len(self.FRAME_ARRAYS) * 8 *
+                int(header["num_cells"]) * int(header["num_dimensions"]))
@@ -1,12 +1,16 @@
 import glob
 import os
+import random
 import shutil
 import sys
 import time
 
+from instrumentation import instruments
 from lc import LiquidCrystalSystem
+from lc_run_manifest import LiquidCrystalRunManifest
 from lc_state_manager import LiquidCrystalSystemStateManager
 from algorithms.monte_carlo_algorithm import MonteCarloAlgorithm
+from algorithms.parallel_tempering_algorithm import ParallelTemperingAlgorithm
 from algorithms.new_state_selector import *
 
 def printUsage():
@@ -98,8 +102,7 @@ def loadPreviousRun(previous_run_pattern):
 
         # Check if we have the final state indicating completion, and if it is
         # a completed run skip it.
-        lc_state_manager = LiquidCrystalSystemStateManager(run_parameters)
-        if "final" in lc_state_manager.getStateNames():
+        if isRunComplete(run_parameters):
             continue
 
         # Ask the user if he wishes to continue this run.
@@ -117,6 +120,18 @@ def loadPreviousRun(previous_run_pattern):
 
     return None
 
+def isRunComplete(run_parameters):
+    """
+    Returns true if the run in the RUN_DIR of the given parameters completed,
+    as recorded in its manifest, or for older runs without one, when it has
+    the final state.
+    """
+    manifest = LiquidCrystalRunManifest(run_parameters)
+    if manifest.exists():
+        return manifest.isComplete()
+    lc_state_manager = LiquidCrystalSystemStateManager(run_parameters)
+    return "final" in lc_state_manager.getStateNames()
+
 def readParametersFromFile(model):
     """
     Reads the parameter file for the given model.
@@ -133,12 +148,17 @@ def main(parameters):
     DIMENSIONS = parameters["DIMENSIONS"]
     INITIAL_TEMPERATURE = float(parameters["INITIAL_TEMPERATURE"])
     USE_MC_HEATER = bool(parameters.get("USE_MC_HEATER", True))
+    MC_HEATER_ALGORITHM = parameters.get("MC_HEATER_ALGORITHM",
+                                         MonteCarloAlgorithm)
     MC_HEATER_STATE_SELECTOR = parameters.get("MC_HEATER_STATE_SELECTOR",
                                               SelectAlwaysNewer)
     USE_MC_COOLER = bool(parameters.get("USE_MC_COOLER", True))
+    MC_COOLER_ALGORITHM = parameters.get("MC_COOLER_ALGORITHM",
+                                         MonteCarloAlgorithm)
     MC_COOLER_STATE_SELECTOR = parameters.get("MC_COOLER_STATE_SELECTOR",
                                               SelectAlwaysNewer)
     INITIAL_STATE = parameters.get("INITIAL_STATE", None)
+    INITIAL_RANDOM_SEED = parameters.get("INITIAL_RANDOM_SEED", None)
 
     # Set the run dir under which all other dirs are created, or if this is a
     # continued run then use the previous dir.
@@ -155,7 +175,8 @@ def main(parameters):
         shutil.copy("models/%s.py" % (parameters["MODEL"],),
                                       parameters["RUN_DIR"])
 
-    # Set up the state manager.
+    # Set up the instrumentation and the state manager.
+    instruments.start(parameters)
     lcs_manager = LiquidCrystalSystemStateManager(parameters)
 
     # Set up the initial state.
@@ -165,6 +186,8 @@ def main(parameters):
         DIMENSIONS = lcs.dimensions[:]
         print "Loaded initial state: %s" % INITIAL_STATE
     else:
+        if INITIAL_RANDOM_SEED is not None:
+            random.seed(INITIAL_RANDOM_SEED)
         lcs = LiquidCrystalSystem(parameters, INITIAL_TEMPERATURE)
 
     print "*"*70
@@ -178,7 +201,7 @@ def main(parameters):
 
     # Heat up the LCS.
     if USE_MC_HEATER:
-        mch = MonteCarloAlgorithm(lcs, lcs_manager, MC_HEATER_STATE_SELECTOR(),
+        mch = MC_HEATER_ALGORITHM(lcs, lcs_manager, MC_HEATER_STATE_SELECTOR(),
                                   parameters, parameter_prefix="MC_HEATER_")
         print "BEFORE HEATING: lcs.getTemperature() = %s" % lcs.getTemperature()
         mch.run()
@@ -191,7 +214,7 @@ def main(parameters):
 
     # Cool down the LCS.
     if USE_MC_COOLER:
-        mcc = MonteCarloAlgorithm(lcs, lcs_manager, MC_COOLER_STATE_SELECTOR(),
+        mcc = MC_COOLER_ALGORITHM(lcs, lcs_manager, MC_COOLER_STATE_SELECTOR(),
                                   parameters, parameter_prefix="MC_COOLER_")
         print "BEFORE COOLING: lcs.getTemperature() = %s" % lcs.getTemperature()
         mcc.run()
@@ -203,6 +226,8 @@ def main(parameters):
         lcs_manager.saveState("current", lcs)
     
     lcs_manager.saveState("final", lcs)
+    LiquidCrystalRunManifest(parameters).setComplete()
+    instruments.stop()
 
 if __name__ == "__main__":
     try:
@@ -51,7 +51,9 @@ EPSILON_E = EPSILON_S / KAPPA_TAG
 # Nearest neighbours parameters.
 NEAREST_NEIGHBOURS_MAX_RADIUS = SIGMA_S * 3.8
 NEAREST_NEIGHBOURS_MAX_INDEX_RANGE = 3
-NEAREST_NEIGHBOURS_UPDATE_CYCLES = 10
+# The extra distance beyond the radius that is kept in the neighbour lists, which
+# are only rebuilt once a molecule moved more than half of it.
+NEAREST_NEIGHBOURS_SKIN = SIGMA_S * 0.5
 
 ##################################################################
 #                Heating Algorithm Properties                    #
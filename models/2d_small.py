@@ -48,7 +48,9 @@ EPSILON_E = EPSILON_S / KAPPA_TAG
 # Nearest neighbours parameters.
 NEAREST_NEIGHBOURS_MAX_RADIUS = average(INITIAL_SPACING) * 1.1
 NEAREST_NEIGHBOURS_MAX_INDEX_RANGE = 1
-NEAREST_NEIGHBOURS_UPDATE_CYCLES = 100
+# The extra distance beyond the radius that is kept in the neighbour lists, which
+# are only rebuilt once a molecule moved more than half of it.
+NEAREST_NEIGHBOURS_SKIN = average(INITIAL_SPACING) * 0.1
 
 ##################################################################
 #                Heating Algorithm Properties                    #
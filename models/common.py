@@ -4,5 +4,7 @@ from potentials.gb_potential_fast import GayBernesPotentialFast
 from potentials.fixed_nearest_neighbours import FixedNearestNeighboursPotential
 from potentials.sphere_nearest_neighbours import SphereNearestNeighboursPotential
 from algorithms.new_state_selector import *
+from algorithms.monte_carlo_algorithm import MonteCarloAlgorithm
+from algorithms.parallel_tempering_algorithm import ParallelTemperingAlgorithm
 from constants import kB
 from util import *
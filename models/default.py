@@ -21,6 +21,10 @@ INITIAL_SPIN_ORIENTATION = [1.0 / sqrt(2.0), 1.0 / sqrt(2.0)]
 # dimensions as DIMENSIONS).
 INITIAL_SPIN_ORIENTATION_STDEV = [4.0, 4.0]
 
+# The seed of the random generator of the initial system (None for a random
+# seed).
+INITIAL_RANDOM_SEED = None
+
 # Initial effective temperature.
 INITIAL_TEMPERATURE = 3.0
 
@@ -45,10 +49,19 @@ KAPPA_TAG = 5.0
 EPSILON_S = 1.0
 EPSILON_E = EPSILON_S / KAPPA_TAG
 
+# The cutoff of the Gay-Bernes contact distance (n - sigma + SIGMA_S), in units
+# of SIGMA_S, beyond which the potential is truncated and within which it is
+# shifted so that it is continuous at the cutoff (None for no cutoff). With the
+# sphere nearest neighbours potential, pairs that are beyond the cutoff in any
+# orientation are not kept in the neighbour lists at all.
+GB_CUTOFF = None
+
 # Nearest neighbours parameters.
 NEAREST_NEIGHBOURS_MAX_RADIUS = SIGMA_S * 3.0
 NEAREST_NEIGHBOURS_MAX_INDEX_RANGE = 1
-NEAREST_NEIGHBOURS_UPDATE_CYCLES = 100
+# The extra distance beyond the radius that is kept in the neighbour lists, which
+# are only rebuilt once a molecule moved more than half of it.
+NEAREST_NEIGHBOURS_SKIN = SIGMA_S * 0.5
 
 ##################################################################
 #                Heating Algorithm Properties                    #
@@ -57,6 +70,14 @@ NEAREST_NEIGHBOURS_UPDATE_CYCLES = 100
 # Use the heating algorithm.
 USE_MC_HEATER = False
 
+# The algorithm to use: MonteCarloAlgorithm goes over the temperatures one at a
+# time, and ParallelTemperingAlgorithm keeps a replica of the system at each of
+# the temperatures, runs them in parallel and exchanges them between
+# neighbouring temperatures after each step (where MAX_STEPS is the number of
+# steps, and NUM_PROCESSES the number of processes, by default one per CPU).
+MC_HEATER_ALGORITHM = MonteCarloAlgorithm
+MC_HEATER_NUM_PROCESSES = None
+
 # The standard deviation of the gaussian random spacing in the system.
 MC_HEATER_SPACING_STDEV = 0.1
 # The maximum radius from the original location where the molecule can be.
@@ -64,6 +85,38 @@ MC_HEATER_SPACING_FROM_ORIGINAL_LOCATION_CUTOFF = MC_HEATER_SPACING_STDEV * 5.0
 # The standard deviation of the gaussian random spin orientation.
 MC_HEATER_SPIN_STDEV = 0.5
 
+# The seed of the random generator of the trial moves (None for a random seed).
+MC_HEATER_RANDOM_SEED = None
+
+# How to sweep over the system in each Metropolis step: "sequential" goes over
+# the cells one by one, and "sublattice" updates all of the cells of each
+# sublattice of non-neighbouring cells at once.
+MC_HEATER_SWEEP_MODE = "sequential"
+
+# The number of collective moves to perform in each Metropolis step, where each
+# one rotates all of the spins of a domain together (all of the cells within
+# COLLECTIVE_MOVE_RANGE of a random cell, or the entire system if it is None),
+# by an angle with a standard deviation of COLLECTIVE_ROTATION_STDEV (radians).
+MC_HEATER_COLLECTIVE_MOVES_PER_STEP = 0
+MC_HEATER_COLLECTIVE_MOVE_RANGE = 2
+MC_HEATER_COLLECTIVE_ROTATION_STDEV = 0.2
+
+# The number of sweeps at the beginning of each temperature in which the widths
+# of the spin and spacing proposals (SPIN_STDEV and SPACING_STDEV, which keep
+# their ratio) are adapted toward the target acceptance rate, after which they
+# are fixed for the rest of the temperature (and saved in its states).
+MC_HEATER_ADAPTIVE_SWEEPS = 0
+MC_HEATER_TARGET_ACCEPTANCE_RATE = 0.5
+
+# Move on to the next temperature once the system reached equilibrium, which is
+# when the means of the energy and the spin orientation variance over the last
+# EQUILIBRATION_WINDOW sweeps are the same as over the window before it, within
+# EQUILIBRATION_TOLERANCE standard errors (estimated by a blocking analysis, so
+# the window must be at least 16 sweeps, and should be at least a few dozen).
+# 0 disables the detection.
+MC_HEATER_EQUILIBRATION_WINDOW = 0
+MC_HEATER_EQUILIBRATION_TOLERANCE = 2.0
+
 # Number of Metropolis steps to perform in each cooling steps.
 MC_HEATER_METROPOLIS_NUM_STEPS = 100000
 # Number of steps in the cooling process to perform the Metropolis algorithm
@@ -88,6 +141,14 @@ MC_HEATER_STATE_PREFIX = "lqs_1_heat"
 # Use the cooling algorithm.
 USE_MC_COOLER = True
 
+# The algorithm to use: MonteCarloAlgorithm goes over the temperatures one at a
+# time, and ParallelTemperingAlgorithm keeps a replica of the system at each of
+# the temperatures, runs them in parallel and exchanges them between
+# neighbouring temperatures after each step (where MAX_STEPS is the number of
+# steps, and NUM_PROCESSES the number of processes, by default one per CPU).
+MC_COOLER_ALGORITHM = MonteCarloAlgorithm
+MC_COOLER_NUM_PROCESSES = None
+
 # The standard deviation of the gaussian random spacing in the system.
 MC_COOLER_SPACING_STDEV = 0.0
 # The maximum radius from the original location where the molecule can be.
@@ -95,6 +156,38 @@ MC_COOLER_SPACING_FROM_ORIGINAL_LOCATION_CUTOFF = MC_COOLER_SPACING_STDEV * 5.0
 # The standard deviation of the gaussian random spin orientation.
 MC_COOLER_SPIN_STDEV = 0.05
 
+# The seed of the random generator of the trial moves (None for a random seed).
+MC_COOLER_RANDOM_SEED = None
+
+# How to sweep over the system in each Metropolis step: "sequential" goes over
+# the cells one by one, and "sublattice" updates all of the cells of each
+# sublattice of non-neighbouring cells at once.
+MC_COOLER_SWEEP_MODE = "sequential"
+
+# The number of collective moves to perform in each Metropolis step, where each
+# one rotates all of the spins of a domain together (all of the cells within
+# COLLECTIVE_MOVE_RANGE of a random cell, or the entire system if it is None),
+# by an angle with a standard deviation of COLLECTIVE_ROTATION_STDEV (radians).
+MC_COOLER_COLLECTIVE_MOVES_PER_STEP = 0
+MC_COOLER_COLLECTIVE_MOVE_RANGE = 2
+MC_COOLER_COLLECTIVE_ROTATION_STDEV = 0.2
+
+# The number of sweeps at the beginning of each temperature in which the widths
+# of the spin and spacing proposals (SPIN_STDEV and SPACING_STDEV, which keep
+# their ratio) are adapted toward the target acceptance rate, after which they
+# are fixed for the rest of the temperature (and saved in its states).
+MC_COOLER_ADAPTIVE_SWEEPS = 0
+MC_COOLER_TARGET_ACCEPTANCE_RATE = 0.5
+
+# Move on to the next temperature once the system reached equilibrium, which is
+# when the means of the energy and the spin orientation variance over the last
+# EQUILIBRATION_WINDOW sweeps are the same as over the window before it, within
+# EQUILIBRATION_TOLERANCE standard errors (estimated by a blocking analysis, so
+# the window must be at least 16 sweeps, and should be at least a few dozen).
+# 0 disables the detection.
+MC_COOLER_EQUILIBRATION_WINDOW = 0
+MC_COOLER_EQUILIBRATION_TOLERANCE = 2.0
+
 # Number of Metropolis steps to perform in each cooling steps.
 MC_COOLER_METROPOLIS_NUM_STEPS = 1000
 # Number of steps in the cooling process to perform the Metropolis algorithm
@@ -120,3 +213,27 @@ MC_COOLER_STATE_PREFIX = "lqs_2_cool"
 LCS_REPOSITORY_LOCATION = "states"
 # The suffix to use for state files.
 LCS_REPOSITORY_SUFFIX = "dat"
+
+# The parameter grid to run with sweep.sh: each parameter is mapped to the list
+# of its values, and a run is performed for each combination of the values (for
+# example {"KAPPA": [2.0, 3.0], "DIMENSIONS": [[5, 5], [10, 10]]}).
+SWEEP_PARAMETERS = {}
+# The number of runs of the sweep to perform at once (None for one per CPU).
+SWEEP_NUM_PROCESSES = None
+
+# The number of writes (of states, trajectory frames and information lines) that
+# can wait for the background writer before the algorithm waits for it (0 writes
+# them right away instead).
+OUTPUT_QUEUE_SIZE = 8
+
+# Write the counters and timers of the run (moves, pair evaluations, neighbour
+# list rebuilds, state saves, sweeps per second and so on) as JSON lines to
+# INSTRUMENTATION_PATH in the run directory: every INSTRUMENTATION_INTERVAL
+# seconds, after each temperature (or parallel tempering round), and at the end.
+INSTRUMENTATION = False
+INSTRUMENTATION_PATH = "instrumentation.jsonl"
+INSTRUMENTATION_INTERVAL = 60.0
+
+# Verify with full energy calculations that rejected Metropolis steps are
+# rolled back correctly (slow, for debugging only).
+MC_DEBUG_ENERGY_CHECKS = False
@@ -32,7 +32,9 @@ TWO_SPIN_POTENTIAL = GayBernesPotentialFast
 # Nearest neighbours parameters.
 NEAREST_NEIGHBOURS_MAX_RADIUS = average(INITIAL_SPACING) * 1.1
 NEAREST_NEIGHBOURS_MAX_INDEX_RANGE = 1
-NEAREST_NEIGHBOURS_UPDATE_CYCLES = 100
+# The extra distance beyond the radius that is kept in the neighbour lists, which
+# are only rebuilt once a molecule moved more than half of it.
+NEAREST_NEIGHBOURS_SKIN = average(INITIAL_SPACING) * 0.1
 
 # The potential parameters.
 EPSILON_0 = kB
@@ -4,6 +4,9 @@ class FixedNearestNeighboursPotential(Potential):
     """
     This is an implementation of the potential interface for fixed nearest
     neighbours potentials which can be passed on in the constructor.
+    The neighbours of each cell are all of the cells within
+    NEAREST_NEIGHBOURS_MAX_INDEX_RANGE of it, which never change, so they are
+    taken from the neighbour topology shared by all systems.
     """
     
     def __init__(self, potential, parameters):
@@ -13,29 +16,52 @@ class FixedNearestNeighboursPotential(Potential):
         self.potential = potential
         self.parameters = parameters
 
+        self.topology = None
+
     def calculate(self, lcs, indices):
         """
         Calculates the nearest neighbours potential for the given spin.
         """
-        U = 0
+        flat_index = lcs.getFlatIndex(indices)
+        neighbours, translations = \
+                self._getTopology(lcs).getNeighbours(flat_index)
+        return self._calculateNeighbours(lcs, flat_index,
+                                         neighbours, translations)
 
-        # Get the neighbour list for the given cell.
-        NEAREST_NEIGHBOURS_MAX_INDEX_RANGE = int(
-                self.parameters["NEAREST_NEIGHBOURS_MAX_INDEX_RANGE"])
-        index_ranges = [NEAREST_NEIGHBOURS_MAX_INDEX_RANGE
-                        for i in range(len(indices))]
-        neighbours_list = lcs.getCellNeighboursList(indices, index_ranges)
+    def deltaEnergy(self, lcs, indices, new_spin, new_location):
+        """
+        Calculates the change in the nearest neighbours potential for the given
+        spin if its spin and location were changed to the given ones.
+        """
+        flat_index = lcs.getFlatIndex(indices)
+        neighbours, translations = \
+                self._getTopology(lcs).getNeighbours(flat_index)
+        return self._deltaEnergyNeighbours(lcs, flat_index,
+                                           neighbours, translations,
+                                           new_spin, new_location)
 
-        # Get the location and spin for the given cell.
-        location = lcs.getLocation(indices)
-        spin = lcs.getSpin(indices)
+    def calculateTotal(self, lcs):
+        """
+        Calculates the total nearest neighbours potential of the system, for
+        all of the pairs of neighbours at once.
+        """
+        cells, neighbours, translations = self.getNeighbourPairArrays(lcs)
+        return self._calculatePairs(lcs, cells, neighbours, translations)
 
-        for n_indices in neighbours_list:
-            n_location = lcs.getLocation(n_indices)
-            n_spin = lcs.getSpin(n_indices)
-            U += self.potential.calculateTwoSpins(spin,
-                                                  location,
-                                                  n_spin,
-                                                  n_location)
+    def getNeighbourPairArrays(self, lcs):
+        """
+        Returns the pairs of each cell with each of its nearest neighbours.
+        """
+        return self._getTopology(lcs).getPairArrays()
 
-        return U / 2.0
+    def _getTopology(self, lcs):
+        """
+        Returns the neighbour topology of the given system.
+        """
+        if self.topology is None:
+            NEAREST_NEIGHBOURS_MAX_INDEX_RANGE = int(
+                    self.parameters["NEAREST_NEIGHBOURS_MAX_INDEX_RANGE"])
+            index_ranges = [NEAREST_NEIGHBOURS_MAX_INDEX_RANGE
+                            for i in range(len(lcs.dimensions))]
+            self.topology = lcs.getNeighbourTopology(index_ranges)
+        return self.topology
@@ -17,6 +17,13 @@ class GayBernesPotential(TwoSpinPotential):
         self.kappa_tag = float(parameters["KAPPA_TAG"])
         self.chi_tag = ((self.kappa_tag ** (1.0 / self.miu) - 1.0) /
                         (self.kappa_tag ** (1.0 / self.miu) + 1.0))
+
+        # The cutoff of the contact distance (n - sigma + sigma_s) in units of
+        # sigma_s, beyond which the potential is truncated (and within which
+        # it is shifted, so it is continuous at the cutoff), if there is one.
+        self.cutoff = parameters.get("GB_CUTOFF", None)
+        if self.cutoff is not None:
+            self.cutoff = float(self.cutoff)
         #print "// &&& GayBernesPotential: epsilon0 = %s, sigma_s = %s, miu = %s, ni = %s, kappa = %s, chi = %s, kappa_tag = %s, chi_tag = %s" % (self.epsilon0, self.sigma_s, self.miu, self.ni, self.kappa, self.chi, self.kappa_tag, self.chi_tag)
 
     def calculateTwoSpins(self, spin1, location1, spin2, location2):
@@ -24,8 +31,10 @@ class GayBernesPotential(TwoSpinPotential):
         Calculates the Gay-Bernes potential contribution from two spins.
         """
         r = location1 - location2
-        nr = r / linalg.norm(r)
-        Ugb = self._calculateGBPotential(spin1, spin2, r, nr)
+        n = linalg.norm(r)
+        nr = r / n
+        Ugb = self._calculateGBPotential(dot(spin1, nr), dot(spin2, nr),
+                                         dot(spin1, spin2), n)
         #print "// GayBernesPotential::calculateTwoSpins:"
         #print "// spin1 = %s, location1 = %s" % (spin1, location1)
         #print "// spin2 = %s, location2 = %s" % (spin2, location2)
@@ -33,57 +42,105 @@ class GayBernesPotential(TwoSpinPotential):
         #print "// U = %s" % Ugb
         return Ugb
 
-    def _calculateGBPotential(self, spin1, spin2, r, nr):
+    def getCutoffDistance(self):
+        """
+        Returns the distance beyond which the potential is truncated in any
+        orientation, which is the cutoff of the contact distance with the
+        largest Sigma (of the end to end configuration).
+        """
+        if self.cutoff is None:
+            return None
+
+        sigma_max = self.sigma_s * sqrt((1.0 + abs(self.chi)) /
+                                        (1.0 - abs(self.chi)))
+        return (self.cutoff - 1.0) * self.sigma_s + sigma_max
+
+    def calculateTwoSpinsBatch(self, spins1, spins2, r):
+        """
+        Calculates the Gay-Bernes potentials of all of the given pairs of spins
+        at once (see TwoSpinPotential.calculateTwoSpinsBatch).
+        """
+        n = sqrt((r * r).sum(axis=1))
+        nr = r / n[:, newaxis]
+        return self._calculateGBPotential((spins1 * nr).sum(axis=1),
+                                          (spins2 * nr).sum(axis=1),
+                                          (spins1 * spins2).sum(axis=1),
+                                          n)
+
+    # NOTE: The methods below work on the dot products of the two spins and the
+    #       normalized distance vector, which may be either scalars or arrays
+    #       of the values of many pairs.
+
+    def _calculateGBPotential(self, dot_spin1_nr, dot_spin2_nr,
+                              dot_spin1_spin2, n):
         """
         Calculates the Gay Bernes potential energy of the given two spins.
         """
-        R = self._calculateR(spin1, spin2, r, nr)
+        R = self._calculateR(dot_spin1_nr, dot_spin2_nr, dot_spin1_spin2, n)
         
-        epsilon = self._calculateEpsilon(spin1, spin2, nr)
+        epsilon = self._calculateEpsilon(dot_spin1_nr, dot_spin2_nr,
+                                         dot_spin1_spin2)
+        return self._calculateEnergy(epsilon, R)
+
+    def _calculateEnergy(self, epsilon, R):
+        """
+        Calculates the potential energy from Epsilon and R, truncated and
+        shifted at the cutoff if there is one.
+        """
         res = (4 * epsilon * (R**12 - R**6))
-        return res
+        if self.cutoff is None:
+            return res
+
+        # R is sigma_s over the contact distance, which is below the cutoff
+        # when 1/R is (this includes overlapping spins, where R is negative).
+        Rc = 1.0 / self.cutoff
+        return where(1.0 / R < self.cutoff,
+                     res - 4 * epsilon * (Rc**12 - Rc**6), 0.0)
 
-    def _calculateR(self, spin1, spin2, r, nr):
+    def _calculateR(self, dot_spin1_nr, dot_spin2_nr, dot_spin1_spin2, n):
         """
-        Calculates R from the two spins and the distance vector between the
-        two locations.
+        Calculates R from the two spins and the distance between the two
+        locations.
         """
-        sigma = self._calculateSigma(spin1, spin2, nr)
-        return (self.sigma_s / (linalg.norm(r) - sigma + self.sigma_s))
+        sigma = self._calculateSigma(dot_spin1_nr, dot_spin2_nr,
+                                     dot_spin1_spin2)
+        return (self.sigma_s / (n - sigma + self.sigma_s))
 
-    def _calculateSigma(self, spin1, spin2, nr):
+    def _calculateSigma(self, dot_spin1_nr, dot_spin2_nr, dot_spin1_spin2):
         """
         Calculates Sigma from the two spins and the normalized distance vector
         between locations.
         """
-        first = (((dot(spin1, nr) + dot(spin2, nr)) ** 2) /
-                 (1.0 + self.chi * dot(spin1, spin2)))
-        second = (((dot(spin1, nr) - dot(spin2, nr)) ** 2) /
-                  (1.0 - self.chi * dot(spin1, spin2)))
+        first = (((dot_spin1_nr + dot_spin2_nr) ** 2) /
+                 (1.0 + self.chi * dot_spin1_spin2))
+        second = (((dot_spin1_nr - dot_spin2_nr) ** 2) /
+                  (1.0 - self.chi * dot_spin1_spin2))
         return self.sigma_s / sqrt(1.0 - self.chi / 2.0 * (first + second))
 
-    def _calculateEpsilon(self, spin1, spin2, nr):
+    def _calculateEpsilon(self, dot_spin1_nr, dot_spin2_nr, dot_spin1_spin2):
         """
         Calculates Epsilon from the two spins and the normalized distance vector
         between locations.
         """
         return (self.epsilon0 *
-                (self._calculateEpsilonNi(spin1, spin2) ** self.ni) *
-                (self._calculateEpsilonTagMiu(spin1, spin2, nr) ** self.miu))
+                (self._calculateEpsilonNi(dot_spin1_spin2) ** self.ni) *
+                (self._calculateEpsilonTagMiu(dot_spin1_nr, dot_spin2_nr,
+                                              dot_spin1_spin2) ** self.miu))
 
-    def _calculateEpsilonNi(self, spin1, spin2):
+    def _calculateEpsilonNi(self, dot_spin1_spin2):
         """
         Calculates Epsilon-Ni from the two spins.
         """
-        return 1.0 / sqrt(1.0 - (self.chi ** 2) * (dot(spin1,spin2) ** 2))
+        return 1.0 / sqrt(1.0 - (self.chi ** 2) * (dot_spin1_spin2 ** 2))
 
-    def _calculateEpsilonTagMiu(self, spin1, spin2, nr):
+    def _calculateEpsilonTagMiu(self, dot_spin1_nr, dot_spin2_nr,
+                                dot_spin1_spin2):
         """
         Calculates Epsilon Tag Miu from the two spins and the normalized
         distance vector between locations.
         """
-        first = (((dot(spin1, nr) + dot(spin2, nr)) ** 2) /
-                 (1.0 + self.chi_tag * dot(spin1, spin2)))
-        second = (((dot(spin1, nr) - dot(spin2, nr)) ** 2) /
-                  (1.0 - self.chi_tag * dot(spin1, spin2)))
+        first = (((dot_spin1_nr + dot_spin2_nr) ** 2) /
+                 (1.0 + self.chi_tag * dot_spin1_spin2))
+        second = (((dot_spin1_nr - dot_spin2_nr) ** 2) /
+                  (1.0 - self.chi_tag * dot_spin1_spin2))
         return 1.0 - self.chi_tag / 2.0 * (first + second)
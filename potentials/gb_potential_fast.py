@@ -1,10 +1,11 @@
 from util import *
 from potential import TwoSpinPotential
 
+from gb_potential import GayBernesPotential
+
 try:
     from cpp.potentials.gb_potential_impl import GayBernesPotentialImpl
 except:
-    from gb_potential import GayBernesPotential
     GayBernesPotentialImpl = None
 
 class GayBernesPotentialFast(TwoSpinPotential):
@@ -19,15 +20,66 @@ class GayBernesPotentialFast(TwoSpinPotential):
         KAPPA = float(parameters["KAPPA"])
         KAPPA_TAG = float(parameters["KAPPA_TAG"])
 
-        if GayBernesPotentialImpl is None:
+        # The C++ implementation has no cutoff.
+        if GayBernesPotentialImpl is None or \
+           parameters.get("GB_CUTOFF", None) is not None:
             self.impl = GayBernesPotential(parameters)
         else:
             self.impl = GayBernesPotentialImpl(
                     EPSILON_0, SIGMA_S, MIU, NI, KAPPA, KAPPA_TAG)
 
+        # Batches of pairs are passed to the C++ implementation as raw buffers
+        # if it was compiled with them, and otherwise calculated with the
+        # vectorized implementation.
+        self.batch_impl = None
+        if not hasattr(self.impl, "calculateTwoSpinsBuffers"):
+            self.batch_impl = GayBernesPotential(parameters)
+
+    def getCutoffDistance(self):
+        """
+        Returns the distance beyond which the potential is truncated in any
+        orientation (see GayBernesPotential.getCutoffDistance).
+        """
+        if isinstance(self.impl, GayBernesPotential):
+            return self.impl.getCutoffDistance()
+        return None
+
     def calculateTwoSpins(self, spin1, location1, spin2, location2):
         """
         Calculates the Gay-Bernes potential contribution from two spins.
         """
         return self.impl.calculateTwoSpins(
                 spin1, location1, spin2, location2)
+
+    def calculateTwoSpinsBatch(self, spins1, spins2, r):
+        """
+        Calculates the Gay-Bernes potentials of all of the given pairs of spins
+        at once (see TwoSpinPotential.calculateTwoSpinsBatch).
+        """
+        if self.batch_impl is not None:
+            return self.batch_impl.calculateTwoSpinsBatch(spins1, spins2, r)
+
+        spins1, spins2, r = self._toBuffers(spins1, spins2, r)
+        U = empty(len(r))
+        self.impl.calculateTwoSpinsBuffers(spins1, spins2, r, r.shape[1], U)
+        return U
+
+    def calculateTwoSpinsBatchSum(self, spins1, spins2, r):
+        """
+        Calculates the sum of the Gay-Bernes potentials of all of the given
+        pairs of spins at once (see TwoSpinPotential.calculateTwoSpinsBatchSum).
+        """
+        if self.batch_impl is not None:
+            return self.batch_impl.calculateTwoSpinsBatch(spins1, spins2,
+                                                          r).sum()
+
+        spins1, spins2, r = self._toBuffers(spins1, spins2, r)
+        return self.impl.calculateTwoSpinsBuffersSum(spins1, spins2, r,
+                                                     r.shape[1])
+
+    def _toBuffers(self, *arrays):
+        """
+        Returns the given arrays as contiguous float arrays, which the C++
+        implementation reads directly (arrays that already are are not copied).
+        """
+        return [ascontiguousarray(a, dtype=float64) for a in arrays]
@@ -13,3 +13,10 @@ class LenardJonesPotential(TwoSpinPotential):
         Calculates the Lenard-Jones potential contribution from two spins.
         """
         return self.epsilon0 * P2(dot(spin1, spin2))
+
+    def calculateTwoSpinsBatch(self, spins1, spins2, r):
+        """
+        Calculates the Lenard-Jones potentials of all of the given pairs of
+        spins at once (see TwoSpinPotential.calculateTwoSpinsBatch).
+        """
+        return self.epsilon0 * P2((spins1 * spins2).sum(axis=1))
@@ -1,3 +1,6 @@
+from instrumentation import instruments
+from util import *
+
 class Potential:
     """
     This is the interface for all potentials.
@@ -9,12 +12,130 @@ class Potential:
         """
         raise NotImplemented
 
+    def calculateTotal(self, lcs):
+        """
+        Calculates the total potential of the given system.
+        Potentials should override this with a batched calculation over all of
+        the pairs of spins where possible.
+        """
+        U = 0
+        index_iterator = lcs.getSystemIndexIterator()
+        for indices in index_iterator:
+            U += self.calculate(lcs, indices)
+        return U
+
+    def deltaEnergy(self, lcs, indices, new_spin, new_location):
+        """
+        Calculates the change in the potential for the given spin (as returned
+        by calculate) if its spin and location were changed to the given ones.
+        Potentials should override this with a calculation of only the pairs
+        of the spin, which doesn't change the system, where possible.
+        """
+        flat_index = lcs.getFlatIndex(indices)
+        current_spin = lcs.spins[flat_index].copy()
+        current_location = lcs.locations[flat_index].copy()
+        current_U = self.calculate(lcs, indices)
+
+        lcs.spins[flat_index] = new_spin
+        lcs.locations[flat_index] = new_location
+        new_U = self.calculate(lcs, indices)
+        lcs.spins[flat_index] = current_spin
+        lcs.locations[flat_index] = current_location
+
+        return new_U - current_U
+
+    def calculatePairEnergies(self, spins1, spins2, r):
+        """
+        Calculates the potentials of the given pairs of spins (in the format of
+        TwoSpinPotential.calculateTwoSpinsBatch) with the two spin potential
+        held in self.potential, as this potential counts them.
+        """
+        if instruments.enabled:
+            instruments.count("pair_evaluations", len(r))
+        return self.potential.calculateTwoSpinsBatch(spins1, spins2, r)
+
+    def calculatePairEnergiesSum(self, spins1, spins2, r):
+        """
+        Calculates the sum of the potentials of the given pairs of spins (see
+        calculatePairEnergies).
+        """
+        if instruments.enabled:
+            instruments.count("pair_evaluations", len(r))
+        return self.potential.calculateTwoSpinsBatchSum(spins1, spins2, r)
+
+    def getNeighbourPairArrays(self, lcs):
+        """
+        Returns all of the pairs of neighbouring cells that this potential sums
+        over, in the format returned by lcs.getNeighbourPairArrays.
+        """
+        raise NotImplementedError
+
     def update(self):
         """
         Forces update of internal data structures.
         """
         pass
 
+    def _calculateNeighbours(self, lcs, flat_index, neighbours, translations):
+        """
+        Calculates the potential of the cell with the given flat index with the
+        given neighbours (and their location translations) in one batch.
+        Each pair is counted as half, as it is in the total potential.
+        """
+        if len(neighbours) == 0:
+            return 0.0
+
+        r = (lcs.locations[flat_index] - lcs.locations[neighbours] -
+             translations)
+        spins = lcs.spins[flat_index].reshape((1, len(lcs.dimensions)))
+        U = self.calculatePairEnergiesSum(
+                spins.repeat(len(neighbours), axis=0), lcs.spins[neighbours],
+                r)
+        return U / 2.0
+
+    def _deltaEnergyNeighbours(self, lcs, flat_index, neighbours, translations,
+                               new_spin, new_location):
+        """
+        Calculates the change in the potential of the cell with the given flat
+        index with the given neighbours (and their location translations) if
+        its spin and location were changed to the given ones.
+        The pairs with the current and the new spin are calculated in a single
+        batch.
+        """
+        num_neighbours = len(neighbours)
+        if num_neighbours == 0:
+            return 0.0
+
+        n_spins = lcs.spins[neighbours]
+        n_locations = lcs.locations[neighbours] + translations
+        spins = concatenate(
+                (lcs.spins[flat_index].reshape((1, len(lcs.dimensions))),
+                 reshape(new_spin, (1, len(lcs.dimensions)))))
+        locations = concatenate(
+                (lcs.locations[flat_index].reshape((1, len(lcs.dimensions))),
+                 reshape(new_location, (1, len(lcs.dimensions)))))
+        U = self.calculatePairEnergies(
+                spins.repeat(num_neighbours, axis=0),
+                concatenate((n_spins, n_spins)),
+                locations.repeat(num_neighbours, axis=0) -
+                    concatenate((n_locations, n_locations)))
+        return (U[num_neighbours:].sum() - U[:num_neighbours].sum()) / 2.0
+
+    def _calculatePairs(self, lcs, cells, neighbours, translations):
+        """
+        Calculates the potential of the given pairs of cells (as returned by
+        lcs.getNeighbourPairArrays) in one batch.
+        Each pair is counted as half, since every pair appears twice.
+        """
+        if len(cells) == 0:
+            return 0.0
+
+        r = lcs.locations[cells] - lcs.locations[neighbours] - translations
+        U = self.calculatePairEnergiesSum(lcs.spins[cells],
+                                          lcs.spins[neighbours],
+                                          r)
+        return U / 2.0
+
 class TwoSpinPotential:
     """
     This is the interface for a two spin potential.
@@ -25,3 +146,33 @@ class TwoSpinPotential:
         Calculates the potential between the given spins.
         """
         raise NotImplemented
+
+    def calculateTwoSpinsBatch(self, spins1, spins2, r):
+        """
+        Calculates the potentials between each of the given pairs of spins,
+        where spins1 and spins2 are (M, d) arrays of the spins of each pair, and
+        r is an (M, d) array of the distance vectors (location1 - location2).
+        Returns an array of the M pair potentials.
+        Two spin potentials should override this with a vectorized calculation,
+        since this default calculates the pairs one by one.
+        """
+        origin = zeros(r.shape[1])
+        return array([self.calculateTwoSpins(spins1[m], r[m],
+                                             spins2[m], origin)
+                      for m in xrange(len(r))])
+
+    def getCutoffDistance(self):
+        """
+        Returns the distance beyond which the potential between two spins is
+        zero in any orientation, or None if it has no cutoff.
+        """
+        return None
+
+    def calculateTwoSpinsBatchSum(self, spins1, spins2, r):
+        """
+        Calculates the sum of the potentials between each of the given pairs of
+        spins (see calculateTwoSpinsBatch).
+        Two spin potentials may override this to sum the pairs without
+        creating an array of their potentials.
+        """
+        return self.calculateTwoSpinsBatch(spins1, spins2, r).sum()
@@ -1,15 +1,18 @@
+from instrumentation import instruments
 from util import *
 from potential import Potential, TwoSpinPotential
+from verlet_neighbour_list import VerletNeighbourList
 
 class SphereNearestNeighboursPotential(Potential):
     """
     This is an implementation of the potential interface for nearest neighbours
     potentials which can be passed on in the constructor.
-    Nearest neighbours are selected within a sphere of a given radius, and the
-    closest spins are recalculated every set number of calculations.
+    Nearest neighbours are selected within a sphere of a given radius, and are
+    kept in a Verlet neighbour list that is rebuilt only when the spins moved
+    far enough for it to be incomplete.
     NOTE: This currenty works only with 2D and 3D potentials.
     """
-    
+
     def __init__(self, potential, parameters):
         """
         Uses the given two spin potential for the calculations.
@@ -17,96 +20,119 @@ class SphereNearestNeighboursPotential(Potential):
         self.potential = potential
         self.parameters = parameters
 
-        self.neighbour_lists = {}
-        self.cycles_before_update = 0
+        self.radius = float(parameters["NEAREST_NEIGHBOURS_MAX_RADIUS"])
+
+        # Pairs that are farther apart than the cutoff of the two spin
+        # potential (if it has one) are not needed either.
+        cutoff = self.potential.getCutoffDistance()
+        if cutoff is not None:
+            self.radius = min(self.radius, cutoff)
+        self.skin = float(parameters.get("NEAREST_NEIGHBOURS_SKIN", 0.0))
+        self.neighbour_list = None
 
     def calculate(self, lcs, indices):
         """
         Calculates the nearest neighbours potential for the given spin.
         """
-        # Update the counter of cycles to the next neighbour update, and update
-        # the neighbour lists if needed.
-        # This is only done every time we calculate the [0,0,...,0] spin.
-        if not any(indices) or not self.neighbour_lists:
-            self.cycles_before_update -= 1
-            if self.cycles_before_update <= 0:
-                self._updateNeighbourLists(lcs)
-
-        # U is the total potential energy.
-        U = 0
-
-        # Get the current spin and location pointed to by the indices.
-        spin = lcs.getSpin(indices)
-        location = lcs.getLocation(indices)
-
-        # Get the cached neighbour list for the current spin.
-        neighbour_list = self.neighbour_lists[tuple(indices)]
+        flat_index = lcs.getFlatIndex(indices)
+        if self.neighbour_list is None or \
+           not self.neighbour_list.isValid(lcs.locations, flat_index):
+            self._updateNeighbourList(lcs)
 
-        # Go over the list of neighbours and calculate the potential for each.
-        for n_indices in neighbour_list:
-            n_spin = lcs.getSpin(n_indices)
-            n_location = lcs.getLocation(n_indices)
-            U += self.potential.calculateTwoSpins(spin,
-                                                  location,
-                                                  n_spin,
-                                                  n_location)
+        # Calculate the potential with the neighbours from the neighbour list.
+        neighbours, translations = self.neighbour_list.getNeighbours(flat_index)
+        return self._calculateNeighbours(lcs, flat_index,
+                                         neighbours, translations)
 
-        return U / 2.0
-
-    def update(self):
+    def deltaEnergy(self, lcs, indices, new_spin, new_location):
         """
-        This forces an update of the neighbours lists on the next call to
-        calculate.
+        Calculates the change in the nearest neighbours potential for the given
+        spin if its spin and location were changed to the given ones.
+        If the new location is too far for the neighbour list to be complete,
+        all of the candidate neighbours are used instead.
         """
-        self.neighbour_lists = {}
-        self.cycles_before_update = 0
-
-    def _updateNeighbourLists(self, lcs):
+        flat_index = lcs.getFlatIndex(indices)
+        if self.neighbour_list is None or \
+           not self.neighbour_list.isValid(lcs.locations, flat_index):
+            self._updateNeighbourList(lcs)
+
+        if self.neighbour_list.isValid(lcs.locations, flat_index,
+                                       new_location):
+            neighbours, translations = \
+                    self.neighbour_list.getNeighbours(flat_index)
+        else:
+            neighbours, translations = \
+                    self.neighbour_list.candidates.getNeighbours(flat_index)
+        return self._deltaEnergyNeighbours(lcs, flat_index,
+                                           neighbours, translations,
+                                           new_spin, new_location)
+
+    def calculateTotal(self, lcs):
         """
-        Updates the list of neighbours for each of the spins based on the
-        locations of the spins and the system dimensions.
+        Calculates the total nearest neighbours potential of the system, for
+        all of the pairs of neighbours at once.
         """
-        #print "// _updateNeighbourLists"
-        # Reset the cached neighbour lists.
-        self.neighbour_lists = {}
-        self.cycles_before_update = int(
-            self.parameters["NEAREST_NEIGHBOURS_UPDATE_CYCLES"])
-
-        # Get the maximum sphere radius and the maximum index range of cells to
-        # include in the calculation.
-        R2 = float(self.parameters["NEAREST_NEIGHBOURS_MAX_RADIUS"]) ** 2
-        MAX_INDEX_RANGE = int(
-            self.parameters["NEAREST_NEIGHBOURS_MAX_INDEX_RANGE"])
-        index_ranges = [MAX_INDEX_RANGE for dim in lcs.dimensions]
-
-        # Go over each of the cells in turn, and for each one cache the
-        # neighbours that are contained within the close sphere of
-        # NEAREST_NEIGHBOURS_MAX_RADIUS size.
-        index_iterator = lcs.getSystemIndexIterator()
-        for indices in index_iterator:
-            # Get the location and neighbours list for the current cell.
-            location = lcs.getLocation(indices)
-            neighbour_list = lcs.getCellNeighboursList(indices, index_ranges)
+        cells, neighbours, translations = self.getNeighbourPairArrays(lcs)
+        return self._calculatePairs(lcs, cells, neighbours, translations)
 
-            # Create a new entry for the current cell in the cache.
-            cached_neighbour_list = []
-            self.neighbour_lists[tuple(indices)] = cached_neighbour_list
-
-            # Go over each of the neighbours and check if it is within range.
-            for n_indices in neighbour_list:
-                n_location = lcs.getLocation(n_indices)
-                r2 = self._calculateDistanceSquared(location, n_location)
-                if r2 <= R2:
-                    cached_neighbour_list.append(n_indices)
-
-    def _calculateDistanceSquared(self, location1, location2):
+    def calculatePairEnergies(self, spins1, spins2, r):
+        """
+        Calculates the potentials of the given pairs of spins, where pairs that
+        are farther apart than the radius do not contribute.
+        """
+        within_radius = ((r * r).sum(axis=1) <= self.radius ** 2)
+        if instruments.enabled:
+            instruments.count("pair_evaluations", int(within_radius.sum()))
+        U = zeros(len(r))
+        if within_radius.any():
+            U[within_radius] = self.potential.calculateTwoSpinsBatch(
+                    spins1[within_radius],
+                    spins2[within_radius],
+                    r[within_radius])
+        return U
+
+    def calculatePairEnergiesSum(self, spins1, spins2, r):
         """
-        Calculates the distance between the given two locations squared.
+        Calculates the sum of the potentials of the given pairs of spins, where
+        pairs that are farther apart than the radius do not contribute.
         """
-        assert len(location1) == len(location2)
+        within_radius = ((r * r).sum(axis=1) <= self.radius ** 2)
+        if instruments.enabled:
+            instruments.count("pair_evaluations", int(within_radius.sum()))
+        if within_radius.all():
+            return self.potential.calculateTwoSpinsBatchSum(spins1, spins2, r)
+        if not within_radius.any():
+            return 0.0
+        return self.potential.calculateTwoSpinsBatchSum(
+                spins1[within_radius], spins2[within_radius],
+                r[within_radius])
+
+    def getNeighbourPairArrays(self, lcs):
+        """
+        Returns the pairs of each cell with each of the neighbours in the
+        neighbour list (which may be a bit farther apart than the radius).
+        """
+        if self.neighbour_list is None or \
+           not self.neighbour_list.isValid(lcs.locations):
+            self._updateNeighbourList(lcs)
 
-        distance = 0.0
-        for i in range(len(location1)):
-            distance += (location1[i] - location2[i]) ** 2
+        return self.neighbour_list.getPairArrays()
 
-        return distance
+    def _updateNeighbourList(self, lcs):
+        """
+        Rebuilds the neighbour list from the current locations of the spins,
+        creating it first if needed.
+        """
+        #print "// _updateNeighbourList"
+        if self.neighbour_list is None:
+            # The candidate neighbours of each cell are all of the cells within
+            # NEAREST_NEIGHBOURS_MAX_INDEX_RANGE of it.
+            MAX_INDEX_RANGE = int(
+                self.parameters["NEAREST_NEIGHBOURS_MAX_INDEX_RANGE"])
+            index_ranges = [MAX_INDEX_RANGE for dim in lcs.dimensions]
+            candidates = lcs.getNeighbourTopology(index_ranges)
+
+            self.neighbour_list = VerletNeighbourList(
+                    self.radius, self.skin, candidates, lcs.num_cells)
+
+        self.neighbour_list.build(lcs.locations)
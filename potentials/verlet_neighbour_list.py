@@ -0,0 +1,86 @@
+from instrumentation import instruments
+from util import *
+from lc import NeighbourTopology
+
+class VerletNeighbourList:
+    """
+    This is a Verlet neighbour list of the cells of a system.
+    For each cell it holds the neighbours that were within the radius plus a
+    skin distance when the list was built, so the list stays complete for the
+    radius itself until some cell moves more than half of the skin.
+    The neighbours are only looked for among the candidates of a fixed
+    NeighbourTopology (cells that are within an index range of each other),
+    since every molecule stays close to its lattice cell.
+    The list itself is held as a NeighbourTopology as well.
+    """
+    def __init__(self, radius, skin, candidates, num_cells):
+        """
+        Initializes the neighbour list with the given radius and skin, and the
+        NeighbourTopology of the candidate neighbours.
+        The list is empty until it is first built.
+        """
+        self.radius = radius
+        self.skin = skin
+        self.candidates = candidates
+        self.num_cells = num_cells
+
+        self.topology = None
+        self.built_locations = None
+        self.num_builds = 0
+
+    def isValid(self, locations, flat_index=None, new_location=None):
+        """
+        Returns true if the list is still complete for the given locations.
+        If a flat index is given, only the neighbours of that cell are checked
+        (which only requires looking at the cell and its candidates), and if a
+        new location is given as well, they are checked as if the cell was
+        moved to it.
+        """
+        if self.built_locations is None:
+            return False
+
+        if flat_index is None:
+            displacements = locations - self.built_locations
+        else:
+            candidate_neighbours, candidate_translations = \
+                    self.candidates.getNeighbours(flat_index)
+            checked = concatenate(([flat_index], candidate_neighbours))
+            displacements = locations[checked] - self.built_locations[checked]
+            if new_location is not None:
+                displacements[0] = (new_location -
+                                    self.built_locations[flat_index])
+
+        max_displacement2 = (displacements * displacements).sum(axis=1).max()
+        return max_displacement2 <= (self.skin / 2.0) ** 2
+
+    def build(self, locations):
+        """
+        Builds the list from the given locations, keeping all of the candidate
+        pairs that are within the radius plus the skin of each other.
+        """
+        instruments.startTimer("neighbour_rebuild")
+        cells, neighbours, translations = self.candidates.getPairArrays()
+        r = locations[cells] - locations[neighbours] - translations
+        in_range = ((r * r).sum(axis=1) <= (self.radius + self.skin) ** 2)
+
+        self.topology = NeighbourTopology(
+                (cells[in_range], neighbours[in_range], translations[in_range]),
+                self.num_cells)
+        self.built_locations = locations.copy()
+        self.num_builds += 1
+        instruments.count("neighbour_rebuilds")
+        instruments.stopTimer("neighbour_rebuild")
+
+    def getNeighbours(self, flat_index):
+        """
+        Returns the neighbours of the cell with the given flat index as a tuple
+        of (neighbour flat indices, neighbour location translations).
+        """
+        return self.topology.getNeighbours(flat_index)
+
+    def getPairArrays(self):
+        """
+        Returns all of the pairs in the list, in the format returned by
+        lcs.getNeighbourPairArrays.
+        """
+        return self.topology.getPairArrays()
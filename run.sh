@@ -3,8 +3,12 @@
 export PYTHONPATH=`pwd`:$PYTHONPATH
 export LD_LIBRARY_PATH=`pwd`/cpp/potentials:$LD_LIBRARY_PATH
 
-( (python -u main.py $* 2>&1 | tee run.log) &&
-  (cd runs/`ls -t runs | head -1`/output && ls -1 *.xyz | sort > lqs.list) )
+python -u main.py $* 2>&1 | tee run.log
 
 cp run.log runs/`ls -t runs | head -1`/run.log
 echo && echo "Data saved in: runs/`ls -t runs | head -1`"
+
+# The states of the run are kept in binary trajectories. To export them to
+# Aviz XYZ files (and the lqs.list of them), which ./aviz.sh does on demand:
+#   python statistics/export_aviz.py runs/<run> &&
+#     (cd runs/<run>/output && ls -1 *.xyz | sort > lqs.list)
@@ -0,0 +1,28 @@
+import glob
+import os
+import sys
+
+from lc_trajectory import LiquidCrystalSystemTrajectory
+
+run_dir = sys.argv[1]
+if not os.path.exists(run_dir):
+  print "Invalid run directory: '%s'" % run_dir
+  sys.exit(1)
+
+model_file = glob.glob("%s/*.py" % run_dir)[0]
+parameters = {}
+exec file(model_file, "r") in parameters
+
+# Export the Aviz XYZ files from the trajectories of the heating and cooling
+# phases.
+for output_path_parameter in ["MC_HEATER_AVIZ_OUTPUT_PATH",
+                              "MC_COOLER_AVIZ_OUTPUT_PATH"]:
+  output_file_prefix = "%s/%s" % (run_dir, parameters[output_path_parameter])
+  trajectory = LiquidCrystalSystemTrajectory(
+      "%strajectory.dat" % output_file_prefix)
+  if not trajectory.exists():
+    continue
+
+  for output_file in trajectory.exportAvizFiles(output_file_prefix,
+                                                parameters):
+    print "Exported Aviz file: '%s'" % output_file
@@ -1,6 +1,12 @@
 import glob
 import os
 
+import numpy
+
+from lc_run_manifest import LiquidCrystalRunManifest
+from lc_trajectory import LiquidCrystalSystemTrajectory
+from statistics.results_store import RunResultsStore
+
 class StatisticsGenerator:
     """
     Generates all necessary statistics for displaying the motion chart of
@@ -19,6 +25,9 @@ class StatisticsGenerator:
         Returns a dictionary by model of lists of tuples for each event in the
         run, and a dictionary by model of lists of image files to display the
         actual run.
+        The events of each run are read from its results store (see
+        RunResultsStore), so they are only extracted from the outputs of the
+        run once it is complete (or each time until then).
         If generate_images is True, also uses AVIZ to create PNG files for the
         model itself, and links it in.
         """
@@ -33,83 +42,72 @@ class StatisticsGenerator:
         all_data = {}
         viz_data = {}
         for current_run in runs:
-            states_dir = "%s/states" % current_run
-
-            # If we only want complete runs, make sure the run completed.
-            if only_complete:
-                has_current = os.path.exists("%s/current.dat" % states_dir)
-                has_final = os.path.exists("%s/final.dat" % states_dir)
-                has_cooled = os.path.exists("%s/cooled.dat" % states_dir)
-                is_complete = (has_current and has_final) or \
-                              (has_cooled and has_final)
-                if not is_complete:
-                    print "Skipped '%s' because it is not complete." % (
-                            current_run,)
-                    continue
-
-            # Extract the model name, and gather any model specific parameters.
-            model = os.path.basename(current_run)
-            model_file = glob.glob("%s/*.py" % current_run)
-            if not model_file:
-                print "Skipped '%s' because it had no model file." % (
-                        current_run,)
+            results = self.getRunResults(current_run, only_complete)
+            if results is None:
                 continue
-            model_file = model_file[0]
-            
-            # Get the parameters from the model file.
-            model = os.path.basename(model_file)[:-3]
-            parameters = {}
-            exec file(model_file, "r") in parameters
-
-            # Gather model specific parameters.
-            num_directors = reduce(lambda a,b: a*b,
-                                   parameters["DIMENSIONS"],
-                                   1)
-            potential = str(parameters["TWO_SPIN_POTENTIAL"]).split(".")[-1]
-            potential_approx = str(parameters["POTENTIAL"]).split(".")[-1]
-
-            # Get the heating and cooling events.
-            heating_events = self._getEvents(
-                    current_run, parameters["MC_HEATER_AVIZ_OUTPUT_PATH"])
-            cooling_events = self._getEvents(
-                    current_run, parameters["MC_COOLER_AVIZ_OUTPUT_PATH"])
+            model = results["model"]
 
             # Create the images with AVIZ if necessary for both heating and
             # cooling processes.
             if generate_images:
-                self._generateImages(model, current_run,
+                parameters = self._readModelParameters(current_run)
+                self._generateImages(model, current_run, parameters,
                                      parameters["MC_HEATER_AVIZ_OUTPUT_PATH"])
-                self._generateImages(model, current_run,
+                self._generateImages(model, current_run, parameters,
                                      parameters["MC_COOLER_AVIZ_OUTPUT_PATH"])
 
-            # Create the event list for this model.
-            event_list = []
-            image_list = []
-            for (index, event) in enumerate(heating_events + cooling_events):
-                process = "Cooling"
-                if index < len(heating_events):
-                    process = "Heating"
-
-                event_list.append((
-                    event[1], # Temperature
-                    event[2], # Energy
-                    event[3], # Director Variance
-                    event[4], # Average Director Distance from Original
-                    num_directors,
-                    potential,
-                    potential_approx,
-                    process,
-                    event[5], # Time Used
-                ))
-
-                image_list.append("%s/%s/%s.png" %
-                                  (self.web_image_dir, model, event[0]))
-
-            all_data[model] = event_list
-            viz_data[model] = image_list
+            # Create the event list for this model from the columns of its
+            # results.
+            num_events = len(results["name"])
+            all_data[model] = zip(
+                    results["temperature"].tolist(),
+                    results["energy"].tolist(),
+                    results["director_variance"].tolist(),
+                    results["avg_director_dist"].tolist(),
+                    [results["num_directors"]] * num_events,
+                    [results["potential"]] * num_events,
+                    [results["potential_approx"]] * num_events,
+                    results["process"].tolist(),
+                    results["time"].tolist())
+            viz_data[model] = ["%s/%s/%s.png" % (self.web_image_dir, model,
+                                                 name)
+                               for name in results["name"].tolist()]
 
         return (all_data, viz_data)
 
+    def getRunResults(self, current_run, only_complete=True):
+        """
+        Returns the results of the given run (in the format returned by
+        RunResultsStore.load), from its results store, or extracted from its
+        outputs and stored if they were not stored yet. If the run was not
+        complete when they were stored, only the events that it added since
+        are extracted.
+        Returns None if the run was skipped, because it is not complete (if
+        only_complete is True) or has no model file.
+        """
+        store = RunResultsStore(current_run)
+        results = store.load()
+        if results is not None and results["complete"]:
+            return results
+
+        # If we only want complete runs, make sure the run completed.
+        is_complete = self._isRunComplete(current_run)
+        if only_complete and not is_complete:
+            print "Skipped '%s' because it is not complete." % (current_run,)
+            return None
+
+        # Get the parameters from the model file.
+        parameters = self._readModelParameters(current_run)
+        if parameters is None:
+            print "Skipped '%s' because it had no model file." % (
+                    current_run,)
+            return None
+
+        results = self._extractRunResults(current_run, parameters, results)
+        results["complete"] = is_complete
+        store.save(results)
+        return results
+
     def getMatchingRuns(self, runs_pattern):
         """
         Returns all runs that match the given runs_pattern textually.
@@ -117,45 +115,149 @@ class StatisticsGenerator:
         """
         return glob.glob("%s/*%s*" % (self.runs_dir, runs_pattern))
 
-    def _getEvents(self, current_run, output_file_prefix):
+    def _isRunComplete(self, current_run):
         """
-        Parses the output files for the given run, with the given prefix, and
-        returns a list of tuples of the information within them.
+        Returns true if the given run is complete, as recorded in its manifest,
+        or for older runs without one, when it has its final states.
         """
-        # Get all of the output files, and the event info lines in the info
-        # file that accompanies them.
-        output_files = glob.glob("%s/%s*.xyz" % (current_run,
-                                                 output_file_prefix))
+        manifest = LiquidCrystalRunManifest({"RUN_DIR": current_run})
+        if manifest.exists():
+            return manifest.isComplete()
+
+        states_dir = "%s/states" % current_run
+        has_current = os.path.exists("%s/current.dat" % states_dir)
+        has_final = os.path.exists("%s/final.dat" % states_dir)
+        has_cooled = os.path.exists("%s/cooled.dat" % states_dir)
+        return (has_current and has_final) or (has_cooled and has_final)
+
+    def _readModelParameters(self, current_run):
+        """
+        Returns the parameters of the model file of the given run (with the
+        name of the model in MODEL), or None if it has no model file.
+        """
+        model_file = glob.glob("%s/*.py" % current_run)
+        if not model_file:
+            return None
+        model_file = model_file[0]
+
+        parameters = {}
+        exec file(model_file, "r") in parameters
+        parameters["MODEL"] = os.path.basename(model_file)[:-3]
+        return parameters
+
+    def _extractRunResults(self, current_run, parameters,
+                           previous_results=None):
+        """
+        Extracts the results of the given run, with the given model
+        parameters, from its outputs (in the format returned by
+        RunResultsStore.load, without the complete flag).
+        If the previous results of the run are given, their events are kept,
+        and only the events after them are extracted.
+        """
+        # Gather model specific parameters.
+        num_directors = reduce(lambda a,b: a*b,
+                               parameters["DIMENSIONS"],
+                               1)
+        potential = str(parameters["TWO_SPIN_POTENTIAL"]).split(".")[-1]
+        potential_approx = str(parameters["POTENTIAL"]).split(".")[-1]
+
+        # Get the heating and cooling events, after the previous ones.
+        previous_events = []
+        if previous_results is not None:
+            previous_events = zip(
+                    previous_results["process"].tolist(),
+                    zip(previous_results["name"].tolist(),
+                        previous_results["temperature"].tolist(),
+                        previous_results["energy"].tolist(),
+                        previous_results["director_variance"].tolist(),
+                        previous_results["avg_director_dist"].tolist(),
+                        previous_results["time"].tolist()))
+        events = []
+        processes = []
+        positions = {}
+        for (process, output_path_parameter) in [
+                ("Heating", "MC_HEATER_AVIZ_OUTPUT_PATH"),
+                ("Cooling", "MC_COOLER_AVIZ_OUTPUT_PATH")]:
+            process_events = [event
+                              for (event_process, event) in previous_events
+                              if event_process == process]
+            position = (0, 0, None)
+            if previous_results is not None:
+                position = previous_results["positions"][process]
+            new_events, positions[process] = self._getEvents(
+                    current_run, parameters[output_path_parameter], position)
+            process_events += new_events
+            events += process_events
+            processes += [process] * len(process_events)
+
+        return {
+            "model": parameters["MODEL"],
+            "num_directors": num_directors,
+            "potential": potential,
+            "potential_approx": potential_approx,
+            "name": numpy.array([event[0] for event in events]),
+            "process": numpy.array(processes),
+            "temperature": numpy.array([event[1] for event in events]),
+            "energy": numpy.array([event[2] for event in events]),
+            "director_variance": numpy.array([event[3] for event in events]),
+            "avg_director_dist": numpy.array([event[4] for event in events]),
+            "time": numpy.array([event[5] for event in events]),
+            "positions": positions,
+        }
+
+    def _getEvents(self, current_run, output_file_prefix,
+                   position=(0, 0, None)):
+        """
+        Parses the output files for the given run, with the given prefix, from
+        the given position (see RunResultsStore.PHASE_POSITIONS), and returns
+        a tuple of a list of tuples of the information within them, and the
+        position after them.
+        """
+        # Get the names and times of all of the output frames, and the event
+        # info lines in the info file that accompanies them (after the lines
+        # that were already read).
+        output_frames = self._getOutputFrames(current_run, output_file_prefix)
         info_files = glob.glob("%s/%sinfo.txt" % (current_run,
                                                   output_file_prefix))
-        if not output_files or not info_files:
-            print "No '%s??????.xyz' output files for '%s'." % (
+        if not output_frames or not info_files:
+            print "No '%s' output frames for '%s'." % (
                     output_file_prefix, current_run)
-            return []
-        event_infos = file(info_files[0], "r").readlines()
-        if len(event_infos) != len(output_files):
+            return ([], position)
+        num_lines, offset, start_time = position
+        info_file = file(info_files[0], "rb")
+        try:
+            info_file.seek(offset)
+            event_infos = info_file.readlines()
+        finally:
+            info_file.close()
+
+        # A line that was not completely written yet is read the next time.
+        if event_infos and not event_infos[-1].endswith("\n"):
+            event_infos.pop()
+        if num_lines + len(event_infos) != len(output_frames):
             print ("Number of events in '%sinfo.txt' is different than the " +
-                   "number of output files for '%s'.") % (output_file_prefix,
-                                                          current_run)
-            return []
+                   "number of output frames for '%s'.") % (output_file_prefix,
+                                                           current_run)
+            return ([], position)
 
         # If the first field is surrounded by [] brackets, then it indicates
-        # time and we should use that instead of the file timestamp.
-        output_files.sort()
-        start_time = os.path.getmtime(output_files[0])
-        first_event_field = event_infos[0].strip().split("\t")[0]
-        if first_event_field[0] == "[" and first_event_field[-1] == "]":
-          start_time = float(first_event_field[1:-1])
+        # time and we should use that instead of the frame time.
+        if num_lines == 0:
+            start_time = output_frames[0][1]
+            first_event_field = event_infos[0].strip().split("\t")[0]
+            if first_event_field[0] == "[" and first_event_field[-1] == "]":
+              start_time = float(first_event_field[1:-1])
 
-        # Go over all of the events and fill in the information to return.
+        # Go over all of the events (except for the first line, which is the
+        # initial state) and fill in the information to return.
         events = []
-        for i in range(1, len(event_infos)):
+        for i in range(max(num_lines, 1), num_lines + len(event_infos)):
             # Get the event time.
-            output_file = output_files[i]
-            current_time = os.path.getmtime(output_file) - start_time
+            output_name, output_time = output_frames[i]
+            current_time = output_time - start_time
 
             # Get the event information from the info file.
-            event_info = event_infos[i].strip()
+            event_info = event_infos[i - num_lines].strip()
             event_info_fields = event_info.split("\t")
 
             # If the first field is surrounded by [] brackets, then it indicates
@@ -166,7 +268,6 @@ class StatisticsGenerator:
                 event_info_fields.pop(0)
 
             # Get all the fields.
-            output_filename = os.path.basename(output_file)[:-4]
             temperature = float(event_info_fields[0])
             energy = float(event_info_fields[1])
             distance = 0.0
@@ -178,20 +279,54 @@ class StatisticsGenerator:
 
             # Add to the events.
             events.append((
-                output_filename,
+                output_name,
                 temperature,
                 energy,
                 variance,
                 distance,
                 current_time))
 
-        return events
+        position = (num_lines + len(event_infos),
+                    offset + sum([len(line) for line in event_infos]),
+                    start_time)
+        return (events, position)
 
-    def _generateImages(self, model, current_run, output_file_prefix):
+    def _getOutputFrames(self, current_run, output_file_prefix):
+        """
+        Returns a list of tuples of the name and time of each of the output
+        frames of the given run, with the given prefix, in order.
+        The frames are read from the index of the trajectory file, or for older
+        runs from the Aviz XYZ files (whose modification time is used).
+        """
+        trajectory = LiquidCrystalSystemTrajectory(
+                "%s/%strajectory.dat" % (current_run, output_file_prefix))
+        if trajectory.exists():
+            output_name_prefix = os.path.basename(output_file_prefix)
+            return [("%s%08d" % (output_name_prefix, frame["frame_number"]),
+                     float(frame["time"]))
+                    for frame in trajectory.getFrames()]
+
+        output_files = glob.glob("%s/%s*.xyz" % (current_run,
+                                                 output_file_prefix))
+        output_files.sort()
+        return [(os.path.basename(output_file)[:-4],
+                 os.path.getmtime(output_file))
+                for output_file in output_files]
+
+    def _generateImages(self, model, current_run, parameters,
+                        output_file_prefix):
         """
         Generates the PNG files using AVIZ for the given run directory and the
         given output file prefixes and the name of the model.
+        If the run has a trajectory file, the Aviz XYZ files are exported from
+        it first with the given model parameters.
         """
+        trajectory = LiquidCrystalSystemTrajectory(
+                "%s/%strajectory.dat" % (current_run, output_file_prefix))
+        if trajectory.exists():
+            trajectory.exportAvizFiles(
+                    "%s/%s" % (current_run, output_file_prefix), parameters)
+
         # Determine where the script is.
         generate_script_path = "./generate_model.sh"
         if not os.path.exists(generate_script_path):
@@ -0,0 +1,93 @@
+import os
+
+import numpy
+
+class RunResultsStore:
+    """
+    Stores the results of a run, the events of its heating and cooling phases
+    (one for each state the run output), in a NumPy .npz file in the run
+    directory, so they are extracted from the outputs of the run (its model
+    file, info files and output frames) only once.
+    The events are held in columns (see EVENT_COLUMNS), one array each, along
+    with the values that are the same for the whole run (see RUN_FIELDS), and
+    the position up to which the outputs of each phase were read (see
+    PHASE_POSITIONS).
+    The results of a run are stored again while it is not complete, so they
+    are updated with the events it added as it continues until it finishes.
+    """
+    RESULTS_FILENAME = "results.npz"
+    RESULTS_VERSION = 2
+    EVENT_COLUMNS = ["name", "process", "temperature", "energy",
+                     "director_variance", "avg_director_dist", "time"]
+    RUN_FIELDS = ["model", "num_directors", "potential", "potential_approx",
+                  "complete"]
+    # The position of each of the phases (by its process), as a tuple of the
+    # number of info lines read, the offset in the info file after them, and
+    # the start time of the phase (or None before the first line is read).
+    PHASE_POSITIONS = ["Heating", "Cooling"]
+
+    def __init__(self, run_dir):
+        self.path = os.path.join(run_dir, self.RESULTS_FILENAME)
+
+    def load(self):
+        """
+        Loads the results of the run, as a dictionary of each of the
+        EVENT_COLUMNS to its array, each of the RUN_FIELDS to its value and
+        "positions" to a dictionary of each of the PHASE_POSITIONS to its
+        position, or returns None if they were not stored yet (or were stored
+        by another version).
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        results_file = numpy.load(self.path)
+        try:
+            if int(results_file["version"]) != self.RESULTS_VERSION:
+                return None
+            results = {
+                "model": str(results_file["model"]),
+                "num_directors": int(results_file["num_directors"]),
+                "potential": str(results_file["potential"]),
+                "potential_approx": str(results_file["potential_approx"]),
+                "complete": bool(results_file["complete"]),
+            }
+            for column in self.EVENT_COLUMNS:
+                results[column] = results_file[column]
+            results["positions"] = {}
+            for (process, (num_lines, offset, start_time)) in zip(
+                    self.PHASE_POSITIONS, results_file["positions"].tolist()):
+                if numpy.isnan(start_time):
+                    start_time = None
+                results["positions"][process] = (int(num_lines), int(offset),
+                                                  start_time)
+            return results
+        finally:
+            results_file.close()
+
+    def save(self, results):
+        """
+        Saves the given results of the run (in the format returned by load),
+        writing them to a temporary file and moving it into place.
+        """
+        arrays = {"version": numpy.array(self.RESULTS_VERSION)}
+        for field in self.RUN_FIELDS:
+            arrays[field] = numpy.array(results[field])
+        for column in self.EVENT_COLUMNS:
+            arrays[column] = numpy.asarray(results[column])
+        positions = []
+        for process in self.PHASE_POSITIONS:
+            num_lines, offset, start_time = results["positions"][process]
+            if start_time is None:
+                start_time = numpy.nan
+            positions.append((num_lines, offset, start_time))
+        arrays["positions"] = numpy.array(positions, dtype=float)
+
+        temp_path = "%s.%s.tmp" % (self.path, os.getpid())
+        results_file = file(temp_path, "wb")
+        try:
+            numpy.savez(results_file, **arrays)
+        finally:
+            results_file.close()
+        if os.name == "nt" and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
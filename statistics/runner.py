@@ -1,8 +1,18 @@
 import sys
 import re
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
 from statistics.generator import *
 
+# The fields of each event tuple returned by StatisticsGenerator.generate.
+EVENT_FIELDS = ["temperature", "energy", "director_variance",
+                "avg_director_dist", "num_directors", "potential",
+                "potential_approx", "process", "time_used"]
+
 def writeResultsToHtmlFile(filename, all_data, viz_data):
     js_code = ""
     try:
@@ -13,55 +23,24 @@ def writeResultsToHtmlFile(filename, all_data, viz_data):
         except:
             return
 
-    num_models_out = len(all_data)
-    all_data_out = "{\n"
-    viz_data_out = "{\n"
+    # The data is written as JSON, which the script reads as object literals.
+    # The time of each event (the x axis of the charts) is its index.
+    all_data_out = {}
+    viz_data_out = {}
     for (model, event_infos) in all_data.items():
-        viz_data_images = viz_data[model]
-
-        all_data_out += (
-"""          '%s': {
-""" % model)
-        viz_data_out += (
-"""          '%s': {
-""" % model)
-
-        for event_index, event_info in enumerate(event_infos):
-            all_data_out += (
-"""            %d: { 'time': %s,
-                     'temperature': %s,
-                     'energy': %s,
-                     'director_variance': %s,
-                     'avg_director_dist': %s,
-                     'num_directors': %s,
-                     'potential': '%s',
-                     'potential_approx': '%s',
-                     'process': '%s',
-                     'time_used': %d },
-""" % ((event_index, event_index) + event_info))
-            viz_data_out += (
-"""            %d: { 'file': '%s' },
-""" % (event_index, viz_data_images[event_index]))
-
-        all_data_out += (
-"""          },
-""")
-        viz_data_out += (
-"""          },
-""")
-
-    all_data_out += (
-"""        };
-""")
-    viz_data_out += (
-"""        };
-""")
+        all_data_out[model] = [dict(zip(EVENT_FIELDS, event_info))
+                               for event_info in event_infos]
+        for (event_index, event_info) in enumerate(all_data_out[model]):
+            event_info["time"] = event_index
+            event_info["time_used"] = int(event_info["time_used"])
+        viz_data_out[model] = [{"file": image_file}
+                               for image_file in viz_data[model]]
 
     f = open(filename, "w");
     f.write(js_code % {
-        "num_models": str(num_models_out),
-        "all_data": str(all_data_out),
-        "viz_data": str(viz_data_out),
+        "num_models": str(len(all_data)),
+        "all_data": json.dumps(all_data_out, indent=2, sort_keys=True),
+        "viz_data": json.dumps(viz_data_out, indent=2, sort_keys=True),
     })
     f.flush()
     f.close()
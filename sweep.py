@@ -0,0 +1,252 @@
+import glob
+import os
+import re
+import sys
+import time
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+import main
+
+def printUsage():
+    print "Usage: ./sweep.sh <model> [PARAMETER OVERRIDES]"
+    print
+    print "Command line arguments:"
+    print "  model        - The name of a model in the models directory (without the .py suffix)"
+    print "                 whose SWEEP_PARAMETERS define the parameter grid to run."
+    print
+    print "Parameter overrides:"
+    print "  Any parameter from the model file can be overriden at the command line, for all"
+    print "  of the runs, including the grid itself. For example:"
+    print "    ./sweep.sh 3d_small \"SWEEP_PARAMETERS={'KAPPA': [2.0, 3.0, 4.0]}\""
+    print "    This will run the 3d_small model once for each of the values of KAPPA."
+    print
+    print "  SWEEP_NUM_PROCESSES=<n> sets the number of runs to perform at once (by default"
+    print "  one per CPU)."
+    print
+    print "Each run of the grid has a run directory of its own, which is resumed if the sweep"
+    print "is restarted before it completed, and skipped if it completed."
+    print
+    print "-h or --help will display this usage."
+
+def parseCommandLineArgs(args):
+    """
+    Parses the command line arguments, returning the model and the list of
+    parameter overrides.
+    """
+    args = args[1:]
+
+    # If we have '-h' or '--help', display usage and exit.
+    if "-h" in args or "--help" in args or not args:
+        raise RuntimeError()
+
+    return (args[0], args[1:])
+
+def readSweepParameters(model, overrides):
+    """
+    Reads the parameter file for the given model and applies the given
+    parameter overrides to it, returning the parameters dictionary.
+    """
+    parameters = main.readParametersFromFile(model)
+    parameters["MODEL"] = model
+    parameters["PROFILE"] = False
+    for override in overrides:
+        try:
+            exec override in parameters
+        except:
+            raise RuntimeError("Invalid Parameter: '%s'" % override)
+    return parameters
+
+def getSweepPoints(sweep_parameters):
+    """
+    Returns a list of all of the points of the grid of the given sweep
+    parameters (a dictionary of each parameter to its list of values), as lists
+    of (parameter, value) tuples sorted by the parameter names.
+    """
+    points = [[]]
+    names = sweep_parameters.keys()
+    names.sort()
+    for name in names:
+        points = [point + [(name, value)]
+                  for point in points
+                  for value in sweep_parameters[name]]
+    return points
+
+def getSweepPointTag(point):
+    """
+    Returns a tag for the given grid point, to name its run directory by.
+    Values that are too long for a name (such as temperature schedules) are
+    replaced by a hash of them.
+    """
+    tags = []
+    for (name, value) in point:
+        value_tag = getParameterCode(value)
+        value_tag = re.sub(r"[^0-9A-Za-z.\-]+", "x", value_tag).strip("x")
+        if len(value_tag) > 16:
+            value_tag = md5(getParameterCode(value)).hexdigest()[:8]
+        tags.append("%s-%s" % (name, value_tag))
+    return "_".join(tags)
+
+def getParameterCode(value):
+    """
+    Returns the Python code of the given parameter value, as written in a model
+    file (classes, such as potentials, are referred to by their name).
+    """
+    if hasattr(value, "__name__"):
+        return value.__name__
+    return repr(value)
+
+def getSweepRunDir(model, point):
+    """
+    Returns the run directory of the given grid point of the model, where
+    the latest previous one is taken if there is one (so it is resumed if it
+    is not complete), and otherwise a new one.
+    """
+    previous_run_dirs = glob.glob("runs/*_%s_%s" % (model,
+                                                    getSweepPointTag(point)))
+    if previous_run_dirs:
+        previous_run_dirs.sort(reverse=True)
+        return previous_run_dirs[0]
+
+    current_time = time.gmtime()
+    return "runs/%04d%02d%02d_%02d%02d%02d_%s_%s" % (
+            current_time.tm_year, current_time.tm_mon, current_time.tm_mday,
+            current_time.tm_hour, current_time.tm_min, current_time.tm_sec,
+            model, getSweepPointTag(point))
+
+def runSweepPoint(job):
+    """
+    Performs the run of a single grid point, given as a tuple of (model,
+    parameter overrides, grid point, run directory), with its output written
+    to the run.log file in the run directory.
+    Returns the given job along with the time the run took, or the error it
+    failed with.
+    """
+    model, overrides, point, run_dir = job
+    start_time = time.time()
+
+    # Create the run directory with a copy of the model file that includes the
+    # overrides and the grid point, so that its parameters can be read from it.
+    if not os.path.isdir(run_dir):
+        os.makedirs(run_dir)
+        model_file = file(os.path.join(run_dir, "%s.py" % model), "w")
+        model_file.write(file("models/%s.py" % model, "r").read())
+        model_file.write("\n# Sweep parameters.\n")
+        for override in overrides:
+            model_file.write("%s\n" % override)
+        for (name, value) in point:
+            model_file.write("%s = %s\n" % (name, getParameterCode(value)))
+        model_file.close()
+
+    # Write all of the output of the run to its log.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    stdout_fd = os.dup(sys.stdout.fileno())
+    stderr_fd = os.dup(sys.stderr.fileno())
+    log_fd = os.open(os.path.join(run_dir, "run.log"),
+                     os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    os.dup2(log_fd, sys.stdout.fileno())
+    os.dup2(log_fd, sys.stderr.fileno())
+    os.close(log_fd)
+
+    error = None
+    try:
+        try:
+            parameters = readSweepParameters(model, overrides)
+            for (name, value) in point:
+                parameters[name] = value
+            parameters["RUN_DIR"] = run_dir
+
+            # The runs themselves are already run in parallel, so the
+            # algorithms must not create processes of their own.
+            parameters["MC_HEATER_NUM_PROCESSES"] = 1
+            parameters["MC_COOLER_NUM_PROCESSES"] = 1
+
+            main.main(parameters)
+        except Exception, e:
+            error = "%s: %s" % (e.__class__.__name__, e)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(stdout_fd, sys.stdout.fileno())
+        os.dup2(stderr_fd, sys.stderr.fileno())
+        os.close(stdout_fd)
+        os.close(stderr_fd)
+
+    if error:
+        return (job, None, error)
+    return (job, time.time() - start_time, None)
+
+def sweep(model, overrides):
+    """
+    Runs all of the points of the parameter grid of the given model (with the
+    given parameter overrides) in a pool of processes, skipping the ones whose
+    runs already completed.
+    """
+    parameters = readSweepParameters(model, overrides)
+    SWEEP_PARAMETERS = dict(parameters.get("SWEEP_PARAMETERS", {}))
+    SWEEP_NUM_PROCESSES = parameters.get("SWEEP_NUM_PROCESSES", None)
+
+    points = getSweepPoints(SWEEP_PARAMETERS)
+    print "Sweeping %s runs of model '%s' over: %s" % (
+            len(points), model, ", ".join(SWEEP_PARAMETERS.keys()))
+
+    # Find the run directory of each of the points, and skip the completed
+    # ones.
+    jobs = []
+    for point in points:
+        run_dir = getSweepRunDir(model, point)
+        if os.path.isdir(run_dir):
+            run_parameters = dict(parameters)
+            run_parameters["RUN_DIR"] = run_dir
+            if main.isRunComplete(run_parameters):
+                print "Skipped '%s' because it is complete." % run_dir
+                continue
+            print "Resuming '%s'." % run_dir
+        jobs.append((model, overrides, point, run_dir))
+    print
+
+    # Perform the runs, reporting each one as it finishes.
+    pool = None
+    if multiprocessing and SWEEP_NUM_PROCESSES != 1:
+        pool = multiprocessing.Pool(SWEEP_NUM_PROCESSES)
+        results = pool.imap_unordered(runSweepPoint, jobs)
+    else:
+        results = (runSweepPoint(job) for job in jobs)
+
+    num_failed = 0
+    for (i, (job, run_time, error)) in enumerate(results):
+        run_dir = job[3]
+        if error:
+            num_failed += 1
+            print "[%s/%s] Failed '%s': %s" % (i+1, len(jobs), run_dir, error)
+        else:
+            print "[%s/%s] Finished '%s' (%.1f seconds)" % (
+                    i+1, len(jobs), run_dir, run_time)
+        sys.stdout.flush()
+
+    if pool:
+        pool.close()
+        pool.join()
+
+    print
+    print "Done (%s runs failed)." % num_failed
+
+if __name__ == "__main__":
+    try:
+        model, overrides = parseCommandLineArgs(sys.argv)
+    except RuntimeError, e:
+        print e
+        print
+        printUsage()
+        sys.exit(1)
+
+    sweep(model, overrides)
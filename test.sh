@@ -0,0 +1,5 @@
+#!/bin/bash
+
+export PYTHONPATH=`pwd`:$PYTHONPATH
+export LD_LIBRARY_PATH=`pwd`/cpp/potentials:$LD_LIBRARY_PATH
+python -m unittest discover -s tests -p "test_*.py" $*
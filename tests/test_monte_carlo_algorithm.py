@@ -0,0 +1,140 @@
+import random
+import unittest
+
+import numpy
+
+import main
+from lc import LiquidCrystalSystem
+from algorithms.monte_carlo_algorithm import MonteCarloAlgorithm
+
+# The models the algorithm is tested with.
+TEST_MODELS = ["2d_small", "3d_small"]
+
+# The seed of all of the random generators.
+TEST_SEED = 1
+
+# The seeds of the random starts the energies are tested with (which include
+# starts with overlapping spins, whose energy drops by orders of magnitude).
+TEST_SEEDS = range(1, 11)
+
+def createAlgorithm(model, overrides={}, seed=TEST_SEED):
+    """
+    Returns a Monte Carlo algorithm of the cooling phase of a new system of
+    the given model, with the given parameters overridden, started from a
+    random state of the given seed.
+    """
+    parameters = main.readParametersFromFile(model)
+    parameters["MODEL"] = model
+    parameters["MC_COOLER_RANDOM_SEED"] = seed
+    parameters.update(overrides)
+    random.seed(seed)
+    numpy.random.seed(seed)
+    lcs = LiquidCrystalSystem(parameters,
+                              float(parameters["INITIAL_TEMPERATURE"]))
+    return MonteCarloAlgorithm(lcs, None, None, parameters, "MC_COOLER_")
+
+class MonteCarloAlgorithmTestCase(unittest.TestCase):
+
+    def assertEnergiesEqual(self, E1, E2):
+        """
+        Asserts that the given energies are equal, up to the roundoff of
+        summing the energies of the pairs in a different order.
+        """
+        self.assertTrue(abs(E1 - E2) <= 1e-9 * max(abs(E1), abs(E2)),
+                        "%r != %r" % (E1, E2))
+
+class MetropolisStepTest(MonteCarloAlgorithmTestCase):
+
+    def testStepEnergy(self):
+        """
+        The potential energy the Metropolis step returns is the potential
+        energy of the system after the step, and the one it kept track of from
+        the energy differences of the accepted moves passes the debug energy
+        check, from random starts, in both sweep modes and with collective
+        moves.
+        """
+        for model in TEST_MODELS:
+            for sweep_mode in ["sequential", "sublattice"]:
+                for collective_moves in [0, 2]:
+                    for seed in TEST_SEEDS:
+                        algorithm = createAlgorithm(model, {
+                                "MC_COOLER_SWEEP_MODE": sweep_mode,
+                                "MC_COOLER_METROPOLIS_NUM_STEPS": 6,
+                                "MC_COOLER_COLLECTIVE_MOVES_PER_STEP":
+                                        collective_moves,
+                                "MC_COOLER_COLLECTIVE_MOVE_RANGE": 1,
+                                "MC_DEBUG_ENERGY_CHECKS": True}, seed)
+                        E = algorithm._performMetropolisStep()
+                        self.assertEqual(E,
+                                         algorithm.lcs.getPotentialEnergy())
+
+    def testObservablesEnergy(self):
+        """
+        The potential energy of each sample the observables accumulate is the
+        potential energy of the system after the sweep, and <U> is their mean
+        per cell, from random starts.
+        """
+        for model in TEST_MODELS:
+            for seed in TEST_SEEDS:
+                algorithm = createAlgorithm(
+                        model, {"MC_COOLER_METROPOLIS_NUM_STEPS": 6}, seed)
+                lcs = algorithm.lcs
+                observables = algorithm.observables
+                observables.start(lcs)
+
+                # Record the potential energy of the system with each sample.
+                energies = []
+                addSample = observables.addSample
+                def addRecordedSample(energy):
+                    energies.append(lcs.getPotentialEnergy())
+                    self.assertEnergiesEqual(energy, energies[-1])
+                    addSample(energy)
+                observables.addSample = addRecordedSample
+
+                algorithm._performMetropolisStep()
+                self.assertEqual(len(energies), 6)
+                self.assertEnergiesEqual(
+                        observables.getObservables()["U"],
+                        sum(energies) / len(energies) / lcs.num_cells)
+
+class CollectiveMoveTest(MonteCarloAlgorithmTestCase):
+
+    def testEnergyDifferenceOfSingleCell(self):
+        """
+        The energy difference of rotating a domain of a single cell is the
+        change in the potential energy of the system, which is twice the
+        energy difference of the cell (in which each pair is counted as half).
+        """
+        for model in TEST_MODELS:
+            algorithm = createAlgorithm(model)
+            lcs = algorithm.lcs
+            for indices in list(lcs.getSystemIndexIterator())[:5]:
+                flat_index = lcs.getFlatIndex(indices)
+                new_spin = -lcs.spins[flat_index][::-1]
+                collective_difference = \
+                        algorithm._getCollectiveEnergyDifference(
+                                [flat_index], [new_spin])
+                cell_difference = lcs.getPotentialEnergyDifferenceForSpin(
+                        indices, new_spin, lcs.locations[flat_index])
+                self.assertEnergiesEqual(collective_difference,
+                                         2.0 * cell_difference)
+
+    def testEnergyDifferenceOfDomain(self):
+        """
+        The energy difference of rotating a domain is the change in the
+        potential energy of the system.
+        """
+        for model in TEST_MODELS:
+            algorithm = createAlgorithm(
+                    model, {"MC_COOLER_COLLECTIVE_MOVE_RANGE": 1})
+            lcs = algorithm.lcs
+            domain, new_spins = algorithm.trial_moves.drawDomainRotation(lcs)
+            energy_difference = algorithm._getCollectiveEnergyDifference(
+                    domain, new_spins)
+            E = lcs.getPotentialEnergy()
+            lcs.setCellProperties(domain, new_spins, lcs.locations[domain])
+            self.assertEnergiesEqual(lcs.getPotentialEnergy() - E,
+                                     energy_difference)
+
+if __name__ == "__main__":
+    unittest.main()